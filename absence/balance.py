@@ -0,0 +1,268 @@
+import datetime as dt
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from absence import periods
+from absence.models import AbsenceBalance, EmployeeAbsence, EmployeeAbsenceType
+from constants.db import ABSENCE_ENTITLEMENT_PERIOD_CHOICE, ABSENCE_STATUS_CHOICES
+
+
+def local_naive(value):
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.replace(tzinfo=None)
+
+
+PERIOD_FREQUENCIES = {
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK: periods.WEEK_START,
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH: periods.MONTH_START,
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_YEAR: periods.YEAR_START,
+}
+
+
+PERIOD_UNITS = {
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK: 'week',
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH: 'month',
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_YEAR: 'year',
+}
+
+BALANCES_SQL = '''
+WITH absences AS (
+    SELECT a.submitted_for_id, a.absence_type_id, p.unit,
+           (a.start AT TIME ZONE %s)::date AS first_day,
+           extract(day FROM (a."end" AT TIME ZONE %s) - (a.start AT TIME ZONE %s))::int AS days
+    FROM {absence} a
+    JOIN {absence_type} t ON t.id = a.absence_type_id
+    JOIN unnest(%s::int[], %s::text[]) AS p(period, unit) ON p.period = t.period
+    WHERE a.status = %s AND a."end" > a.start AND a.id IN ({absences})
+)
+SELECT submitted_for_id, absence_type_id, date_trunc(unit, (first_day + n)::timestamp)::date, count(*)
+FROM absences, generate_series(0, days - 1) AS n
+GROUP BY 1, 2, 3
+'''
+
+
+def get_period_start(value, period):
+    if period not in PERIOD_FREQUENCIES:
+        return None
+    if isinstance(value, dt.datetime):
+        value = local_naive(value).date()
+    return periods.roll_back(value, PERIOD_FREQUENCIES[period])
+
+
+def get_next_period_start(period_start, period):
+    if period not in PERIOD_FREQUENCIES:
+        return None
+    return periods.next_offset(period_start, PERIOD_FREQUENCIES[period])
+
+
+def get_absence_periods(start, end, period):
+    """
+    List of (period start, days) for every entitlement period the interval touches.
+    The whole days of the interval are counted once and split on their dates, an absence
+    that does not start at midnight keeps all of its days when it crosses a boundary.
+    """
+    if start is None or end is None or get_period_start(start, period) is None:
+        return []
+
+    start, end = local_naive(start), local_naive(end)
+    if end <= start:
+        return []
+
+    first_day = start.date()
+    last_day = first_day + dt.timedelta(days=(end - start).days)
+
+    boundaries = [get_period_start(start, period)]
+    boundaries += periods.iter_date_range(boundaries[0] + dt.timedelta(days=1), end.date(), PERIOD_FREQUENCIES[period])
+    boundaries.append(get_next_period_start(boundaries[-1], period))
+
+    absence_periods = []
+    for period_start, next_period_start in zip(boundaries[:-1], boundaries[1:]):
+        if dt.datetime.combine(period_start, dt.time()) >= end:
+            break
+        days = (min(last_day, next_period_start) - max(first_day, period_start)).days
+        absence_periods.append((period_start, max(days, 0)))
+    return absence_periods
+
+
+def get_absence_balance_deltas(absences, sign, deltas=None):
+    deltas = defaultdict(int) if deltas is None else deltas
+
+    for absence in absences:
+        if absence is None or absence.status != ABSENCE_STATUS_CHOICES.APPROVED:
+            continue
+
+        for period_start, days in get_absence_periods(absence.start, absence.end, absence.absence_type.period):
+            key = (absence.company_id, absence.submitted_for_id, absence.absence_type_id, period_start)
+            deltas[key] += sign * days
+    return deltas
+
+
+@transaction.atomic
+def apply_absence_balance_deltas(deltas):
+    deltas = {key: days for key, days in deltas.items() if days != 0}
+    if not deltas:
+        return
+
+    qs = AbsenceBalance.objects.select_for_update().filter(
+        employee_id__in={employee_id for _c, employee_id, _t, _p in deltas},
+        absence_type_id__in={absence_type_id for _c, _e, absence_type_id, _p in deltas},
+        period_start__in={period_start for _c, _e, _t, period_start in deltas},
+    )
+    existing = {(b.employee_id, b.absence_type_id, b.period_start): b for b in qs}
+
+    updated, created = [], []
+    for (company_id, employee_id, absence_type_id, period_start), days in deltas.items():
+        balance = existing.get((employee_id, absence_type_id, period_start))
+        if balance is None:
+            created.append(AbsenceBalance(company_id=company_id, employee_id=employee_id,
+                                          absence_type_id=absence_type_id, period_start=period_start,
+                                          consumed=days))
+        else:
+            balance.consumed += days
+            updated.append(balance)
+
+    AbsenceBalance.objects.bulk_update(updated, ['consumed'], batch_size=1000)
+    AbsenceBalance.objects.bulk_create(created, batch_size=1000)
+
+
+def update_absence_balance(absence, sign):
+    apply_absence_balance_deltas(get_absence_balance_deltas([absence], sign))
+
+
+def remove_absence_from_balance(absence):
+    update_absence_balance(absence, -1)
+
+
+def get_stored_absence(absence):
+    if absence._state.adding:
+        return None
+    return EmployeeAbsence.objects.filter(pk=absence.pk).first()
+
+
+def is_same_balance_state(absence, other):
+    fields = ('status', 'start', 'end', 'absence_type_id', 'submitted_for_id')
+    return other is not None and all(getattr(absence, f) == getattr(other, f) for f in fields)
+
+
+def sync_absence_balance(absence, stored):
+    if is_same_balance_state(absence, stored):
+        return
+    deltas = get_absence_balance_deltas([stored], -1)
+    apply_absence_balance_deltas(get_absence_balance_deltas([absence], 1, deltas))
+
+
+def get_absence_balances(employee, absence_type, period_starts):
+    qs = AbsenceBalance.objects.filter(employee=employee, absence_type=absence_type, period_start__in=period_starts)
+    return dict(qs.values_list('period_start', 'consumed'))
+
+
+def get_absence_balance(employee, absence_type, period_start):
+    return get_absence_balances(employee, absence_type, [period_start]).get(period_start, 0)
+
+
+def get_current_balances_filter(now):
+    q = Q()
+    for period in PERIOD_FREQUENCIES:
+        q = q | Q(absence_type__period=period, period_start=get_period_start(now, period))
+    return q
+
+
+def get_employee_balances(employees, absence_types, now=None):
+    """Already taken and remaining allowance of every employee for every absence type in its current period."""
+    now = now or timezone.now()
+    absence_types = list(absence_types)
+    employee_ids = list(employees.values_list('id', flat=True))
+
+    qs = AbsenceBalance.objects.filter(get_current_balances_filter(now),
+                                       employee_id__in=employee_ids,
+                                       absence_type__in=absence_types)
+    consumed = {(employee_id, absence_type_id): c
+                for employee_id, absence_type_id, c in qs.values_list('employee_id', 'absence_type_id', 'consumed')}
+
+    balances = []
+    for employee_id in employee_ids:
+        for absence_type in absence_types:
+            already_taken = consumed.get((employee_id, absence_type.id), 0)
+            balances.append(dict(employee=employee_id,
+                                 absence_type=absence_type.id,
+                                 period_start=get_period_start(now, absence_type.period),
+                                 already_taken=already_taken,
+                                 current_allowance=absence_type.entitlement - already_taken))
+    return balances
+
+
+def compute_absence_balances(absences):
+    """
+    Days consumed by the approved absences per employee, absence type and period start. The whole
+    days are expanded from the local start date with generate_series and counted per period in
+    Postgres, the same split as get_absence_periods().
+    """
+    subquery, subquery_params = absences.values('id').query.sql_with_params()
+    sql = BALANCES_SQL.format(absence=EmployeeAbsence._meta.db_table,
+                              absence_type=EmployeeAbsenceType._meta.db_table,
+                              absences=subquery)
+
+    timezone_name = timezone.get_current_timezone_name()
+    params = [timezone_name] * 3 + [list(PERIOD_UNITS), list(PERIOD_UNITS.values()), ABSENCE_STATUS_CHOICES.APPROVED]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + list(subquery_params))
+        rows = cursor.fetchall()
+
+    return {(employee_id, absence_type_id, period_start): consumed
+            for employee_id, absence_type_id, period_start, consumed in rows}
+
+
+def compute_company_balances(company):
+    return compute_absence_balances(EmployeeAbsence.objects.filter(company=company))
+
+
+def create_balances(company_id, balances):
+    AbsenceBalance.objects.bulk_create([
+        AbsenceBalance(company_id=company_id, employee_id=employee_id, absence_type_id=absence_type_id,
+                       period_start=period_start, consumed=consumed)
+        for (employee_id, absence_type_id, period_start), consumed in balances.items()
+    ], batch_size=1000)
+
+
+@transaction.atomic
+def rebuild_company_balances(company):
+    balances = compute_company_balances(company)
+
+    AbsenceBalance.objects.filter(company=company).delete()
+    create_balances(company.pk, balances)
+    return len(balances)
+
+
+@transaction.atomic
+def rebuild_absence_type_balances(absence_type):
+    """The rows of a type are keyed by the start of its period, a new period invalidates all of them."""
+    balances = compute_absence_balances(EmployeeAbsence.objects.filter(absence_type=absence_type))
+
+    AbsenceBalance.objects.filter(absence_type=absence_type).delete()
+    create_balances(absence_type.company_id, balances)
+    return len(balances)
+
+
+def check_company_balances(company):
+    expected = compute_company_balances(company)
+
+    qs = AbsenceBalance.objects.filter(company=company)
+    qs = qs.values_list('employee_id', 'absence_type_id', 'period_start', 'consumed')
+    stored = {(employee_id, absence_type_id, period_start): consumed
+              for employee_id, absence_type_id, period_start, consumed in qs}
+
+    mismatches = []
+    for key in set(expected) | set(stored):
+        if expected.get(key, 0) != stored.get(key, 0):
+            employee_id, absence_type_id, period_start = key
+            mismatches.append(dict(employee_id=employee_id,
+                                   absence_type_id=absence_type_id,
+                                   period_start=period_start,
+                                   stored=stored.get(key, 0),
+                                   expected=expected.get(key, 0)))
+    return sorted(mismatches, key=lambda m: (str(m['employee_id']), str(m['absence_type_id']), m['period_start']))
@@ -0,0 +1,22 @@
+"""
+Conditional GET of the event endpoints of the absence calendar and the schedules.
+
+The views compute an ETag and a last modification from cheap aggregates, answer 304 when
+the client holds the same version and set the validators on every other response.
+"""
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def get_not_modified_response(request, etag, last_modified):
+    last_modified = last_modified and int(last_modified.timestamp())
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_conditional_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # let every poll revalidate instead of serving a stale copy
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
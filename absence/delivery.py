@@ -0,0 +1,39 @@
+"""
+Background delivery of the emails announcing a general absence.
+
+The audience can be a whole company, so it is streamed in chunks of employees sharing a
+language and the progress is kept in the cache for the clients to poll.
+"""
+from itertools import groupby, islice
+
+from django.core.cache import cache
+
+DELIVERY_CHUNK_SIZE = 500
+DELIVERY_PROGRESS_TIMEOUT = 24 * 60 * 60
+
+DELIVERY_QUEUED = 'QUEUED'
+DELIVERY_RUNNING = 'RUNNING'
+DELIVERY_DONE = 'DONE'
+
+
+def get_delivery_progress_key(absence_id):
+    return f'general_absence_delivery:{absence_id}'
+
+
+def set_delivery_progress(absence_id, status, total=None, sent=0):
+    progress = dict(status=status, total=total, sent=sent)
+    cache.set(get_delivery_progress_key(absence_id), progress, DELIVERY_PROGRESS_TIMEOUT)
+
+
+def get_delivery_progress(absence_id):
+    return cache.get(get_delivery_progress_key(absence_id))
+
+
+def iter_language_chunks(audience, size=DELIVERY_CHUNK_SIZE):
+    """(language, employees) chunks of at most size employees, read with a server side cursor."""
+    employees = audience.order_by('language', 'pk').iterator(chunk_size=size)
+    for language, group in groupby(employees, key=lambda e: e.language):
+        chunk = list(islice(group, size))
+        while chunk:
+            yield language, chunk
+            chunk = list(islice(group, size))
@@ -64,16 +64,44 @@ class AbsenceUpdated(Email):
         return context
 
 
+class AbsenceDigest(Email):
+    subject = _noop('ABSENCE_NOTIFICATIONS_DIGEST')
+    subject_1 = _('ABSENCE_NOTIFICATIONS_DIGEST')
+    template = 'ABSENCE_DIGEST'
+
+    def __init__(self, recipient, items):
+        self.recipient = recipient
+        self.items = items
+        super().__init__(to=recipient.email)
+
+    def get_context(self):
+        context = super().get_context()
+        context['link'] = f'{settings.FRONT_END_APP_URL}/absences'
+        context['first_name'] = self.recipient.first_name
+        context['absences'] = [dict(kind=item.kind,
+                                    link=f'{settings.FRONT_END_APP_URL}/absences/{item.absence_id}/view',
+                                    submitted_for_full_name=item.absence.submitted_for.get_full_name(),
+                                    status=str(ABSENCE_STATUS_CHOICES[item.absence.status]))
+                               for item in self.items]
+        context['language'] = self.recipient.language
+        return context
+
+
 class GeneralAbsencePublished(MakeEmail):
     subject = _noop('ABSENCE_PUBLISHED_EMAIL_SUBJECT')
     subject_1 = _('ABSENCE_PUBLISHED_EMAIL_SUBJECT')
     template = 'GENERAL_ABSENCE_PUBLISHED'
 
-    def __init__(self, *args, absence, **kwargs):
+    def __init__(self, *args, absence, context=None, **kwargs):
         self.instance = absence
+        self.context = context
         super().__init__(*args, **kwargs)
 
     def get_context(self):
+        # chunks of the same language share the context rendered for the first one
+        if self.context is not None:
+            return dict(self.context)
+
         context = super().get_context()
         context['duration'] = (self.instance.end - self.instance.start).days + 1
         context['link'] = f'{settings.FRONT_END_APP_URL}/absences?id={self.instance.id}'
@@ -0,0 +1,70 @@
+"""
+Calendar events straight from database rows.
+
+The calendar reads its events as value rows, without building a model instance per row.
+Absences only select id, start, end and the duration of their type, the title, type and
+color they share per model are added here. The sources are merged on their start and
+encoded to JSON in the same shape and datetime format the event serializers produce,
+one event at a time so that the response streams.
+"""
+import heapq
+import json
+from operator import itemgetter
+
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from absence.models import EmployeeAbsence, GeneralAbsence
+from constants.db import DURATION
+
+CALENDAR_EVENT_FIELDS = ('id', 'start', 'end', 'title', 'type', 'allDay', 'background_color')
+ABSENCE_EVENT_FIELDS = ('id', 'start', 'end', 'absence_type__duration')
+GENERAL_ABSENCE_EVENT_FIELDS = ('id', 'start', 'end')
+
+
+def format_datetime(value):
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def get_event(pk, start, end, title, event_type, all_day, background_color):
+    return {'id': str(pk), 'start': format_datetime(start), 'end': format_datetime(end), 'title': title,
+            'type': event_type, 'allDay': all_day, 'background_color': background_color}
+
+
+def iter_absence_events(rows):
+    title = str(_('ABSENT'))
+    for pk, start, end, duration in rows:
+        yield start, get_event(pk, start, end, title, EmployeeAbsence.EVENT_TYPE, duration != DURATION.HOURLY,
+                               EmployeeAbsence.EVENT_COLOR)
+
+
+def iter_general_absence_events(rows):
+    title = str(_('ABSENT'))
+    for pk, start, end in rows:
+        yield start, get_event(pk, start, end, title, GeneralAbsence.EVENT_TYPE, True, GeneralAbsence.EVENT_COLOR)
+
+
+def iter_shift_events(rows):
+    for row in rows:
+        yield row[1], get_event(*row)
+
+
+def stream_events(absences=(), general_absences=(), shifts=()):
+    """
+    JSON array of the events, in chunks of one event. Every source is ordered by start: absences
+    as ABSENCE_EVENT_FIELDS rows, general absences as GENERAL_ABSENCE_EVENT_FIELDS rows and
+    shifts as CALENDAR_EVENT_FIELDS rows.
+    """
+    events = heapq.merge(iter_absence_events(absences), iter_general_absence_events(general_absences),
+                         iter_shift_events(shifts), key=itemgetter(0))
+    yield '['
+    for i, (_start, event) in enumerate(events):
+        yield (',' if i else '') + json.dumps(event, separators=(',', ':'))
+    yield ']'
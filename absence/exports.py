@@ -0,0 +1,79 @@
+"""
+Background export jobs of the list views.
+
+An export of a whole company does not fit in a request, so the view stores which of its actions
+was asked with which query string in a job, and a Celery task filters the queryset again through
+the same view before writing the file chunk by chunk to the storage. The number of written rows
+is kept on the job, which the client polls until the file is ready.
+"""
+import logging
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone, translation
+from django.utils.module_loading import import_string
+from rest_framework.request import Request
+
+from absence.models import ExportJob, EXPORT_JOB_STATUS_CHOICES
+from absence.modules.streaming_export import iter_export_rows, write_export, get_export_filename, EXPORT_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def create_export_job(view, file_format):
+    view_class = type(view)
+    return ExportJob.objects.create(requested_by=view.get_request_user(),
+                                    view=f'{view_class.__module__}.{view_class.__qualname__}',
+                                    action=view.action,
+                                    query_string=view.request.query_params.urlencode(),
+                                    file_format=file_format,
+                                    language=translation.get_language() or settings.LANGUAGE_CODE)
+
+
+def get_export_job_view(job):
+    """The view of the job as it was asked by the user who started it, for its filters and querysets."""
+    http_request = HttpRequest()
+    http_request.method = 'GET'
+    http_request.GET = QueryDict(job.query_string)
+
+    request = Request(http_request)
+    request.user = job.requested_by
+    return import_string(job.view)(request=request, action=job.action, format_kwarg=None, args=(), kwargs={})
+
+
+def get_export_job_queryset(view):
+    return view.filter_queryset(view.get_queryset())
+
+
+def update_export_job(job, **fields):
+    ExportJob.objects.filter(pk=job.pk).update(modified=timezone.now(), **fields)
+
+
+def write_export_job(job):
+    view = get_export_job_view(job)
+    generator_class = view.exportGenerator
+    queryset = get_export_job_queryset(view)
+
+    rows_total = queryset.count()
+    update_export_job(job, status=EXPORT_JOB_STATUS_CHOICES.RUNNING, rows_total=rows_total, rows_done=0)
+
+    rows = iter_export_rows(generator_class, queryset, EXPORT_CHUNK_SIZE,
+                            progress=lambda done: update_export_job(job, rows_done=done))
+    with tempfile.TemporaryFile() as file:
+        write_export(rows, job.file_format, file)
+        file.seek(0)
+        job.file.save(get_export_filename(generator_class.title, job.file_format), File(file), save=False)
+
+    update_export_job(job, status=EXPORT_JOB_STATUS_CHOICES.DONE, rows_done=rows_total, file=job.file.name)
+
+
+def run_export_job(job):
+    try:
+        with translation.override(job.language):
+            write_export_job(job)
+    except Exception as e:
+        logger.exception('Export job %s failed', job.pk)
+        update_export_job(job, status=EXPORT_JOB_STATUS_CHOICES.FAILED, error=repr(e))
+        raise
@@ -0,0 +1,138 @@
+"""
+iCalendar subscription feed of an employee's absences, general absences and published shifts.
+
+Calendar clients poll the feed every hour or so, therefore the rendered feed is kept in the
+cache under a key carrying a version of the employee and one of the company. Changes bump the
+version instead of deleting entries, so a stale feed is simply never read again.
+"""
+import datetime as dt
+import time
+
+import pytz
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import ugettext as _
+
+from absence.models import GeneralAbsence
+from absence.utils import get_employee_absences_events_queryset, filter_events_window
+from constants.db import ABSENCE_STATUS_CHOICES, DURATION, SCHEDULE_STATUS_CHOICES
+from shift.models import Shift
+
+FEED_CACHE_TIMEOUT = 60 * 60
+FEED_PAST_DAYS = 90
+FEED_FUTURE_DAYS = 365
+
+
+def get_feed_version_key(scope, pk):
+    return f'calendar_feed_version:{scope}:{pk}'
+
+
+def invalidate_calendar_feeds(employee_ids=(), company_ids=()):
+    """Bump the versions once the transaction commits, a feed read before would cache the old rows again."""
+    keys = [get_feed_version_key('employee', pk) for pk in employee_ids]
+    keys += [get_feed_version_key('company', pk) for pk in company_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many({key: time.time_ns() for key in keys}, None))
+
+
+def get_feed_cache_key(employee):
+    keys = [get_feed_version_key('employee', employee.pk), get_feed_version_key('company', employee.company_id)]
+    versions = cache.get_many(keys)
+
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return f'calendar_feed:{employee.pk}:' + ':'.join(str(versions[key]) for key in keys)
+
+
+def escape_text(value):
+    value = value or ''
+    for char, escaped in (('\\', '\\\\'), (';', '\\;'), (',', '\\,'), ('\r\n', '\\n'), ('\n', '\\n')):
+        value = value.replace(char, escaped)
+    return value
+
+
+def fold_line(line):
+    """Split content lines longer than 75 octets as RFC 5545 asks."""
+    data = line.encode()
+    if len(data) <= 75:
+        return line + '\r\n'
+
+    parts, size = [], 75
+    while data:
+        cut = min(size, len(data))
+        # never split a multibyte character
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode())
+        data, size = data[cut:], 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_value(name, value, all_day, tzinfo):
+    if all_day:
+        return f'{name};VALUE=DATE:{value.astimezone(tzinfo).strftime("%Y%m%d")}'
+    return f'{name}:{value.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")}'
+
+
+def get_feed_window(now=None):
+    now = now or timezone.now()
+    return now - dt.timedelta(days=FEED_PAST_DAYS), now + dt.timedelta(days=FEED_FUTURE_DAYS)
+
+
+def get_employee_timezone(employee):
+    try:
+        return pytz.timezone(employee.timezone)
+    except (pytz.UnknownTimeZoneError, AttributeError):
+        return timezone.get_current_timezone()
+
+
+def get_feed_events(employee, start, end):
+    """(uid, start, end, all day, summary) of every event of the feed, read with server side cursors."""
+    absences = get_employee_absences_events_queryset(employee, employee, start, end).order_by()
+    absence_title = _('ABSENT')
+    for pk, a_start, a_end, duration in absences.values_list('id', 'start', 'end', 'absence_type__duration').iterator():
+        yield f'absence-{pk}', a_start, a_end, duration != DURATION.HOURLY, absence_title
+
+    general_absences = GeneralAbsence.for_employee(employee)
+    general_absences = general_absences.filter(deleted_at__isnull=True, status=ABSENCE_STATUS_CHOICES.APPROVED)
+    general_absences = filter_events_window(general_absences, start, end).order_by().distinct()
+    for pk, g_start, g_end, subject in general_absences.values_list('id', 'start', 'end', 'subject').iterator():
+        yield f'general-absence-{pk}', g_start, g_end, True, subject
+
+    shifts = Shift.objects.filter(employees_allocated=employee, schedule__status=SCHEDULE_STATUS_CHOICES.PUBLISHED)
+    shifts = filter_events_window(shifts, start, end).order_by()
+    for pk, s_start, s_end, name in shifts.values_list('id', 'start', 'end', 'shift_type__name').iterator():
+        yield f'shift-{pk}', s_start, s_end, False, name
+
+
+def iter_feed(employee, now=None):
+    now = now or timezone.now()
+    tzinfo = get_employee_timezone(employee)
+    stamp = format_value('DTSTAMP', now, False, tzinfo)
+
+    yield 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//absence//calendar feed//EN\r\nCALSCALE:GREGORIAN\r\n'
+    for uid, start, end, all_day, summary in get_feed_events(employee, *get_feed_window(now)):
+        lines = ['BEGIN:VEVENT', f'UID:{uid}', stamp, format_value('DTSTART', start, all_day, tzinfo)]
+        if end is not None:
+            lines.append(format_value('DTEND', end, all_day, tzinfo))
+        lines += [f'SUMMARY:{escape_text(summary)}', 'END:VEVENT']
+        yield ''.join(fold_line(line) for line in lines)
+    yield 'END:VCALENDAR\r\n'
+
+
+def iter_cached_feed(employee):
+    """Stream the feed of the employee and keep it in the cache once it is complete."""
+    key = get_feed_cache_key(employee)
+    content = cache.get(key)
+    if content is not None:
+        yield content
+        return
+
+    chunks = []
+    for chunk in iter_feed(employee):
+        chunks.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(chunks), FEED_CACHE_TIMEOUT)
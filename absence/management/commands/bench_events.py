@@ -0,0 +1,71 @@
+import datetime as dt
+import json
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from model_bakery import baker
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from absence.events import stream_events, ABSENCE_EVENT_FIELDS
+from absence.models import EmployeeAbsence, EmployeeAbsenceType
+from account.models import Company, Employee
+
+
+class EventSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    title = serializers.CharField()
+    type = serializers.CharField()
+    allDay = serializers.BooleanField()
+    background_color = serializers.CharField()
+
+
+def create_absences(count):
+    company = baker.make(Company)
+    employee = baker.make(Employee, company=company)
+    absence_type = baker.make(EmployeeAbsenceType, company=company)
+    start = timezone.make_aware(dt.datetime(2000, 1, 1))
+
+    EmployeeAbsence.objects.bulk_create([
+        EmployeeAbsence(subject='bench', company=company, submitted_for=employee, submitted_by=employee,
+                        absence_type=absence_type, start=start + dt.timedelta(days=i),
+                        end=start + dt.timedelta(days=i, hours=8))
+        for i in range(count)
+    ], batch_size=1000)
+    return EmployeeAbsence.get_event_queryset(company=company).order_by('start')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark of the raw row event pipeline of the calendar against the annotated queryset path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=10000, help='absences to render')
+        parser.add_argument('--repeat', type=int, default=5, help='runs per path, the fastest one is reported')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        try:
+            self.bench(options['events'], options['repeat'])
+        finally:
+            # the absences of the benchmark are not kept
+            transaction.set_rollback(True)
+
+    def bench(self, events, repeat):
+        qs = create_absences(events)
+
+        def queryset_path():
+            return JSONRenderer().render(EventSerializer(qs.all(), many=True).data)
+
+        def rows_path():
+            return ''.join(stream_events(qs.values_list(*ABSENCE_EVENT_FIELDS).iterator()))
+
+        if json.loads(rows_path()) != json.loads(queryset_path()):
+            raise CommandError('the row pipeline and the serializer give different events')
+
+        for name, path in (('queryset', queryset_path), ('rows', rows_path)):
+            seconds = min(timeit.repeat(path, number=1, repeat=repeat))
+            self.stdout.write(f'{name:8} {events} events: {seconds * 1000:8.1f} ms')
@@ -0,0 +1,45 @@
+import datetime as dt
+import subprocess
+import sys
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from absence import periods
+
+CASES = [
+    ('W-MON', dt.datetime(2020, 5, 12), dt.datetime(2020, 8, 12)),
+    ('MS', dt.datetime(2020, 5, 12), dt.datetime(2021, 5, 12)),
+    ('A', dt.datetime(2020, 5, 12), dt.datetime(2023, 5, 12)),
+]
+
+
+def import_time(module):
+    code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+    return float(subprocess.check_output([sys.executable, '-c', code]))
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark of absence.periods against pandas.date_range, when pandas is installed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=10000, help='calls per case')
+
+    def handle(self, *args, **options):
+        try:
+            import pandas as pd
+        except ImportError:
+            pd = None
+
+        self.stdout.write(f'import absence.periods: {import_time("absence.periods") * 1000:.1f} ms')
+        if pd is not None:
+            self.stdout.write(f'import pandas: {import_time("pandas") * 1000:.1f} ms')
+
+        number = options['number']
+        for freq, start, end in CASES:
+            own = timeit.timeit(lambda: periods.date_range(start, end, freq=freq), number=number) / number
+            line = f'{freq:6} periods: {own * 1e6:8.2f} us'
+            if pd is not None:
+                theirs = timeit.timeit(lambda: list(pd.date_range(start, end, freq=freq)), number=number) / number
+                line += f'  pandas: {theirs * 1e6:8.2f} us'
+            self.stdout.write(line)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from absence.models import ABSENCE_OVERLAP_CONSTRAINT
+from constants.db import ABSENCE_STATUS_CHOICES
+
+CONFLICTS_SQL = '''
+    SELECT a.id, b.id FROM absence_employeeabsence a
+    JOIN absence_employeeabsence b ON a.submitted_for_id = b.submitted_for_id AND a.id < b.id
+     AND TSTZRANGE(a."start", a."end", '[)') && TSTZRANGE(b."start", b."end", '[)')
+    WHERE a.status <> %(rejected)s AND b.status <> %(rejected)s
+'''
+
+ADD_CONSTRAINT_SQL = f'''
+    ALTER TABLE absence_employeeabsence ADD CONSTRAINT {ABSENCE_OVERLAP_CONSTRAINT}
+    EXCLUDE USING gist (submitted_for_id WITH =, TSTZRANGE("start", "end", '[)') WITH &&)
+    WHERE (status <> %(rejected)s)
+'''
+
+DROP_CONSTRAINT_SQL = f'ALTER TABLE absence_employeeabsence DROP CONSTRAINT IF EXISTS {ABSENCE_OVERLAP_CONSTRAINT}'
+
+
+class Command(BaseCommand):
+    help = 'Let the database reject overlapping non rejected absences of an employee, or stop it with --drop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true', help='drop the exclusion constraint')
+
+    def handle(self, *args, **options):
+        params = dict(rejected=ABSENCE_STATUS_CHOICES.REJECTED)
+
+        with connection.cursor() as cursor:
+            if options['drop']:
+                cursor.execute(DROP_CONSTRAINT_SQL)
+                self.stdout.write(self.style.SUCCESS(f'{ABSENCE_OVERLAP_CONSTRAINT} dropped'))
+                return
+
+            cursor.execute(CONFLICTS_SQL, params)
+            conflicts = cursor.fetchall()
+            for first, second in conflicts:
+                self.stdout.write(f'absence {first} overlaps absence {second}')
+            if conflicts:
+                raise CommandError(f'{len(conflicts)} overlapping absences have to be resolved first')
+
+            cursor.execute(DROP_CONSTRAINT_SQL)
+            cursor.execute(ADD_CONSTRAINT_SQL, params)
+        self.stdout.write(self.style.SUCCESS(f'{ABSENCE_OVERLAP_CONSTRAINT} added'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from absence.balance import rebuild_company_balances, check_company_balances
+from account.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the absence balance ledger from approved absences, or check it with --check'
+
+    def add_arguments(self, parser):
+        parser.add_argument('companies', nargs='*', help='ids of the companies, all companies when omitted')
+        parser.add_argument('--check', action='store_true', help='only report ledger rows that are out of sync')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['companies']:
+            companies = companies.filter(pk__in=options['companies'])
+
+        mismatches = 0
+        for company in companies.iterator():
+            if options['check']:
+                for m in check_company_balances(company):
+                    mismatches += 1
+                    self.stdout.write(f'{company.pk}: employee {m["employee_id"]}, absence type {m["absence_type_id"]}, '
+                                      f'period {m["period_start"]}: stored {m["stored"]}, expected {m["expected"]}')
+            else:
+                count = rebuild_company_balances(company)
+                self.stdout.write(self.style.SUCCESS(f'{company.pk}: {count} balance rows rebuilt'))
+
+        if mismatches:
+            raise CommandError(f'{mismatches} absence balance rows are out of sync')
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from absence.outbox import relay_outbox, get_outbox_stats, OUTBOX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Relay the outbox messages to their handlers, once or every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, help='keep relaying, sleeping this many seconds when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            metrics = relay_outbox(batch_size=options['batch_size'])
+            if metrics['batches'] or not options['interval']:
+                stats = get_outbox_stats()
+                self.stdout.write(f'{metrics["handled"]} handled, {metrics["failed"]} failed in {metrics["seconds"]}s '
+                                  f'({metrics["per_second"]}/s), {stats["pending"]} pending, {stats["failed"]} failed '
+                                  f'for good, lag {stats["lag"]:.0f}s')
+            if not options['interval']:
+                return
+            if not metrics['batches']:
+                time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.4 on 2026-10-17 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('account', '0001_initial'),
+        ('absence', '0032_auto_20210201_1047'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbsenceBalance',
+            fields=[
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('period_start', models.DateField()),
+                ('consumed', models.IntegerField(default=0, help_text='approved absence days consumed in the period')),
+                ('absence_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='absence.EmployeeAbsenceType')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='account.Company')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='absence_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('employee', 'absence_type', 'period_start')},
+            },
+        ),
+    ]
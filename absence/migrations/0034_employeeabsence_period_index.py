@@ -0,0 +1,18 @@
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('absence', '0033_absencebalance'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.RunSQL(
+            sql='CREATE INDEX absence_employeeabsence_period_gist ON absence_employeeabsence '
+                'USING gist (submitted_for_id, TSTZRANGE("start", "end", \'[)\'))',
+            reverse_sql='DROP INDEX absence_employeeabsence_period_gist',
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('absence', '0034_employeeabsence_period_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employeeabsence',
+            index=models.Index(fields=['submitted_for', 'status', 'start', 'end'], name='absence_events_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generalabsence',
+            index=models.Index(fields=['company', 'start', 'end'], name='general_absence_window_idx'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+import datetime as dt
+from collections import defaultdict
+
+import pytz
+from django.conf import settings
+from django.db import migrations
+
+from constants.db import ABSENCE_ENTITLEMENT_PERIOD_CHOICE, ABSENCE_STATUS_CHOICES
+
+
+# the period logic of absence.balance as of this migration, later changes there must not alter the backfill
+def to_naive(value, tz):
+    if value.tzinfo is not None:
+        value = value.astimezone(tz)
+    return value.replace(tzinfo=None)
+
+
+def get_period_start(value, period):
+    if period == ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK:
+        return value - dt.timedelta(days=value.weekday())
+    if period == ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH:
+        return value.replace(day=1)
+    if period == ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_YEAR:
+        return value.replace(month=1, day=1)
+    return None
+
+
+def get_next_period_start(period_start, period):
+    if period == ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK:
+        return period_start + dt.timedelta(days=7)
+    if period == ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH:
+        return (period_start + dt.timedelta(days=32)).replace(day=1)
+    return period_start.replace(year=period_start.year + 1)
+
+
+def get_absence_periods(start, end, period, tz):
+    if start is None or end is None or end <= start:
+        return []
+
+    start, end = to_naive(start, tz), to_naive(end, tz)
+    period_start = get_period_start(start.date(), period)
+    if period_start is None:
+        return []
+
+    first_day = start.date()
+    last_day = first_day + dt.timedelta(days=(end - start).days)
+
+    absence_periods = []
+    while dt.datetime.combine(period_start, dt.time()) < end:
+        next_period_start = get_next_period_start(period_start, period)
+        days = (min(last_day, next_period_start) - max(first_day, period_start)).days
+        absence_periods.append((period_start, max(days, 0)))
+        period_start = next_period_start
+    return absence_periods
+
+
+def backfill_absence_balances(apps, schema_editor):
+    EmployeeAbsence = apps.get_model('absence', 'EmployeeAbsence')
+    AbsenceBalance = apps.get_model('absence', 'AbsenceBalance')
+
+    tz = pytz.timezone(settings.TIME_ZONE)
+
+    balances = defaultdict(int)
+    qs = EmployeeAbsence.objects.filter(status=ABSENCE_STATUS_CHOICES.APPROVED)
+    qs = qs.values_list('company_id', 'submitted_for_id', 'absence_type_id', 'absence_type__period', 'start', 'end')
+    for company_id, employee_id, absence_type_id, period, start, end in qs.iterator():
+        for period_start, days in get_absence_periods(start, end, period, tz):
+            if days != 0:
+                balances[(company_id, employee_id, absence_type_id, period_start)] += days
+
+    # the ledger is rebuilt whole, rows booked since 0033 are recomputed as well
+    AbsenceBalance.objects.all().delete()
+    AbsenceBalance.objects.bulk_create([
+        AbsenceBalance(company_id=company_id, employee_id=employee_id, absence_type_id=absence_type_id,
+                       period_start=period_start, consumed=consumed)
+        for (company_id, employee_id, absence_type_id, period_start), consumed in balances.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('absence', '0039_exportjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_absence_balances, migrations.RunPython.noop),
+    ]
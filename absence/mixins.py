@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import decorators, serializers, status
+from rest_framework.response import Response
+
+from absence.exports import create_export_job
+from absence.modules.streaming_export import get_export_formats, CSV
+from absence.serializers.export_job_serializer import ExportJobSerializer
+from absence.tasks import dispatch_export_job
+
+
+class ExportJobMixin:
+    """Export of the filtered list in the background, polled through the export_job endpoint."""
+
+    @decorators.action(methods=['post'], detail=False)
+    def export_job(self, request, *_args, **_kwargs):
+        file_format = request.data.get('file_format', CSV)
+        if file_format not in get_export_formats():
+            raise serializers.ValidationError({'file_format': _('UNSUPPORTED_EXPORT_FORMAT')})
+
+        with transaction.atomic():
+            job = create_export_job(self, file_format)
+            dispatch_export_job(job)
+
+        serializer = ExportJobSerializer(job, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
@@ -1,10 +1,14 @@
 import datetime as dt
+import secrets
 import uuid
 from datetime import timedelta
 
+from django.contrib.postgres.fields import DateTimeRangeField, JSONField
 from django.db import models
-from django.db.models import Q, Case, When
+from django.db.models import Q, Case, When, Func
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
+from model_utils import Choices
 from model_utils.models import TimeStampedModel
 
 from absence.manager import EmployeeAbsencesTypeManager
@@ -12,6 +16,14 @@ from account.models import Employee
 from constants.db import ABSENCE_ENTITLEMENT_PERIOD_CHOICE, ABSENCE_STATUS_CHOICES, DURATION
 from history.connector import connect
 
+# optional, see the exclude_overlapping_absences command
+ABSENCE_OVERLAP_CONSTRAINT = 'absence_employeeabsence_no_overlap'
+
+
+class TsTzRange(Func):
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
 
 class EmployeeAbsenceType(TimeStampedModel):
     objects = EmployeeAbsencesTypeManager()
@@ -42,6 +54,8 @@ class EmployeeAbsenceType(TimeStampedModel):
 
 @connect()
 class EmployeeAbsence(TimeStampedModel):
+    EVENT_TYPE = 'ABSENCE'
+    EVENT_COLOR = '#E57373'
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     subject = models.CharField(max_length=256)
@@ -58,14 +72,17 @@ class EmployeeAbsence(TimeStampedModel):
 
     class Meta:
         ordering = ['-start']
+        indexes = [
+            models.Index(fields=['submitted_for', 'status', 'start', 'end'], name='absence_events_window_idx'),
+        ]
 
     @classmethod
     def get_event_queryset(cls, **kwargs):
         qs = cls.objects.filter(**kwargs)
         qs = qs.annotate(
             title=models.Value(str(_('ABSENT')), output_field=models.CharField()),
-            background_color=models.Value('#E57373', output_field=models.CharField()),
-            type=models.Value('ABSENCE', output_field=models.CharField()),
+            background_color=models.Value(cls.EVENT_COLOR, output_field=models.CharField()),
+            type=models.Value(cls.EVENT_TYPE, output_field=models.CharField()),
             allDay=Case(
                 When(absence_type__duration = DURATION.HOURLY, then=False),
                 default=True,
@@ -75,6 +92,11 @@ class EmployeeAbsence(TimeStampedModel):
         qs = qs.only('id', 'start', 'end')
         return qs
 
+    @staticmethod
+    def get_period_expression():
+        # must stay identical to the expression of the GiST index (migration 0034)
+        return TsTzRange('start', 'end', models.Value('[)'))
+
     def get_comments(self):
         return self.employeeabsencecomment_set.all()
 
@@ -103,6 +125,9 @@ class EmployeeAbsenceComment(TimeStampedModel):
 
 
 class GeneralAbsence(TimeStampedModel):
+    EVENT_TYPE = 'GENERAL_ABSENCE'
+    EVENT_COLOR = '#E57373'
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     subject = models.CharField(max_length=256)
     body = models.TextField(null=True, blank=True, max_length=500)
@@ -118,15 +143,17 @@ class GeneralAbsence(TimeStampedModel):
 
     class Meta:
         ordering = ['-start']
-
+        indexes = [
+            models.Index(fields=['company', 'start', 'end'], name='general_absence_window_idx'),
+        ]
 
     @classmethod
     def get_event_queryset(cls, *args, **kwargs):
         qs = cls.objects.filter(*args, **kwargs)
         qs = qs.annotate(
             title=models.Value(str(_('ABSENT')), output_field=models.CharField()),
-            background_color=models.Value('#E57373', output_field=models.CharField()),
-            type=models.Value('GENERAL_ABSENCE', output_field=models.CharField()),
+            background_color=models.Value(cls.EVENT_COLOR, output_field=models.CharField()),
+            type=models.Value(cls.EVENT_TYPE, output_field=models.CharField()),
             allDay=models.Value(True, output_field=models.BooleanField()),
         )
         qs = qs.only('id', 'start', 'end')
@@ -139,4 +166,97 @@ class GeneralAbsence(TimeStampedModel):
         return cls.objects.filter(q)
 
     def get_end(self):
-        return self.end - dt.timedelta(days=1)
\ No newline at end of file
+        return self.end - dt.timedelta(days=1)
+
+
+class AbsenceBalance(TimeStampedModel):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    company = models.ForeignKey('account.Company', on_delete=models.CASCADE, db_index=True)
+    employee = models.ForeignKey('account.Employee', on_delete=models.CASCADE, related_name='absence_balances')
+    absence_type = models.ForeignKey(EmployeeAbsenceType, on_delete=models.CASCADE)
+    period_start = models.DateField()
+    consumed = models.IntegerField(default=0, help_text='approved absence days consumed in the period')
+
+    class Meta:
+        unique_together = ('employee', 'absence_type', 'period_start')
+
+
+def generate_calendar_feed_token():
+    return secrets.token_urlsafe(32)
+
+
+class CalendarFeedToken(TimeStampedModel):
+    employee = models.OneToOneField('account.Employee', on_delete=models.CASCADE, related_name='calendar_feed_token')
+    token = models.CharField(max_length=64, unique=True, default=generate_calendar_feed_token)
+
+    def rotate(self):
+        self.token = generate_calendar_feed_token()
+        self.save()
+
+
+class AbsenceNotificationSetting(TimeStampedModel):
+    employee = models.OneToOneField('account.Employee', on_delete=models.CASCADE,
+                                    related_name='absence_notification_setting')
+    # absence emails are queued and sent as one digest every digest_interval hours
+    digest = models.BooleanField(default=False)
+    digest_interval = models.PositiveSmallIntegerField(default=24)
+
+
+class AbsenceDigestItem(TimeStampedModel):
+    recipient = models.ForeignKey('account.Employee', on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=32)
+    absence = models.ForeignKey(EmployeeAbsence, on_delete=models.CASCADE, related_name='+')
+    comment = models.ForeignKey(EmployeeAbsenceComment, on_delete=models.CASCADE, null=True, related_name='+')
+
+    class Meta:
+        indexes = [models.Index(fields=['recipient', 'created'], name='absence_digest_item_idx')]
+
+
+OUTBOX_STATUS_CHOICES = Choices(
+    (0, 'PENDING', _('PENDING')),
+    (1, 'DONE', _('DONE')),
+    (2, 'FAILED', _('FAILED')),
+)
+
+
+class OutboxMessage(TimeStampedModel):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    topic = models.CharField(max_length=64)
+    payload = JSONField(default=dict)
+    # the same event enqueued twice is stored once
+    idempotency_key = models.CharField(max_length=128, unique=True)
+    status = models.PositiveSmallIntegerField(choices=OUTBOX_STATUS_CHOICES, default=OUTBOX_STATUS_CHOICES.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'available_at'], name='absence_outbox_pending_idx')]
+
+
+EXPORT_JOB_STATUS_CHOICES = Choices(
+    (0, 'PENDING', _('PENDING')),
+    (1, 'RUNNING', _('RUNNING')),
+    (2, 'DONE', _('DONE')),
+    (3, 'FAILED', _('FAILED')),
+)
+
+
+class ExportJob(TimeStampedModel):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='+')
+    # dotted path of the viewset, its action and the query string of the request, the worker
+    # filters the queryset again through the view
+    view = models.CharField(max_length=255)
+    action = models.CharField(max_length=64)
+    query_string = models.TextField(blank=True)
+    file_format = models.CharField(max_length=8)
+    # the headers are translated to the language of the request
+    language = models.CharField(max_length=10, blank=True)
+    status = models.PositiveSmallIntegerField(choices=EXPORT_JOB_STATUS_CHOICES,
+                                              default=EXPORT_JOB_STATUS_CHOICES.PENDING)
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to='exports/%Y/%m/%d/', blank=True)
+    error = models.TextField(blank=True)
@@ -1,19 +1,73 @@
+from django.db.models import Prefetch, F, Value, Case, When, CharField, DurationField, ExpressionWrapper
+from django.db.models.functions import Concat, Trim
 from django.utils.translation import gettext_lazy as _
 
 from absence.models import EmployeeAbsenceType, GeneralAbsence
-from absence.utils import get_leaves_duration_string, get_leave_start, get_leave_end
+from absence.utils import (get_leaves_duration_string, get_leave_start, get_leave_end, format_leave_start,
+                           format_leave_end, format_leaves_duration)
+from account.models import Department
 from account.modules.dataset_generator import BaseDataSetGenerator
 from constants.db import ABSENCE_ENTITLEMENT_PERIOD_CHOICE, ABSENCE_STATUS_CHOICES, DURATION
 from helpers.formatting import formatted_datetime, formatted_date, local_datetime, local_date
 
 
+def get_full_name_expression(relation):
+    return Trim(Concat(F(f'{relation}__first_name'), Value(' '), F(f'{relation}__last_name'),
+                       output_field=CharField()))
+
+
+def get_choice_label_expression(field, choices):
+    return Case(*[When(**{field: value}, then=Value(str(label))) for value, label in choices],
+                default=Value(''), output_field=CharField())
+
+
 class EmployeeAbsenceListViewDataSetGenerator(BaseDataSetGenerator):
+    title = 'employee_absence_list'
+
     def __init__(self, queryset):
-        queryset = queryset.prefetch_related('absence_type',
-                                             'submitted_for',
-                                             'submitted_by',
-                                             'submitted_to', )
-        super().__init__(queryset, title='employee_absence_list')
+        super().__init__(self.get_export_queryset(queryset), title=self.title)
+
+    @staticmethod
+    def get_export_queryset(queryset):
+        # joined rather than prefetched, prefetch_related is ignored by iterator()
+        return queryset.select_related('absence_type',
+                                       'submitted_for__department',
+                                       'submitted_by',
+                                       'submitted_to', )
+
+    @staticmethod
+    def get_export_values(queryset):
+        """Tuples for get_values_data_row, names and labels being computed by the database."""
+        queryset = queryset.annotate(
+            export_submitted_by=get_full_name_expression('submitted_by'),
+            export_submitted_for=get_full_name_expression('submitted_for'),
+            export_submitted_to=get_full_name_expression('submitted_to'),
+            export_status=get_choice_label_expression('status', ABSENCE_STATUS_CHOICES),
+            export_duration=ExpressionWrapper(F('end') - F('start'), output_field=DurationField()),
+        )
+        return queryset.values_list('export_submitted_by', 'export_submitted_for', 'export_submitted_to', 'subject',
+                                    'start', 'end', 'absence_type__duration', 'export_duration', 'export_status',
+                                    'submitted_for__department__name', 'created', 'absence_type__name')
+
+    @staticmethod
+    def get_values_data_row(values):
+        (submitted_by, submitted_for, submitted_to, subject, start, end, absence_duration, duration, status,
+         department, created, absence_type) = values
+        hourly = absence_duration == DURATION.HOURLY
+
+        return [
+            submitted_by,
+            submitted_for,
+            submitted_to,
+            subject,
+            format_leave_start(start, hourly),
+            format_leave_end(end, hourly),
+            format_leaves_duration(duration),
+            status,
+            department,
+            formatted_datetime(local_datetime(created)),
+            absence_type
+        ]
 
     @staticmethod
     def get_instance_data_row(instance):
@@ -53,8 +107,14 @@ class EmployeeAbsenceListViewDataSetGenerator(BaseDataSetGenerator):
 
 
 class AbsenceTypeListViewDataSetGenerator(BaseDataSetGenerator):
+    title = 'absence_type_list'
+
     def __init__(self, queryset):
-        super().__init__(queryset, title='absence_type_list')
+        super().__init__(self.get_export_queryset(queryset), title=self.title)
+
+    @staticmethod
+    def get_export_queryset(queryset):
+        return queryset
 
     @staticmethod
     def get_instance_data_row(instance: EmployeeAbsenceType):
@@ -82,16 +142,20 @@ class AbsenceTypeListViewDataSetGenerator(BaseDataSetGenerator):
 
 
 class GeneralAbsenceListViewDataSetGenerator(BaseDataSetGenerator):
+    title = 'general_absence_list'
+
     def __init__(self, queryset):
-        queryset = queryset.prefetch_related(
-            'department',
-            'submitted_by'
+        super().__init__(self.get_export_queryset(queryset), title=self.title)
+
+    @staticmethod
+    def get_export_queryset(queryset):
+        return queryset.select_related('submitted_by').prefetch_related(
+            Prefetch('department', queryset=Department.objects.order_by('name').only('id', 'name'))
         )
-        super().__init__(queryset, title='general_absence_list')
 
     @staticmethod
     def get_instance_data_row(instance: GeneralAbsence):
-        departments = ", ".join(instance.department.all().order_by('name').values_list('name', flat=True))
+        departments = ", ".join(department.name for department in instance.department.all())
         return [
             instance.subject,
             instance.body,
@@ -0,0 +1,122 @@
+"""
+Streaming exports of the list views.
+
+Rows are produced while the queryset is read with a server side cursor, so the memory of the
+worker stays the same whatever the number of rows. CSV is written to the response as it goes,
+an XLSX file can only be sent once complete and is spooled to a temporary file by the write
+only mode of openpyxl first. The same rows are written to a file by the background export jobs.
+"""
+import csv
+import io
+import tempfile
+from itertools import islice
+
+from django.http import StreamingHttpResponse, FileResponse
+from django.utils import timezone
+from django.utils.functional import Promise
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV = 'csv'
+XLSX = 'xlsx'
+
+
+def get_export_formats():
+    return (CSV, XLSX) if Workbook is not None else (CSV,)
+
+
+class Echo:
+    """File like object handing back what csv.writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def get_cell_value(value):
+    if value is None:
+        return ''
+    return str(value) if isinstance(value, Promise) else value
+
+
+def iter_chunked_instances(queryset, chunk_size):
+    """
+    Instances in the order of the queryset. The primary keys are read once with a cursor and the
+    instances are loaded by chunks of keys, which unlike iterator() keeps prefetch_related working
+    and unlike OFFSET paging neither skips nor repeats rows, nor reads again what it skipped.
+    """
+    pks = queryset.values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(pks, chunk_size))
+        if not chunk:
+            return
+        instances = queryset.order_by().in_bulk(chunk)
+        yield from (instances[pk] for pk in chunk if pk in instances)
+
+
+def iter_export_rows(generator_class, queryset, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    """
+    Rows from database tuples when the generator can shape them in SQL, from model instances otherwise.
+    progress is called with the number of data rows produced after every chunk.
+    """
+    yield [get_cell_value(value) for value in generator_class.get_header_row()]
+
+    if hasattr(generator_class, 'get_export_values'):
+        rows = generator_class.get_export_values(queryset).iterator(chunk_size=chunk_size)
+        get_data_row = generator_class.get_values_data_row
+    else:
+        rows = iter_chunked_instances(generator_class.get_export_queryset(queryset), chunk_size)
+        get_data_row = generator_class.get_instance_data_row
+
+    for done, row in enumerate(rows, 1):
+        yield [get_cell_value(value) for value in get_data_row(row)]
+        if progress is not None and done % chunk_size == 0:
+            progress(done)
+
+
+def write_xlsx(rows, file):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file)
+
+
+def write_csv(rows, file):
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    csv.writer(text).writerows(rows)
+    text.flush()
+    # leave the binary file open for the caller
+    text.detach()
+
+
+def write_export(rows, file_format, file):
+    if file_format == XLSX:
+        write_xlsx(rows, file)
+    else:
+        write_csv(rows, file)
+
+
+def get_export_filename(title, file_format):
+    return f'{title}_{timezone.localdate().strftime("%Y%m%d")}.{file_format}'
+
+
+def stream_export(generator_class, queryset, title, file_format=CSV):
+    rows = iter_export_rows(generator_class, queryset)
+    filename = get_export_filename(title, file_format)
+
+    if file_format == XLSX:
+        file = tempfile.TemporaryFile()
+        write_xlsx(rows, file)
+        file.seek(0)
+        return FileResponse(file, as_attachment=True, filename=filename,
+                            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse((writer.writerow(row) for row in rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,81 @@
+"""
+Daily number of absent people per department, expanded and counted in Postgres.
+
+Approved absences are matched against every local day of the window with generate_series,
+a day covered by a general absence of the department (or of the whole company) counts the
+full headcount of the department.
+"""
+from django.db import connection
+
+from absence.models import EmployeeAbsence, GeneralAbsence
+from account.models import Employee, Department
+from constants.db import ABSENCE_STATUS_CHOICES
+
+OCCUPANCY_SQL = '''
+WITH days AS (
+    SELECT d::date AS day,
+           d::date::timestamp AT TIME ZONE %(timezone)s AS day_start,
+           (d::date + 1)::timestamp AT TIME ZONE %(timezone)s AS day_end
+    FROM generate_series(%(start)s::date, %(end)s::date, interval '1 day') AS d
+), departments AS (
+    SELECT id FROM {department} WHERE company_id = %(company)s AND id = ANY(%(departments)s::uuid[])
+), personal AS (
+    SELECT e.{employee_department} AS department_id, days.day, count(DISTINCT a.submitted_for_id) AS absent
+    FROM {absence} a
+    JOIN {employee} e ON e.id = a.submitted_for_id
+    JOIN days ON a.start < days.day_end AND a."end" > days.day_start
+    WHERE a.company_id = %(company)s AND a.status = %(approved)s
+      AND a.start < (SELECT max(day_end) FROM days) AND a."end" > (SELECT min(day_start) FROM days)
+      AND e.{employee_department} IN (SELECT id FROM departments) AND NOT e.resigned
+    GROUP BY e.{employee_department}, days.day
+), general AS (
+    SELECT DISTINCT dep.id AS department_id, days.day
+    FROM {general_absence} g
+    LEFT JOIN {general_absence_department} gd ON gd.generalabsence_id = g.id
+    JOIN departments dep ON gd.department_id IS NULL OR gd.department_id = dep.id
+    JOIN days ON g.start < days.day_end AND g."end" > days.day_start
+    WHERE g.company_id = %(company)s AND g.status = %(approved)s AND g.deleted_at IS NULL
+      AND g.start < (SELECT max(day_end) FROM days) AND g."end" > (SELECT min(day_start) FROM days)
+), headcount AS (
+    SELECT {employee_department} AS department_id, count(*) AS employees
+    FROM {employee}
+    WHERE {employee_department} IN (SELECT id FROM departments) AND NOT resigned
+    GROUP BY {employee_department}
+)
+SELECT dep.id, coalesce(h.employees, 0),
+       array_agg(CASE WHEN g.day IS NULL THEN coalesce(p.absent, 0) ELSE coalesce(h.employees, 0) END
+                 ORDER BY days.day)
+FROM departments dep
+CROSS JOIN days
+LEFT JOIN personal p ON p.department_id = dep.id AND p.day = days.day
+LEFT JOIN general g ON g.department_id = dep.id AND g.day = days.day
+LEFT JOIN headcount h ON h.department_id = dep.id
+GROUP BY dep.id, h.employees
+'''
+
+
+def get_occupancy_sql():
+    return OCCUPANCY_SQL.format(
+        department=Department._meta.db_table,
+        employee=Employee._meta.db_table,
+        employee_department=Employee._meta.get_field('department').column,
+        absence=EmployeeAbsence._meta.db_table,
+        general_absence=GeneralAbsence._meta.db_table,
+        general_absence_department=GeneralAbsence.department.through._meta.db_table,
+    )
+
+
+def get_department_occupancy(company, departments, start, end, timezone_name):
+    """
+    Absent people per department for every day from start to end (both dates included),
+    as one row per department: id, headcount and the list of daily counts. Resigned
+    employees count in neither.
+    """
+    params = dict(company=company.pk, departments=list(departments), start=start, end=end,
+                  timezone=timezone_name, approved=ABSENCE_STATUS_CHOICES.APPROVED)
+
+    with connection.cursor() as cursor:
+        cursor.execute(get_occupancy_sql(), params)
+        rows = cursor.fetchall()
+
+    return [dict(department=pk, employees=employees, absent=absent) for pk, employees, absent in rows]
@@ -0,0 +1,152 @@
+"""
+Transactional outbox for the side effects of absences and schedules.
+
+Emails, pushes and Celery tasks are not fired from the request anymore, a message is written
+in the same transaction as the change instead. A rolled back transaction therefore leaves
+nothing behind and a slow broker only delays the relay, which drains the outbox in batches
+and hands every message to the handler registered for its topic. Handlers only enqueue
+Celery tasks, the emails and pushes are sent by the tasks.
+"""
+import datetime as dt
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from absence.models import OutboxMessage, OUTBOX_STATUS_CHOICES
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 30
+# a handled message keeps its idempotency key this long, the same event enqueued later is relayed again
+OUTBOX_RETENTION_DAYS = 7
+OUTBOX_PRUNE_BATCH_SIZE = 1000
+
+OUTBOX_HANDLERS = {}
+
+
+def register_outbox_handler(topic, handler):
+    OUTBOX_HANDLERS[topic] = handler
+
+
+def get_idempotency_key(topic, payload):
+    data = json.dumps(payload, sort_keys=True, cls=DjangoJSONEncoder)
+    return f'{topic}:{hashlib.sha256(data.encode()).hexdigest()}'
+
+
+def enqueue_outbox_message(topic, payload, idempotency_key=None):
+    """
+    Store the message within the current transaction, an already stored key is ignored.
+    With OUTBOX_RELAY_IN_PROCESS the outbox is drained right after the commit, which is meant for tests.
+    """
+    payload = json.loads(json.dumps(payload, cls=DjangoJSONEncoder))
+    message = OutboxMessage(topic=topic, payload=payload,
+                            idempotency_key=idempotency_key or get_idempotency_key(topic, payload))
+    OutboxMessage.objects.bulk_create([message], ignore_conflicts=True)
+
+    if getattr(settings, 'OUTBOX_RELAY_IN_PROCESS', False):
+        transaction.on_commit(relay_outbox)
+    return message
+
+
+def get_retry_delay(attempts):
+    return dt.timedelta(seconds=OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def handle_outbox_message(message, now):
+    try:
+        with transaction.atomic():
+            OUTBOX_HANDLERS[message.topic](message)
+    except Exception as e:
+        logger.exception('Outbox message %s (%s) failed', message.pk, message.topic)
+        message.attempts += 1
+        message.last_error = repr(e)
+        if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+            message.status = OUTBOX_STATUS_CHOICES.FAILED
+        else:
+            message.available_at = now + get_retry_delay(message.attempts)
+        return False
+
+    message.attempts += 1
+    message.status = OUTBOX_STATUS_CHOICES.DONE
+    message.processed_at = now
+    return True
+
+
+def claim_outbox_message(now):
+    qs = OutboxMessage.objects.select_for_update(skip_locked=True)
+    return qs.filter(status=OUTBOX_STATUS_CHOICES.PENDING, available_at__lte=now).order_by('available_at').first()
+
+
+def relay_outbox_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Handle one batch of due messages. Every message is locked, handled and marked in a transaction
+    of its own, so concurrent relays skip it and a relay dying halfway does not hand the messages
+    it already handled over again. Returns (handled, failed).
+    """
+    now = timezone.now()
+    results = []
+
+    for _i in range(batch_size):
+        with transaction.atomic():
+            message = claim_outbox_message(now)
+            if message is None:
+                break
+            results.append(handle_outbox_message(message, now))
+            message.save(update_fields=['status', 'attempts', 'available_at', 'processed_at', 'last_error'])
+    return results.count(True), results.count(False)
+
+
+def relay_outbox(batch_size=OUTBOX_BATCH_SIZE, max_batches=None):
+    """Drain the due messages and return the throughput metrics of the run."""
+    started = time.monotonic()
+    metrics = dict(batches=0, handled=0, failed=0)
+
+    while max_batches is None or metrics['batches'] < max_batches:
+        handled, failed = relay_outbox_batch(batch_size)
+        if not handled and not failed:
+            break
+        metrics['batches'] += 1
+        metrics['handled'] += handled
+        metrics['failed'] += failed
+
+    metrics['seconds'] = round(time.monotonic() - started, 3)
+    metrics['per_second'] = round(metrics['handled'] / metrics['seconds'], 1) if metrics['seconds'] else None
+    if metrics['batches']:
+        logger.info('Outbox relayed %(handled)s messages (%(failed)s failed) in %(batches)s batches, '
+                    '%(seconds)ss, %(per_second)s/s', metrics)
+    return metrics
+
+
+def prune_outbox(now=None):
+    """Delete the messages handled longer than OUTBOX_RETENTION_DAYS ago, in batches. Returns how many."""
+    now = now or timezone.now()
+    qs = OutboxMessage.objects.filter(status=OUTBOX_STATUS_CHOICES.DONE,
+                                      processed_at__lt=now - dt.timedelta(days=OUTBOX_RETENTION_DAYS))
+    deleted = 0
+    while True:
+        pks = list(qs.values_list('pk', flat=True)[:OUTBOX_PRUNE_BATCH_SIZE])
+        if not pks:
+            break
+        deleted += OutboxMessage.objects.filter(pk__in=pks).delete()[0]
+
+    if deleted:
+        logger.info('Outbox pruned %s handled messages', deleted)
+    return deleted
+
+
+def get_outbox_stats(now=None):
+    now = now or timezone.now()
+    pending = OutboxMessage.objects.filter(status=OUTBOX_STATUS_CHOICES.PENDING)
+    oldest = pending.aggregate(oldest=Min('created'))['oldest']
+    return dict(pending=pending.count(),
+                failed=OutboxMessage.objects.filter(status=OUTBOX_STATUS_CHOICES.FAILED).count(),
+                lag=(now - oldest).total_seconds() if oldest else 0)
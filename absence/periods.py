@@ -0,0 +1,85 @@
+"""
+Calendar period boundaries for the entitlement checks.
+
+Covers the subset of ``pandas.date_range`` the absence app needs (W-MON, MS, AS and A)
+with the standard library only: boundaries keep the time of day of the start and are
+stepped in the wall time of its timezone, like pandas does for timezone aware ranges.
+"""
+import datetime as dt
+
+WEEK_START = 'W-MON'
+MONTH_START = 'MS'
+YEAR_START = 'AS'
+YEAR_END = 'A'
+
+FREQUENCIES = (WEEK_START, MONTH_START, YEAR_START, YEAR_END)
+
+
+def is_on_offset(value, freq):
+    if freq == WEEK_START:
+        return value.weekday() == 0
+    if freq == MONTH_START:
+        return value.day == 1
+    if freq == YEAR_START:
+        return value.month == 1 and value.day == 1
+    if freq == YEAR_END:
+        return value.month == 12 and value.day == 31
+    raise ValueError(f'Unsupported frequency {freq}')
+
+
+def next_offset(value, freq):
+    """First boundary on a later day than value."""
+    if freq == WEEK_START:
+        return value + dt.timedelta(days=7 - value.weekday())
+    if freq == MONTH_START:
+        return (value.replace(day=1) + dt.timedelta(days=32)).replace(day=1)
+    if freq == YEAR_START:
+        return value.replace(year=value.year + 1, month=1, day=1)
+    if freq == YEAR_END:
+        if is_on_offset(value, freq):
+            return value.replace(year=value.year + 1)
+        return value.replace(month=12, day=31)
+    raise ValueError(f'Unsupported frequency {freq}')
+
+
+def roll_forward(value, freq):
+    return value if is_on_offset(value, freq) else next_offset(value, freq)
+
+
+def roll_back(value, freq):
+    if is_on_offset(value, freq):
+        return value
+    if freq == WEEK_START:
+        return value - dt.timedelta(days=value.weekday())
+    if freq == MONTH_START:
+        return value.replace(day=1)
+    if freq == YEAR_START:
+        return value.replace(month=1, day=1)
+    if freq == YEAR_END:
+        return value.replace(year=value.year - 1, month=12, day=31)
+    raise ValueError(f'Unsupported frequency {freq}')
+
+
+def localize(value, tzinfo):
+    if tzinfo is None:
+        return value
+    if hasattr(tzinfo, 'localize'):
+        # pytz zones need localize() to pick the offset of the new wall time
+        return tzinfo.localize(value)
+    return value.replace(tzinfo=tzinfo)
+
+
+def iter_date_range(start, end, freq):
+    tzinfo = getattr(start, 'tzinfo', None)
+    current = roll_forward(start.replace(tzinfo=None) if tzinfo is not None else start, freq)
+
+    while True:
+        value = localize(current, tzinfo)
+        if value > end:
+            return
+        yield value
+        current = next_offset(current, freq)
+
+
+def date_range(start, end, freq=WEEK_START):
+    return list(iter_date_range(start, end, freq))
@@ -1,7 +1,7 @@
 from rolepermissions.checkers import has_permission, has_object_permission
 from rolepermissions.permissions import register_object_checker
 
-from absence.models import EmployeeAbsence, GeneralAbsence, EmployeeAbsenceType
+from absence.models import EmployeeAbsence, GeneralAbsence, EmployeeAbsenceType, ExportJob
 from absence.permissions_utils import can_general_absence_retrieve, general_absence_for_employee, \
     general_absence_for_staff, can_general_absence_update, can_general_absence_delete, can_general_absence_restore
 from account.models import Employee
@@ -54,6 +54,8 @@ class EmployeeAbsencePermission(BasePermission):
             return has_permission(request.user, perms.absence.view)
         if view.action == 'retrieve' or view.action == 'detail_history':
             return has_permission(request.user, perms.absence.view)
+        if view.action in ('balances', 'calendar', 'calendar_feed_token', 'notification_settings', 'occupancy'):
+            return has_permission(request.user, perms.absence.view)
         if view.action == 'create':
             return has_permission(request.user, perms.absence.create)
         if view.action == 'destroy':
@@ -64,9 +66,9 @@ class EmployeeAbsencePermission(BasePermission):
             return has_permission(request.user, perms.absence.user_absences)
         if view.action == 'approvals':
             return has_permission(request.user, perms.absence.approvals)
-        if view.action == 'status':
+        if view.action in ('status', 'bulk_status'):
             return has_permission(request.user, perms.absence.status)
-        if view.action == 'export':
+        if view.action in ('export', 'export_stream', 'export_job'):
             return has_permission(request.user, perms.absence.export)
         if view.action == 'export_approvals':
             return has_permission(request.user, perms.absence.export_approvals)
@@ -77,7 +79,7 @@ class EmployeeAbsencePermission(BasePermission):
     def _has_object_permission(self, request, view, obj):
         if view.action in ('retrieve', 'detail_history', 'user_absences'):
             return has_object_permission('can_retrieve_absence', request.user, obj)
-        if view.action == 'status':
+        if view.action in ('status', 'bulk_status'):
             return has_object_permission('can_update_absence_status', request.user, obj)
         if view.action == 'destroy':
             return has_object_permission('can_delete_absence', request.user, obj)
@@ -111,7 +113,7 @@ class GeneralAbsencePermissions(BasePermission):
     def _has_permission(self, request, view):
         if view.action == 'list':
             return has_permission(request.user, perms.general_absence.list)
-        if view.action == 'retrieve':
+        if view.action in ('retrieve', 'delivery'):
             return has_permission(request.user, perms.general_absence.retrieve)
         if view.action == 'update':
             return has_permission(request.user, perms.general_absence.update)
@@ -123,15 +125,15 @@ class GeneralAbsencePermissions(BasePermission):
             return has_permission(request.user, perms.general_absence.restore)
         if view.action == 'archived':
             return has_permission(request.user, perms.general_absence.archived)
-        if view.action == 'export_archived':
+        if view.action in ('export_archived', 'export_archived_job'):
             return has_permission(request.user, perms.general_absence.export_archived)
-        if view.action == 'export':
+        if view.action in ('export', 'export_job'):
             return has_permission(request.user, perms.general_absence.export)
 
         raise NotImplementedError()
 
     def _has_object_permission(self, request, view, obj):
-        if view.action == 'retrieve':
+        if view.action in ('retrieve', 'delivery'):
             return has_object_permission('_can_retrieve_general_absence', request.user, obj)
         if view.action == 'update':
             return has_object_permission('_can_update_general_absence', request.user, obj)
@@ -182,9 +184,9 @@ class EmployeeAbsenceTypePermission(BasePermission):
             return has_permission(request.user, perms.absence_type.archived)
         if view.action == 'restore':
             return has_permission(request.user, perms.absence_type.restore)
-        if view.action == 'export':
+        if view.action in ('export', 'export_job'):
             return has_permission(request.user, perms.absence_type.export)
-        if view.action == 'export_archived':
+        if view.action in ('export_archived', 'export_archived_job'):
             return has_permission(request.user, perms.absence_type.export)
         if view.action == 'mark_todo_complete':
             return has_permission(request.user, perms.absence_type.todo_complete)
@@ -204,3 +206,23 @@ class EmployeeAbsenceTypePermission(BasePermission):
             return has_object_permission('can_mark_todo_complete', request.user, obj)
 
         raise NotImplementedError()
+
+
+@register_object_checker()
+def can_retrieve_export_job(_, user: Employee, obj: ExportJob):
+    return obj.requested_by_id == user.pk
+
+
+class ExportJobPermission(BasePermission):
+    def _has_permission(self, request, view):
+        # the export permission of the list was checked when the job was started
+        if view.action in ('retrieve', 'download'):
+            return True
+
+        raise NotImplementedError()
+
+    def _has_object_permission(self, request, view, obj):
+        if view.action in ('retrieve', 'download'):
+            return has_object_permission('can_retrieve_export_job', request.user, obj)
+
+        raise NotImplementedError()
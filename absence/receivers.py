@@ -1,7 +1,19 @@
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+
+from absence.balance import (get_stored_absence, sync_absence_balance, remove_absence_from_balance,
+                             rebuild_absence_type_balances)
+from absence.feeds import invalidate_calendar_feeds
+from absence.models import EmployeeAbsence, EmployeeAbsenceType, GeneralAbsence
+from absence.outbox import register_outbox_handler
 from absence.signals import general_absence_created, absence_created
-from absence.utils import create_default_absence_types, notify_subordinates_about_general_absence, \
-    notify_manger_about_absence_submission, notify_user_about_absence_submission_and_approved
+from absence.tasks import (dispatch_absence_notifications, dispatch_general_absence_published,
+                           relay_absence_notifications, relay_general_absence_published, relay_export_job,
+                           ABSENCE_SUBMITTED_TO_MANAGER, ABSENCE_SUBMITTED_FOR_USER,
+                           ABSENCE_NOTIFICATIONS_TOPIC, GENERAL_ABSENCE_PUBLISHED_TOPIC, EXPORT_JOB_TOPIC)
+from absence.utils import create_default_absence_types
 from account.signals import account_created
+from schedule.models import Schedule
+from shift.models import Shift
 
 
 def _account_created_receiver(**kwargs):
@@ -9,20 +21,112 @@ def _account_created_receiver(**kwargs):
 
 
 def _general_absence_created_receiver(**kwargs):
-    notify_subordinates_about_general_absence(kwargs['instance'])
+    dispatch_general_absence_published(kwargs['instance'])
 
 
 def _absence_created_receiver(**kwargs):
     instance = kwargs['instance']
 
+    notifications = []
+
     if instance.submitted_by==instance.submitted_for:
-        notify_manger_about_absence_submission(instance)
+        notifications.append((ABSENCE_SUBMITTED_TO_MANAGER, instance, None))
 
     if instance.submitted_by==instance.submitted_to:
-        notify_user_about_absence_submission_and_approved(instance)
+        notifications.append((ABSENCE_SUBMITTED_FOR_USER, instance, None))
+
+    dispatch_absence_notifications(notifications)
+
+
+def _absence_pre_save_receiver(**kwargs):
+    if not kwargs.get('raw'):
+        instance = kwargs['instance']
+        instance._stored_absence = get_stored_absence(instance)
+
+
+def _absence_post_save_receiver(**kwargs):
+    if not kwargs.get('raw'):
+        instance = kwargs['instance']
+        sync_absence_balance(instance, getattr(instance, '_stored_absence', None))
+        instance._stored_absence = None
+
+
+def _absence_post_delete_receiver(**kwargs):
+    remove_absence_from_balance(kwargs['instance'])
+
+
+def _absence_type_pre_save_receiver(**kwargs):
+    instance = kwargs['instance']
+    if not kwargs.get('raw') and not instance._state.adding:
+        stored = EmployeeAbsenceType.objects.filter(pk=instance.pk).values_list('period', flat=True).first()
+        instance._period_changed = stored is not None and stored != instance.period
+
+
+def _absence_type_post_save_receiver(**kwargs):
+    instance = kwargs['instance']
+    if getattr(instance, '_period_changed', False):
+        rebuild_absence_type_balances(instance)
+        instance._period_changed = False
+
+
+def _calendar_feed_absence_receiver(**kwargs):
+    invalidate_calendar_feeds(employee_ids=[kwargs['instance'].submitted_for_id])
+
+
+def _calendar_feed_company_receiver(**kwargs):
+    invalidate_calendar_feeds(company_ids=[kwargs['instance'].company_id])
+
+
+def _calendar_feed_shift_receiver(**kwargs):
+    # a new shift has nobody allocated yet
+    if not kwargs.get('raw') and not kwargs.get('created'):
+        employee_ids = kwargs['instance'].employees_allocated.values_list('id', flat=True)
+        invalidate_calendar_feeds(employee_ids=list(employee_ids))
+
+
+def _calendar_feed_allocation_receiver(**kwargs):
+    action, instance = kwargs['action'], kwargs['instance']
+
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        if kwargs['reverse']:
+            employee_ids = [instance.pk]
+        elif action == 'pre_clear':
+            employee_ids = list(instance.employees_allocated.values_list('id', flat=True))
+        else:
+            employee_ids = kwargs['pk_set']
+        invalidate_calendar_feeds(employee_ids=employee_ids)
 
 
 def connect():
+    register_outbox_handler(ABSENCE_NOTIFICATIONS_TOPIC, relay_absence_notifications)
+    register_outbox_handler(GENERAL_ABSENCE_PUBLISHED_TOPIC, relay_general_absence_published)
+    register_outbox_handler(EXPORT_JOB_TOPIC, relay_export_job)
     account_created.connect(_account_created_receiver, dispatch_uid='absence_account_created_receiver')
     general_absence_created.connect(_general_absence_created_receiver, dispatch_uid='general_absence_created_receiver')
     absence_created.connect(_absence_created_receiver, dispatch_uid='absence_created_receiver')
+    pre_save.connect(_absence_pre_save_receiver, sender=EmployeeAbsence,
+                     dispatch_uid='absence_balance_pre_save_receiver')
+    post_save.connect(_absence_post_save_receiver, sender=EmployeeAbsence,
+                      dispatch_uid='absence_balance_post_save_receiver')
+    post_delete.connect(_absence_post_delete_receiver, sender=EmployeeAbsence,
+                        dispatch_uid='absence_balance_post_delete_receiver')
+    pre_save.connect(_absence_type_pre_save_receiver, sender=EmployeeAbsenceType,
+                     dispatch_uid='absence_balance_absence_type_pre_save_receiver')
+    post_save.connect(_absence_type_post_save_receiver, sender=EmployeeAbsenceType,
+                      dispatch_uid='absence_balance_absence_type_post_save_receiver')
+    post_save.connect(_calendar_feed_absence_receiver, sender=EmployeeAbsence,
+                      dispatch_uid='calendar_feed_absence_post_save_receiver')
+    post_delete.connect(_calendar_feed_absence_receiver, sender=EmployeeAbsence,
+                        dispatch_uid='calendar_feed_absence_post_delete_receiver')
+    post_save.connect(_calendar_feed_company_receiver, sender=GeneralAbsence,
+                      dispatch_uid='calendar_feed_general_absence_post_save_receiver')
+    post_delete.connect(_calendar_feed_company_receiver, sender=GeneralAbsence,
+                        dispatch_uid='calendar_feed_general_absence_post_delete_receiver')
+    post_save.connect(_calendar_feed_company_receiver, sender=Schedule,
+                      dispatch_uid='calendar_feed_schedule_post_save_receiver')
+    post_save.connect(_calendar_feed_shift_receiver, sender=Shift,
+                      dispatch_uid='calendar_feed_shift_post_save_receiver')
+    pre_delete.connect(_calendar_feed_shift_receiver, sender=Shift,
+                       dispatch_uid='calendar_feed_shift_pre_delete_receiver')
+    m2m_changed.connect(_calendar_feed_allocation_receiver, sender=Shift.employees_allocated.through,
+                        dispatch_uid='calendar_feed_allocation_receiver')
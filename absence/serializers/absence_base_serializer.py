@@ -27,6 +27,9 @@ class BaseAbsenceSerializer(serializers.ModelSerializer):
         qs = get_overlap_absences(start, end, submitted_for)
         if qs.exists():
             absence = qs.aggregate(latest_date=Max('end'), earliest_date=Min('start'))
+            # absences without end are open ended and clash at least up to the requested end
+            if absence['latest_date'] is None:
+                absence['latest_date'] = end
 
             if absence_duration==DURATION.HOURLY:
                 start = formatted_datetime(absence['earliest_date'])
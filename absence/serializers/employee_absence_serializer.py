@@ -1,15 +1,22 @@
 import logging
 from datetime import timedelta
 
+from django.db import transaction, IntegrityError
+from django.db.models.signals import post_save
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
-from absence.models import EmployeeAbsence, EmployeeAbsenceComment
+from absence.balance import get_absence_balance_deltas, apply_absence_balance_deltas
+from absence.models import (EmployeeAbsence, EmployeeAbsenceComment, AbsenceNotificationSetting,
+                            ABSENCE_OVERLAP_CONSTRAINT)
 from absence.serializers.absence_base_serializer import BaseAbsenceSerializer
 from absence.serializers.absence_type_serializer import EmployeeAbsenceTypeAsChoiceSerializer
 from absence.signals import absence_created
+from absence.tasks import dispatch_absence_notifications, ABSENCE_STATUS_UPDATED
 from absence.utils import (get_leaves_duration,
-                           notify_subordinate_about_absence_status_updated,
+                           get_entitlement_overflows,
+                           get_absences_with_shift_overlap,
                            get_leaves_duration_string,
                            get_entitlement_overflow_interval_week,
                            get_entitlement_overflow_interval_month,
@@ -21,6 +28,21 @@ from employee_shift.utils import is_employee_shift_exist_for_employee
 
 logger = logging.getLogger(__name__)
 
+ENTITLEMENT_PERIOD_LABELS = {
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK: 'WEEK',
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH: 'MONTH',
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_YEAR: 'YEAR',
+}
+
+
+def get_entitlement_overflow_message(res, label, absence_type):
+    consumed = res.get('consumed')
+    start = res.get('start')
+    end = res.get('end')
+
+    return _(f'ALREADY_HAVE_AVAILED_{consumed}_ABSENCES_FOR_{label}_FROM_{start}_TO_{end}.'
+             f'MAXIMUM_ENTITLEMENT_FOR_THIS_{label}_IS_{absence_type.entitlement}')
+
 
 
 class EmployeeAbsenceCommentSerializer(serializers.ModelSerializer):
@@ -89,12 +111,22 @@ class EmployeeAbsenceCreateSerializer(BaseAbsenceSerializer):
         validated_data.pop('ignore_shift_overlap', False)
         validated_data.pop('absence_duration', False)
         comment = validated_data.pop('comment', None)
-        instance = super(EmployeeAbsenceCreateSerializer, self).create(validated_data)
+        instance = self.create_absence(validated_data)
         self.create_comment(instance, comment)
         absence_created.send(sender=self.__class__, instance=instance)
 
         return instance
 
+    def create_absence(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super(EmployeeAbsenceCreateSerializer, self).create(validated_data)
+        except IntegrityError as e:
+            # a concurrent request got the same dates through validation first
+            if ABSENCE_OVERLAP_CONSTRAINT in str(e):
+                self.validate_overlap(validated_data)
+            raise
+
     def create_comment(self, instance, comment):
         user = self.get_request_user()
         EmployeeAbsenceComment.objects.create(absence=instance,
@@ -163,34 +195,120 @@ class EmployeeAbsenceStatusUpdateSerializer(serializers.ModelSerializer):
                                                      commented_by=self.context.get('request').user)
 
     def send_notifications(self, comment):
-        notify_subordinate_about_absence_status_updated(self.instance, comment)
+        dispatch_absence_notifications([(ABSENCE_STATUS_UPDATED, self.instance, comment)])
 
     def validate_balance_per_week(self):
         res = get_entitlement_overflow_interval_week(self.instance)
         if res is not None:
-            consumed = res.get('consumed')
-            start = res.get('start')
-            end = res.get('end')
-
-            raise serializers.ValidationError(_(
-                f'ALREADY_HAVE_AVAILED_{consumed}_ABSENCES_FOR_WEEK_FROM_{start}_TO_{end}.MAXIMUM_ENTITLEMENT_FOR_THIS_WEEK_IS_{self.instance.absence_type.entitlement}'))
+            raise serializers.ValidationError(get_entitlement_overflow_message(res, 'WEEK', self.instance.absence_type))
 
     def validate_balance_per_month(self):
         res = get_entitlement_overflow_interval_month(self.instance)
         if res is not None:
-            consumed = res.get('consumed')
-            start = res.get('start')
-            end = res.get('end')
-
-            raise serializers.ValidationError(_(
-                f'ALREADY_HAVE_AVAILED_{consumed}_ABSENCES_FOR_MONTH_FROM_{start}_TO_{end}.MAXIMUM_ENTITLEMENT_FOR_THIS_MONTH_IS_{self.instance.absence_type.entitlement}'))
+            raise serializers.ValidationError(get_entitlement_overflow_message(res, 'MONTH', self.instance.absence_type))
 
     def validate_balance_per_year(self):
         res = get_entitlement_overflow_interval_year(self.instance)
         if res is not None:
-            consumed = res.get('consumed')
-            start = res.get('start')
-            end = res.get('end')
+            raise serializers.ValidationError(get_entitlement_overflow_message(res, 'YEAR', self.instance.absence_type))
+
+
+class EmployeeAbsenceBulkStatusUpdateSerializer(serializers.Serializer):
+    absences = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=500)
+    status = serializers.ChoiceField(choices=ABSENCE_STATUS_CHOICES)
+    comment = serializers.CharField(required=False, allow_blank=True)
+    ignore_shift_overlap = serializers.BooleanField(default=False)
+
+    def get_request_user(self):
+        return self.context.get('request').user
+
+    def get_absences(self, absence_ids):
+        user = self.get_request_user()
+        qs = EmployeeAbsence.objects.filter(company=user.company, pk__in=absence_ids)
+        qs = qs.select_related('absence_type', 'submitted_for', 'submitted_by', 'submitted_to')
+        return list(qs)
+
+    def validate_absences(self, absences):
+        # the view loads the absences already to check the permissions on every one of them
+        instances = self.context.get('absences')
+        if instances is None:
+            instances = self.get_absences(absences)
+
+        if len(instances) != len(set(absences)):
+            raise serializers.ValidationError(_('ABSENCE_NOT_FOUND'))
+        return instances
+
+    def validate(self, data):
+        self.validate_shift_overlap(data)
+        self.validate_balance(data)
+        return data
+
+    @staticmethod
+    def validate_shift_overlap(data):
+        ignore_shift_overlap = data.pop('ignore_shift_overlap', False)
+
+        if data.get('status') == ABSENCE_STATUS_CHOICES.APPROVED and not ignore_shift_overlap:
+            overlapping = get_absences_with_shift_overlap(data.get('absences'))
+            if overlapping:
+                raise serializers.ValidationError({
+                    'ignore_shift_overlap': _('EMPLOYEE_SHIFT_EXIST_FOR_THIS_DURATION.ARE_YOU_STILL_WANT_TO_APPROVE_ABSENCE'),
+                    'absences': [str(a.pk) for a in overlapping]
+                })
+
+    @staticmethod
+    def validate_balance(data):
+        if data.get('status') != ABSENCE_STATUS_CHOICES.APPROVED:
+            return
+
+        absences = {a.pk: a for a in data.get('absences')}
+        overflows = get_entitlement_overflows(absences.values())
+        if overflows:
+            raise serializers.ValidationError({
+                str(pk): get_entitlement_overflow_message(res, ENTITLEMENT_PERIOD_LABELS[absences[pk].absence_type.period],
+                                                          absences[pk].absence_type)
+                for pk, res in overflows.items()
+            })
+
+    @transaction.atomic
+    def create(self, validated_data):
+        user = self.get_request_user()
+        absences = validated_data.get('absences')
+        status = validated_data.get('status')
+        comment = validated_data.get('comment')
+
+        changed = [a for a in absences if a.status != status]
+        deltas = get_absence_balance_deltas(changed, -1)
+        modified = timezone.now()
 
-            raise serializers.ValidationError(_(
-                f'ALREADY_HAVE_AVAILED_{consumed}_ABSENCES_FOR_YEAR_FROM_{start}_TO_{end}.MAXIMUM_ENTITLEMENT_FOR_THIS_YEAR_IS_{self.instance.absence_type.entitlement}'))
+        EmployeeAbsence.objects.filter(pk__in=[a.pk for a in changed]).update(status=status, modified=modified)
+        for absence in changed:
+            absence.status = status
+            absence.modified = modified
+        apply_absence_balance_deltas(get_absence_balance_deltas(changed, 1, deltas))
+
+        # update() sends no signal, the history and the calendar feeds listen to post_save. The stored state is the
+        # saved one so the balance receiver leaves the ledger alone, it was moved for the whole batch above.
+        for absence in changed:
+            absence._stored_absence = absence
+            post_save.send(sender=EmployeeAbsence, instance=absence, created=False, raw=False,
+                           using=EmployeeAbsence.objects.db, update_fields=frozenset(['status', 'modified']))
+
+        comments = EmployeeAbsenceComment.objects.bulk_create([
+            EmployeeAbsenceComment(absence=a, comment=comment, status=status, commented_by=user) for a in absences
+        ])
+
+        comments = {c.absence_id: c for c in comments}
+        dispatch_absence_notifications([(ABSENCE_STATUS_UPDATED, a, comments[a.pk]) for a in changed])
+
+        return absences
+
+    def to_representation(self, instance):
+        return {'absences': [str(a.pk) for a in instance], 'status': self.validated_data.get('status')}
+
+
+class AbsenceNotificationSettingSerializer(serializers.ModelSerializer):
+    digest_interval = serializers.IntegerField(min_value=1, max_value=7 * 24, required=False)
+
+    class Meta:
+        model = AbsenceNotificationSetting
+        fields = ('digest', 'digest_interval')
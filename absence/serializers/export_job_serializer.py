@@ -0,0 +1,37 @@
+from django.urls import reverse
+from rest_framework import serializers
+
+from absence.models import ExportJob, EXPORT_JOB_STATUS_CHOICES
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField(read_only=True)
+    download_url = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = ExportJob
+        fields = ('id',
+                  'file_format',
+                  'status',
+                  'rows_total',
+                  'rows_done',
+                  'progress',
+                  'download_url',
+                  'created',
+                  )
+        read_only_fields = fields
+
+    @staticmethod
+    def get_progress(obj):
+        if obj.status == EXPORT_JOB_STATUS_CHOICES.DONE:
+            return 100
+        if not obj.rows_total:
+            return 0
+        return min(100, obj.rows_done * 100 // obj.rows_total)
+
+    def get_download_url(self, obj):
+        if obj.status != EXPORT_JOB_STATUS_CHOICES.DONE:
+            return None
+        url = reverse('export_job-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
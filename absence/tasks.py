@@ -1,8 +1,229 @@
-# from celery import shared_task
-#
-# from absence.models import EmployeeAbsence
-#
-#
+import datetime as dt
+import logging
+from collections import defaultdict
+
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone, translation
+
+from absence import emails
+from absence.delivery import (iter_language_chunks, set_delivery_progress, DELIVERY_CHUNK_SIZE,
+                              DELIVERY_QUEUED, DELIVERY_RUNNING, DELIVERY_DONE)
+from absence.exports import run_export_job
+from absence.models import (EmployeeAbsence, EmployeeAbsenceComment, GeneralAbsence, AbsenceNotificationSetting,
+                            AbsenceDigestItem, ExportJob, EXPORT_JOB_STATUS_CHOICES)
+from absence.outbox import enqueue_outbox_message, relay_outbox, prune_outbox
+from absence.utils import (can_be_notify, get_general_absence_audience, notify_subordinates_about_general_absence,
+                           notify_manger_about_absence_submission,
+                           notify_user_about_absence_submission_and_approved,
+                           notify_subordinate_about_absence_status_updated)
+from account.models import Employee
+from constants.db import ABSENCE_STATUS_CHOICES
+from core import verbs
+from notification.utils import push_notification
+
+logger = logging.getLogger(__name__)
+
+ABSENCE_SUBMITTED_TO_MANAGER = 'submitted_to_manager'
+ABSENCE_SUBMITTED_FOR_USER = 'submitted_for_user'
+ABSENCE_STATUS_UPDATED = 'status_updated'
+
+ABSENCE_NOTIFICATIONS_TOPIC = 'absence.notifications'
+GENERAL_ABSENCE_PUBLISHED_TOPIC = 'general_absence.published'
+EXPORT_JOB_TOPIC = 'export_job.created'
+
+NOTIFICATION_RECIPIENTS = {
+    ABSENCE_SUBMITTED_TO_MANAGER: 'submitted_to_id',
+    ABSENCE_SUBMITTED_FOR_USER: 'submitted_for_id',
+    ABSENCE_STATUS_UPDATED: 'submitted_for_id',
+}
+
+NOTIFICATION_VERBS = {
+    ABSENCE_SUBMITTED_TO_MANAGER: verbs.ABSENCE_SUBMITTED_TO_STAFFER,
+    ABSENCE_SUBMITTED_FOR_USER: verbs.ABSENCE_SUBMITTED_FOR_USER,
+    ABSENCE_STATUS_UPDATED: verbs.ABSENCE_STATUS_UPDATED,
+}
+
+
+def send_absence_notification(kind, absence, comment=None):
+    if kind == ABSENCE_SUBMITTED_TO_MANAGER:
+        notify_manger_about_absence_submission(absence)
+    elif kind == ABSENCE_SUBMITTED_FOR_USER:
+        notify_user_about_absence_submission_and_approved(absence)
+    elif kind == ABSENCE_STATUS_UPDATED:
+        notify_subordinate_about_absence_status_updated(absence, comment)
+
+
+def queue_absence_digest(recipient_id, notifications):
+    """Push at once but leave the email to the next digest of the recipient."""
+    items = []
+    for kind, absence, comment in notifications:
+        push_notification(NOTIFICATION_VERBS[kind], recipient_id, absence)
+        items.append(AbsenceDigestItem(recipient_id=recipient_id, kind=kind, absence=absence, comment=comment))
+    AbsenceDigestItem.objects.bulk_create(items)
+
+
+@shared_task()
+def task_notify_absences(recipient_id, notifications):
+    """
+    Send the [kind, absence id, comment id] notifications of one recipient,
+    the absences and comments being read with one query each.
+    """
+    absences = EmployeeAbsence.objects.select_related('submitted_for', 'submitted_by', 'submitted_to')
+    absences = {str(pk): a for pk, a in absences.in_bulk({a for _k, a, _c in notifications}).items()}
+
+    comments = EmployeeAbsenceComment.objects.select_related('commented_by')
+    comments = {str(pk): c for pk, c in comments.in_bulk({c for _k, _a, c in notifications if c}).items()}
+
+    # the absence may have been deleted meanwhile
+    notifications = [(kind, absences[absence_id], comments.get(comment_id))
+                     for kind, absence_id, comment_id in notifications if absence_id in absences]
+
+    if AbsenceNotificationSetting.objects.filter(employee_id=recipient_id, digest=True).exists():
+        queue_absence_digest(recipient_id, notifications)
+        return
+
+    for kind, absence, comment in notifications:
+        send_absence_notification(kind, absence, comment)
+
+
+def is_digest_due(recipient, oldest, now):
+    setting = getattr(recipient, 'absence_notification_setting', None)
+    if setting is None or not setting.digest:
+        return True
+    return oldest <= now - dt.timedelta(hours=setting.digest_interval)
+
+
+def get_due_digest_recipients(now):
+    oldest = dict(AbsenceDigestItem.objects.order_by().values_list('recipient_id').annotate(oldest=Min('created')))
+    recipients = Employee.objects.select_related('absence_notification_setting').in_bulk(oldest)
+    return [recipient for pk, recipient in recipients.items() if is_digest_due(recipient, oldest[pk], now)]
+
+
+def claim_absence_digest(recipient):
+    """Take the queued items of the recipient out of the queue, the items locked by a concurrent run are skipped."""
+    with transaction.atomic():
+        items = AbsenceDigestItem.objects.select_for_update(skip_locked=True, of=('self',))
+        items = items.select_related('absence', 'absence__submitted_for')
+        items = list(items.filter(recipient=recipient).order_by('created'))
+        AbsenceDigestItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+    return items
+
+
+@shared_task()
+def task_send_absence_digests():
+    """
+    Coalesce the queued absence notifications into one email per recipient whose oldest
+    item is older than the digest interval. Run it every few minutes from the beat schedule.
+    The email is sent once the items are claimed, outside of any transaction.
+    """
+    sent = 0
+    for recipient in get_due_digest_recipients(timezone.now()):
+        items = claim_absence_digest(recipient)
+        if not items:
+            continue
+
+        try:
+            emails.AbsenceDigest(recipient, items).send()
+        except Exception:
+            logger.exception('Absence digest of %s failed', recipient.pk)
+            # queued again for the next run
+            AbsenceDigestItem.objects.bulk_create(items)
+            continue
+        sent += len(items)
+    return sent
+
+
+def dispatch_absence_notifications(notifications):
+    """
+    Queue (kind, absence, comment) notifications in the outbox of the current transaction,
+    with one task per recipient so a bulk change does not enqueue a task per absence.
+    """
+    batches = defaultdict(list)
+    for kind, absence, comment in notifications:
+        if can_be_notify(absence):
+            recipient_id = getattr(absence, NOTIFICATION_RECIPIENTS[kind])
+            batches[recipient_id].append([kind, str(absence.pk), str(comment.pk) if comment is not None else None])
+
+    for recipient_id, batch in batches.items():
+        enqueue_outbox_message(ABSENCE_NOTIFICATIONS_TOPIC, dict(recipient_id=str(recipient_id), notifications=batch))
+
+
+def relay_absence_notifications(message):
+    payload = message.payload
+    task_notify_absences.apply_async(args=[payload['recipient_id'], payload['notifications']], task_id=str(message.pk))
+
+
+@shared_task()
+def task_send_general_absence_published(absence_id):
+    absence = GeneralAbsence.objects.select_related('submitted_by').filter(pk=absence_id).first()
+    if absence is None:
+        return
+
+    notify_subordinates_about_general_absence(absence)
+
+    audience = get_general_absence_audience(absence)
+    total = audience.count()
+    set_delivery_progress(absence_id, DELIVERY_RUNNING, total)
+
+    sent, contexts = 0, {}
+    for language, chunk in iter_language_chunks(audience, DELIVERY_CHUNK_SIZE):
+        if language not in contexts:
+            with translation.override(language):
+                contexts[language] = emails.GeneralAbsencePublished(absence=absence, iterable=[]).get_context()
+
+        # MakeEmail of the mail app opens its SMTP connection itself, its send() takes no connection to share
+        emails.GeneralAbsencePublished(absence=absence, iterable=chunk, context=contexts[language]).send()
+        sent += len(chunk)
+        set_delivery_progress(absence_id, DELIVERY_RUNNING, total, sent)
+
+    set_delivery_progress(absence_id, DELIVERY_DONE, total, sent)
+
+
+def dispatch_general_absence_published(instance):
+    if instance.status != ABSENCE_STATUS_CHOICES.APPROVED:
+        return
+
+    absence_id = str(instance.pk)
+    set_delivery_progress(absence_id, DELIVERY_QUEUED)
+    enqueue_outbox_message(GENERAL_ABSENCE_PUBLISHED_TOPIC, dict(absence_id=absence_id),
+                           idempotency_key=f'{GENERAL_ABSENCE_PUBLISHED_TOPIC}:{absence_id}')
+
+
+def relay_general_absence_published(message):
+    task_send_general_absence_published.apply_async(args=[message.payload['absence_id']], task_id=str(message.pk))
+
+
+@shared_task()
+def task_run_export_job(job_id):
+    # a redelivered task finds the job already started
+    job = ExportJob.objects.select_related('requested_by').filter(pk=job_id,
+                                                                  status=EXPORT_JOB_STATUS_CHOICES.PENDING).first()
+    if job is not None:
+        run_export_job(job)
+
+
+def dispatch_export_job(job):
+    enqueue_outbox_message(EXPORT_JOB_TOPIC, dict(job_id=str(job.pk)), idempotency_key=f'{EXPORT_JOB_TOPIC}:{job.pk}')
+
+
+def relay_export_job(message):
+    task_run_export_job.apply_async(args=[message.payload['job_id']], task_id=str(message.pk))
+
+
+@shared_task()
+def task_relay_outbox():
+    """Run it every few seconds from the beat schedule, or use the relay_outbox command."""
+    return relay_outbox()
+
+
+@shared_task()
+def task_prune_outbox():
+    """Run it daily from the beat schedule, the handled messages are deleted after OUTBOX_RETENTION_DAYS."""
+    return prune_outbox()
+
+
 # @shared_task()
 # def assign_absences_to_given_manager(employee_id, assign_absences_to):
 #     EmployeeAbsence.objects.filter(
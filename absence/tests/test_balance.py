@@ -0,0 +1,151 @@
+import datetime as dt
+from io import StringIO
+from unittest.mock import Mock
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+from django.utils import timezone
+from model_bakery import baker
+
+from absence.balance import (get_absence_periods, get_absence_balance, get_period_start,
+                             rebuild_company_balances, check_company_balances)
+from absence.models import AbsenceBalance, EmployeeAbsence, EmployeeAbsenceType
+from absence.utils import create_shift_absence
+from account.models import Company, Employee
+from constants.db import ABSENCE_ENTITLEMENT_PERIOD_CHOICE, ABSENCE_STATUS_CHOICES, DURATION
+
+
+class TestAbsenceBalance(TestCase):
+
+    def setUp(self):
+        self.company = baker.make(Company)
+        self.employee = baker.make(Employee, company=self.company)
+        self.absence_type = baker.make(EmployeeAbsenceType, company=self.company, entitlement=10,
+                                       period=ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH)
+
+    def make_absence(self, start, end, status=ABSENCE_STATUS_CHOICES.APPROVED):
+        return baker.make(EmployeeAbsence, company=self.company, submitted_for=self.employee,
+                          absence_type=self.absence_type, status=status,
+                          start=timezone.make_aware(start), end=timezone.make_aware(end))
+
+    def get_balance(self, period_start):
+        return get_absence_balance(self.employee, self.absence_type, period_start)
+
+    def test_get_period_start(self):
+        date = timezone.make_aware(dt.datetime(2020, 5, 14, 10, 0))
+        self.assertEqual(get_period_start(date, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK), dt.date(2020, 5, 11))
+        self.assertEqual(get_period_start(date, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH), dt.date(2020, 5, 1))
+        self.assertEqual(get_period_start(date, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_YEAR), dt.date(2020, 1, 1))
+
+    def test_get_absence_periods(self):
+        start = timezone.make_aware(dt.datetime(2020, 5, 30))
+        end = timezone.make_aware(dt.datetime(2020, 6, 20))
+
+        res = get_absence_periods(start, end, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH)
+        self.assertEqual(res, [(dt.date(2020, 5, 1), 2), (dt.date(2020, 6, 1), 19)])
+
+        res = get_absence_periods(start, end, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK)
+        self.assertEqual(res, [(dt.date(2020, 5, 25), 2), (dt.date(2020, 6, 1), 7),
+                               (dt.date(2020, 6, 8), 7), (dt.date(2020, 6, 15), 5)])
+
+        self.assertEqual(get_absence_periods(start, None, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH), [])
+        self.assertEqual(get_absence_periods(end, start, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH), [])
+
+    def test_get_absence_periods_not_at_midnight(self):
+        start = timezone.make_aware(dt.datetime(2020, 5, 30, 12, 0))
+        end = timezone.make_aware(dt.datetime(2020, 6, 2, 12, 0))
+
+        res = get_absence_periods(start, end, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH)
+        self.assertEqual(res, [(dt.date(2020, 5, 1), 2), (dt.date(2020, 6, 1), 1)])
+
+        end = timezone.make_aware(dt.datetime(2020, 6, 2, 9, 0))
+        res = get_absence_periods(start, end, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH)
+        self.assertEqual(res, [(dt.date(2020, 5, 1), 2), (dt.date(2020, 6, 1), 0)])
+
+    def test_balance_follows_absence_changes(self):
+        absence = self.make_absence(dt.datetime(2020, 5, 30), dt.datetime(2020, 6, 3),
+                                    status=ABSENCE_STATUS_CHOICES.PENDING)
+        self.assertEqual(self.get_balance(dt.date(2020, 5, 1)), 0)
+
+        absence.status = ABSENCE_STATUS_CHOICES.APPROVED
+        absence.save()
+        self.assertEqual(self.get_balance(dt.date(2020, 5, 1)), 2)
+        self.assertEqual(self.get_balance(dt.date(2020, 6, 1)), 2)
+
+        absence.end = timezone.make_aware(dt.datetime(2020, 6, 5))
+        absence.save()
+        self.assertEqual(self.get_balance(dt.date(2020, 5, 1)), 2)
+        self.assertEqual(self.get_balance(dt.date(2020, 6, 1)), 4)
+
+        absence.status = ABSENCE_STATUS_CHOICES.REJECTED
+        absence.save()
+        self.assertEqual(self.get_balance(dt.date(2020, 5, 1)), 0)
+        self.assertEqual(self.get_balance(dt.date(2020, 6, 1)), 0)
+
+        absence.status = ABSENCE_STATUS_CHOICES.APPROVED
+        absence.save()
+        absence.delete()
+        self.assertEqual(self.get_balance(dt.date(2020, 5, 1)), 0)
+        self.assertEqual(self.get_balance(dt.date(2020, 6, 1)), 0)
+
+    def test_create_shift_absence(self):
+        shift_absence_type = baker.make(EmployeeAbsenceType, company=self.company, duration=DURATION.SHIFT,
+                                        period=ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_YEAR)
+        employee_shift = Mock(employee=self.employee,
+                              shift=Mock(start=timezone.make_aware(dt.datetime(2020, 5, 4)),
+                                         end=timezone.make_aware(dt.datetime(2020, 5, 5))))
+        manager = baker.make(Employee, company=self.company)
+
+        create_shift_absence(employee_shift, manager)
+
+        self.assertEqual(get_absence_balance(self.employee, shift_absence_type, dt.date(2020, 1, 1)), 1)
+
+    def test_rebuild_and_check_company_balances(self):
+        self.make_absence(dt.datetime(2020, 5, 12), dt.datetime(2020, 5, 15))
+        self.make_absence(dt.datetime(2020, 5, 30), dt.datetime(2020, 6, 3))
+        self.make_absence(dt.datetime(2020, 6, 10), dt.datetime(2020, 6, 12), status=ABSENCE_STATUS_CHOICES.PENDING)
+
+        self.assertEqual(check_company_balances(self.company), [])
+
+        AbsenceBalance.objects.filter(period_start=dt.date(2020, 5, 1)).update(consumed=1)
+        res = check_company_balances(self.company)
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['stored'], 1)
+        self.assertEqual(res[0]['expected'], 5)
+
+        self.assertEqual(rebuild_company_balances(self.company), 2)
+        self.assertEqual(check_company_balances(self.company), [])
+        self.assertEqual(self.get_balance(dt.date(2020, 5, 1)), 5)
+        self.assertEqual(self.get_balance(dt.date(2020, 6, 1)), 2)
+
+    def test_rebuild_absence_balances_command(self):
+        self.make_absence(dt.datetime(2020, 5, 12), dt.datetime(2020, 5, 15))
+        AbsenceBalance.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_absence_balances', str(self.company.pk), '--check', stdout=StringIO())
+
+        call_command('rebuild_absence_balances', str(self.company.pk), stdout=StringIO())
+        call_command('rebuild_absence_balances', str(self.company.pk), '--check', stdout=StringIO())
+        self.assertEqual(self.get_balance(dt.date(2020, 5, 1)), 3)
+
+    def test_period_change_rebuilds_absence_type_balances(self):
+        self.make_absence(dt.datetime(2020, 5, 30), dt.datetime(2020, 6, 3))
+        other_type = baker.make(EmployeeAbsenceType, company=self.company,
+                                period=ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH)
+        baker.make(EmployeeAbsence, company=self.company, submitted_for=self.employee, absence_type=other_type,
+                   status=ABSENCE_STATUS_CHOICES.APPROVED, start=timezone.make_aware(dt.datetime(2020, 5, 4)),
+                   end=timezone.make_aware(dt.datetime(2020, 5, 6)))
+
+        self.absence_type.name = 'renamed'
+        self.absence_type.save()
+        self.assertEqual(self.get_balance(dt.date(2020, 5, 1)), 2)
+
+        self.absence_type.period = ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_YEAR
+        self.absence_type.save()
+
+        self.assertEqual(self.get_balance(dt.date(2020, 1, 1)), 4)
+        self.assertFalse(AbsenceBalance.objects.filter(absence_type=self.absence_type,
+                                                       period_start=dt.date(2020, 5, 1)).exists())
+        self.assertEqual(get_absence_balance(self.employee, other_type, dt.date(2020, 5, 1)), 2)
+        self.assertEqual(check_company_balances(self.company), [])
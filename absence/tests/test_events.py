@@ -0,0 +1,41 @@
+import datetime as dt
+import json
+
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+from model_bakery import baker
+
+from absence.events import stream_events, format_datetime, ABSENCE_EVENT_FIELDS, GENERAL_ABSENCE_EVENT_FIELDS
+from absence.models import EmployeeAbsence, EmployeeAbsenceType, GeneralAbsence
+from constants.db import DURATION
+
+
+class TestEvents(TestCase):
+
+    def test_format_datetime(self):
+        self.assertEqual(format_datetime(None), None)
+        value = timezone.make_aware(dt.datetime(2020, 5, 1, 8, 30), timezone.utc)
+        self.assertEqual(format_datetime(value), timezone.localtime(value).isoformat().replace('+00:00', 'Z'))
+
+    def test_stream_events(self):
+        start = timezone.make_aware(dt.datetime(2020, 5, 1))
+        end = timezone.make_aware(dt.datetime(2020, 5, 3))
+        hourly = baker.make(EmployeeAbsence, start=start, end=end,
+                            absence_type=baker.make(EmployeeAbsenceType, duration=DURATION.HOURLY))
+        full_day = baker.make(EmployeeAbsence, start=start, end=end, absence_type=baker.make(EmployeeAbsenceType))
+        general = baker.make(GeneralAbsence, start=start, end=end)
+
+        absences = EmployeeAbsence.objects.order_by('start').values_list(*ABSENCE_EVENT_FIELDS)
+        general_absences = GeneralAbsence.objects.order_by('start').values_list(*GENERAL_ABSENCE_EVENT_FIELDS)
+        with self.assertNumQueries(2):
+            res = ''.join(stream_events(absences.iterator(), general_absences.iterator()))
+
+        events = {e['id']: e for e in json.loads(res)}
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[str(hourly.pk)], dict(id=str(hourly.pk), start=format_datetime(start),
+                                                      end=format_datetime(end), title=str(_('ABSENT')),
+                                                      type='ABSENCE', allDay=False, background_color='#E57373'))
+        self.assertTrue(events[str(full_day.pk)]['allDay'])
+        self.assertEqual(events[str(general.pk)]['type'], 'GENERAL_ABSENCE')
+        self.assertEqual(json.loads(''.join(stream_events([]))), [])
@@ -0,0 +1,176 @@
+import csv
+import io
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+from model_bakery import baker
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from absence import exports
+from absence.exports import get_export_job_view, get_export_job_queryset
+from absence.models import EmployeeAbsenceType, GeneralAbsence, ExportJob, EXPORT_JOB_STATUS_CHOICES
+from absence.modules.dataset_generator import AbsenceTypeListViewDataSetGenerator
+from absence.modules.streaming_export import iter_chunked_instances
+from absence.outbox import relay_outbox
+from absence.serializers.export_job_serializer import ExportJobSerializer
+from absence.tasks import task_run_export_job
+from absence.viewsets.absence_type_viewset import EmployeeAbsenceTypeViewSet
+from absence.viewsets.general_absence_viewset import GeneralAbsenceViewSet
+from account.models import Employee, Company, Department
+from constants.db import COMPANY_ROLE_CHOICES
+
+
+class TestExportJob(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.deleted_at = timezone.now()
+        self.company = baker.make(Company)
+        self.user = baker.make(Employee, company=self.company, role=COMPANY_ROLE_CHOICES.MANAGER)
+        for name in ('ABC', 'BCD', 'CDE'):
+            baker.make(EmployeeAbsenceType, company=self.company, name=name, deleted_at=self.deleted_at)
+        baker.make(EmployeeAbsenceType, company=self.company, name='Active')
+        baker.make(EmployeeAbsenceType, name='Other', deleted_at=self.deleted_at)
+
+        self.factory = APIRequestFactory()
+        permission = patch('absence.permissions.has_permission', return_value=True)
+        self.has_permission = permission.start()
+        self.addCleanup(permission.stop)
+
+    def post_export_job(self, viewset_class, query_string='', file_format='csv'):
+        view = viewset_class.as_view({'post': 'export_archived_job'})
+        request = self.factory.post(f'/export_archived_job/?{query_string}', {'file_format': file_format},
+                                    format='json')
+        force_authenticate(request, user=self.user)
+
+        with patch('absence.tasks.task_run_export_job.apply_async') as apply_async:
+            response = view(request)
+            relay_outbox()
+        return response, apply_async
+
+    def create_export_job(self, viewset_class=EmployeeAbsenceTypeViewSet, query_string=''):
+        response, _apply_async = self.post_export_job(viewset_class, query_string)
+        return ExportJob.objects.get(pk=response.data['id'])
+
+    @staticmethod
+    def read_csv(job):
+        with job.file.open('rb') as file:
+            return list(csv.reader(io.StringIO(file.read().decode())))
+
+    def test_export_job_action(self):
+        response, apply_async = self.post_export_job(EmployeeAbsenceTypeViewSet, 'search=CD')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], EXPORT_JOB_STATUS_CHOICES.PENDING)
+        self.assertIsNone(response.data['download_url'])
+        self.has_permission.assert_called()
+
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args[1]['args'], [str(response.data['id'])])
+
+        job = ExportJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.requested_by, self.user)
+        self.assertEqual(job.view, 'absence.viewsets.absence_type_viewset.EmployeeAbsenceTypeViewSet')
+        self.assertEqual((job.action, job.query_string), ('export_archived_job', 'search=CD'))
+
+    def test_export_job_action_forbidden(self):
+        self.has_permission.return_value = False
+        response, apply_async = self.post_export_job(EmployeeAbsenceTypeViewSet)
+        self.assertEqual(response.status_code, 403)
+        apply_async.assert_not_called()
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_export_job_action_unsupported_format(self):
+        response, apply_async = self.post_export_job(EmployeeAbsenceTypeViewSet, file_format='pdf')
+        self.assertEqual(response.status_code, 400)
+        apply_async.assert_not_called()
+
+    def test_get_export_job_view(self):
+        job = self.create_export_job(query_string='search=CD')
+        view = get_export_job_view(ExportJob.objects.get(pk=job.pk))
+
+        self.assertIsInstance(view, EmployeeAbsenceTypeViewSet)
+        self.assertEqual(view.exportGenerator, AbsenceTypeListViewDataSetGenerator)
+        self.assertEqual(view.get_request_user(), self.user)
+        # archived types of the company of the user only, filtered by the query string of the request
+        self.assertCountEqual(get_export_job_queryset(view).values_list('name', flat=True), ['BCD', 'CDE'])
+
+    @patch('absence.exports.EXPORT_CHUNK_SIZE', 2)
+    def test_task_run_export_job(self):
+        job = self.create_export_job()
+
+        with patch('absence.exports.update_export_job', wraps=exports.update_export_job) as update_export_job:
+            task_run_export_job(str(job.pk))
+
+        # started, one chunk written, done
+        self.assertEqual([c[1].get('rows_done') for c in update_export_job.call_args_list], [0, 2, 3])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, EXPORT_JOB_STATUS_CHOICES.DONE)
+        self.assertEqual((job.rows_total, job.rows_done), (3, 3))
+
+        rows = self.read_csv(job)
+        self.assertEqual(rows[0][0], str(_('NAME')))
+        self.assertCountEqual([row[0] for row in rows[1:]], ['ABC', 'BCD', 'CDE'])
+
+        # a redelivered task does not write the file again
+        with patch('absence.tasks.run_export_job') as run_export_job:
+            task_run_export_job(str(job.pk))
+        run_export_job.assert_not_called()
+
+    def test_task_run_export_job_prefetch(self):
+        department = baker.make(Department, company=self.company, name='Department')
+        for _i in range(3):
+            general_absence = baker.make(GeneralAbsence, company=self.company, subject='Subject',
+                                         deleted_at=self.deleted_at)
+            general_absence.department.add(department)
+        baker.make(GeneralAbsence, company=self.company, subject='Active')
+        baker.make(GeneralAbsence, subject='Other', deleted_at=self.deleted_at)
+
+        job = self.create_export_job(GeneralAbsenceViewSet)
+        with patch('absence.exports.EXPORT_CHUNK_SIZE', 2):
+            task_run_export_job(str(job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual([(row[0], row[6]) for row in self.read_csv(job)[1:]], [('Subject', 'Department')] * 3)
+
+    def test_task_run_export_job_failed(self):
+        job = self.create_export_job()
+
+        with patch('absence.exports.write_export', side_effect=ValueError('boom')):
+            with self.assertRaises(ValueError):
+                task_run_export_job(str(job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, EXPORT_JOB_STATUS_CHOICES.FAILED)
+        self.assertIn('boom', job.error)
+
+    def test_iter_chunked_instances(self):
+        # ties on the ordering field used to skip or repeat rows between OFFSET pages
+        for _i in range(5):
+            baker.make(EmployeeAbsenceType, company=self.company, name='Same')
+        queryset = EmployeeAbsenceType.objects.filter(company=self.company).order_by('-name')
+
+        instances = list(iter_chunked_instances(queryset, 2))
+        self.assertEqual([instance.name for instance in instances], list(queryset.values_list('name', flat=True)))
+        self.assertEqual({instance.pk for instance in instances}, set(queryset.values_list('pk', flat=True)))
+        self.assertEqual(len(instances), 9)
+
+    def test_export_job_serializer(self):
+        job = baker.make(ExportJob, requested_by=self.user, status=EXPORT_JOB_STATUS_CHOICES.RUNNING,
+                         rows_total=8, rows_done=2)
+        data = ExportJobSerializer(job).data
+        self.assertEqual((data['progress'], data['download_url']), (25, None))
+
+        job.status = EXPORT_JOB_STATUS_CHOICES.DONE
+        data = ExportJobSerializer(job).data
+        self.assertEqual(data['progress'], 100)
+        self.assertTrue(data['download_url'].endswith(f'/{job.pk}/download/'))
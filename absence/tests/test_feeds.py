@@ -0,0 +1,103 @@
+import datetime as dt
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from freezegun import freeze_time
+from model_bakery import baker
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from absence.feeds import escape_text, fold_line, iter_feed, get_feed_cache_key
+from absence.models import EmployeeAbsence, CalendarFeedToken
+from absence.viewsets.employee_absence_viewset import EmployeeAbsenceViewSet
+from account.models import Company, Employee
+from constants.db import ABSENCE_STATUS_CHOICES, COMPANY_ROLE_CHOICES
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestCalendarFeed(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.company = baker.make(Company)
+        self.employee = baker.make(Employee, company=self.company, role=COMPANY_ROLE_CHOICES.EMPLOYEE,
+                                   resigned=False, timezone='UTC')
+
+    def make_absence(self, day):
+        return baker.make(EmployeeAbsence, company=self.company, submitted_for=self.employee,
+                          status=ABSENCE_STATUS_CHOICES.APPROVED,
+                          start=timezone.make_aware(dt.datetime(2020, 5, day)),
+                          end=timezone.make_aware(dt.datetime(2020, 5, day + 2)))
+
+    def test_escape_text(self):
+        self.assertEqual(escape_text('a,b;c\\d\ne'), 'a\\,b\\;c\\\\d\\ne')
+        self.assertEqual(escape_text(None), '')
+
+    def test_fold_line(self):
+        self.assertEqual(fold_line('SUMMARY:short'), 'SUMMARY:short\r\n')
+
+        folded = fold_line('SUMMARY:' + 'ä' * 60)
+        lines = folded[:-2].split('\r\n')
+        self.assertTrue(all(len(line.encode()) <= 75 for line in lines))
+        self.assertEqual(lines[0] + ''.join(line[1:] for line in lines[1:]), 'SUMMARY:' + 'ä' * 60)
+
+    @freeze_time('2020-05-01 09:00:00')
+    def test_iter_feed(self):
+        absence = self.make_absence(4)
+        feed = ''.join(iter_feed(self.employee))
+
+        self.assertTrue(feed.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(feed.endswith('END:VCALENDAR\r\n'))
+        self.assertIn(f'UID:absence-{absence.pk}\r\n', feed)
+        self.assertIn('DTSTART;VALUE=DATE:20200504\r\n', feed)
+        self.assertIn('DTEND;VALUE=DATE:20200506\r\n', feed)
+
+    @freeze_time('2020-05-01 09:00:00')
+    def test_calendar_feed_view(self):
+        feed_token = CalendarFeedToken.objects.create(employee=self.employee)
+        url = reverse('calendar_feed', args=[feed_token.token])
+        self.make_absence(4)
+
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content).count(b'BEGIN:VEVENT'), 1)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(url)
+            self.assertEqual(b''.join(res.streaming_content).count(b'BEGIN:VEVENT'), 1)
+
+        key = get_feed_cache_key(self.employee)
+        with patch('absence.feeds.transaction.on_commit') as on_commit:
+            self.make_absence(11)
+            # not before the commit
+            self.assertEqual(get_feed_cache_key(self.employee), key)
+
+            for c in on_commit.call_args_list:
+                c[0][0]()
+        self.assertNotEqual(get_feed_cache_key(self.employee), key)
+
+        res = self.client.get(url)
+        self.assertEqual(b''.join(res.streaming_content).count(b'BEGIN:VEVENT'), 2)
+
+        self.assertEqual(self.client.get(reverse('calendar_feed', args=['unknown'])).status_code, 404)
+
+    def test_calendar_feed_token(self):
+        view = EmployeeAbsenceViewSet.as_view({'get': 'calendar_feed_token', 'post': 'calendar_feed_token'})
+
+        def request(method):
+            req = getattr(APIRequestFactory(), method)('/calendar_feed_token/')
+            force_authenticate(req, user=self.employee)
+            return view(req)
+
+        with patch('absence.permissions.has_permission', return_value=True):
+            self.assertEqual(request('get').data, {'token': None, 'url': None})
+            self.assertFalse(CalendarFeedToken.objects.exists())
+
+            token = request('post').data['token']
+            self.assertEqual(request('get').data['token'], token)
+            self.assertEqual(CalendarFeedToken.objects.get().token, token)
+
+            self.assertNotEqual(request('post').data['token'], token)
+            self.assertEqual(CalendarFeedToken.objects.count(), 1)
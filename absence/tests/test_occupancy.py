@@ -0,0 +1,54 @@
+import datetime as dt
+
+from django.test import TestCase
+from django.utils import timezone
+from model_bakery import baker
+
+from absence.models import EmployeeAbsence, GeneralAbsence
+from absence.occupancy import get_department_occupancy
+from account.models import Company, Department, Employee
+from constants.db import ABSENCE_STATUS_CHOICES
+
+
+class TestOccupancy(TestCase):
+
+    def setUp(self):
+        self.company = baker.make(Company)
+        self.department_1 = baker.make(Department, company=self.company)
+        self.department_2 = baker.make(Department, company=self.company)
+        self.employees = baker.make(Employee, company=self.company, department=self.department_1, resigned=False,
+                                    _quantity=3)
+        baker.make(Employee, company=self.company, department=self.department_2, resigned=False, _quantity=2)
+
+    def make_absence(self, model, start, end, **kwargs):
+        return baker.make(model, company=self.company, status=ABSENCE_STATUS_CHOICES.APPROVED,
+                          start=timezone.make_aware(start), end=timezone.make_aware(end), **kwargs)
+
+    def test_get_department_occupancy(self):
+        self.make_absence(EmployeeAbsence, dt.datetime(2020, 5, 1), dt.datetime(2020, 5, 3),
+                          submitted_for=self.employees[0])
+        self.make_absence(EmployeeAbsence, dt.datetime(2020, 5, 2), dt.datetime(2020, 5, 4),
+                          submitted_for=self.employees[1])
+        self.make_absence(EmployeeAbsence, dt.datetime(2020, 5, 2), dt.datetime(2020, 5, 3),
+                          submitted_for=self.employees[2], status=ABSENCE_STATUS_CHOICES.PENDING)
+        resigned = baker.make(Employee, company=self.company, department=self.department_1, resigned=True)
+        self.make_absence(EmployeeAbsence, dt.datetime(2020, 5, 1), dt.datetime(2020, 5, 3), submitted_for=resigned)
+        general = self.make_absence(GeneralAbsence, dt.datetime(2020, 5, 4), dt.datetime(2020, 5, 5))
+        general.department.add(self.department_2)
+
+        with self.assertNumQueries(1):
+            res = get_department_occupancy(self.company, [self.department_1.pk, self.department_2.pk],
+                                           dt.date(2020, 4, 30), dt.date(2020, 5, 4),
+                                           timezone.get_current_timezone_name())
+
+        res = {row['department']: row for row in res}
+        self.assertEqual(res[self.department_1.pk], dict(department=self.department_1.pk, employees=3,
+                                                         absent=[0, 1, 2, 1, 0]))
+        self.assertEqual(res[self.department_2.pk], dict(department=self.department_2.pk, employees=2,
+                                                         absent=[0, 0, 0, 0, 2]))
+
+    def test_get_department_occupancy_other_company(self):
+        other = baker.make(Department)
+        res = get_department_occupancy(self.company, [other.pk], dt.date(2020, 5, 1), dt.date(2020, 5, 2),
+                                       timezone.get_current_timezone_name())
+        self.assertEqual(res, [])
@@ -0,0 +1,102 @@
+import datetime as dt
+from unittest.mock import Mock, patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from freezegun import freeze_time
+
+from absence.models import OutboxMessage, OUTBOX_STATUS_CHOICES
+from absence.outbox import (enqueue_outbox_message, relay_outbox, prune_outbox, get_outbox_stats, OUTBOX_MAX_ATTEMPTS,
+                            OUTBOX_RETENTION_DAYS)
+
+
+class TestOutbox(TestCase):
+
+    def setUp(self):
+        self.handler = Mock()
+        patcher = patch.dict('absence.outbox.OUTBOX_HANDLERS', {'test.topic': self.handler})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enqueue_outbox_message(self):
+        enqueue_outbox_message('test.topic', dict(pk=1, at=dt.date(2020, 5, 4)))
+        enqueue_outbox_message('test.topic', dict(at=dt.date(2020, 5, 4), pk=1))
+        enqueue_outbox_message('test.topic', dict(pk=2), idempotency_key='key')
+        enqueue_outbox_message('test.topic', dict(pk=3), idempotency_key='key')
+
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+        self.assertEqual(OutboxMessage.objects.get(idempotency_key='key').payload, dict(pk=2))
+        self.handler.assert_not_called()
+
+    def test_relay_outbox(self):
+        for pk in range(5):
+            enqueue_outbox_message('test.topic', dict(pk=pk))
+
+        metrics = relay_outbox(batch_size=2)
+        self.assertEqual((metrics['batches'], metrics['handled'], metrics['failed']), (3, 5, 0))
+        self.assertEqual([c[0][0].payload['pk'] for c in self.handler.call_args_list], list(range(5)))
+        self.assertFalse(OutboxMessage.objects.filter(status=OUTBOX_STATUS_CHOICES.PENDING).exists())
+
+        self.assertEqual(relay_outbox()['handled'], 0)
+        self.assertEqual(self.handler.call_count, 5)
+
+    def test_relay_outbox_commits_every_message(self):
+        for pk in range(3):
+            enqueue_outbox_message('test.topic', dict(pk=pk))
+        self.handler.side_effect = [None, KeyboardInterrupt]
+
+        with self.assertRaises(KeyboardInterrupt):
+            relay_outbox()
+
+        # the message handled before the relay died is not handed over again
+        self.assertEqual(list(OutboxMessage.objects.order_by('available_at').values_list('status', flat=True)),
+                         [OUTBOX_STATUS_CHOICES.DONE, OUTBOX_STATUS_CHOICES.PENDING, OUTBOX_STATUS_CHOICES.PENDING])
+
+    def test_relay_outbox_retries(self):
+        self.handler.side_effect = ConnectionError('broker down')
+        now = timezone.now()
+
+        with freeze_time(now):
+            enqueue_outbox_message('test.topic', dict(pk=1))
+            self.assertEqual(relay_outbox()['failed'], 1)
+            # not due again before the retry delay
+            self.assertEqual(relay_outbox()['failed'], 0)
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('broker down', message.last_error)
+        self.assertGreater(message.available_at, now)
+
+        for attempt in range(2, OUTBOX_MAX_ATTEMPTS + 1):
+            with freeze_time(now + dt.timedelta(days=attempt)):
+                relay_outbox()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OUTBOX_STATUS_CHOICES.FAILED)
+        self.assertEqual(get_outbox_stats()['failed'], 1)
+
+    def test_prune_outbox(self):
+        now = timezone.now()
+        with freeze_time(now - dt.timedelta(days=OUTBOX_RETENTION_DAYS + 1)):
+            enqueue_outbox_message('test.topic', dict(pk=1))
+            relay_outbox()
+            enqueue_outbox_message('test.topic', dict(pk=2))
+        enqueue_outbox_message('test.topic', dict(pk=3))
+        relay_outbox(max_batches=1, batch_size=1)
+
+        # pending messages and recently handled ones are kept
+        with patch('absence.outbox.OUTBOX_PRUNE_BATCH_SIZE', 1):
+            self.assertEqual(prune_outbox(now), 1)
+        self.assertEqual(sorted(m.payload['pk'] for m in OutboxMessage.objects.all()), [2, 3])
+        self.assertEqual(prune_outbox(now), 0)
+
+    @override_settings(OUTBOX_RELAY_IN_PROCESS=True)
+    def test_in_process_relay(self):
+        with patch('absence.outbox.transaction.on_commit') as on_commit:
+            enqueue_outbox_message('test.topic', dict(pk=1))
+            self.assertEqual(get_outbox_stats()['pending'], 1)
+
+            on_commit.call_args[0][0]()
+
+        self.handler.assert_called_once()
+        self.assertEqual(get_outbox_stats()['pending'], 0)
@@ -0,0 +1,73 @@
+import datetime as dt
+import random
+from unittest import skipIf
+
+import pytz
+from django.test import SimpleTestCase
+
+from absence import periods
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+
+class TestPeriods(SimpleTestCase):
+
+    def test_date_range_week(self):
+        res = periods.date_range(dt.datetime(2020, 5, 12, 9, 0), dt.datetime(2020, 6, 1, 9, 0), freq='W-MON')
+        self.assertEqual(res, [dt.datetime(2020, 5, 18, 9, 0),
+                               dt.datetime(2020, 5, 25, 9, 0),
+                               dt.datetime(2020, 6, 1, 9, 0)])
+
+    def test_date_range_month(self):
+        res = periods.date_range(dt.datetime(2020, 1, 1), dt.datetime(2020, 3, 31), freq='MS')
+        self.assertEqual(res, [dt.datetime(2020, 1, 1), dt.datetime(2020, 2, 1), dt.datetime(2020, 3, 1)])
+
+    def test_date_range_year(self):
+        res = periods.date_range(dt.datetime(2020, 5, 1), dt.datetime(2021, 12, 31), freq='A')
+        self.assertEqual(res, [dt.datetime(2020, 12, 31), dt.datetime(2021, 12, 31)])
+
+        res = periods.date_range(dt.datetime(2020, 5, 1), dt.datetime(2021, 12, 30), freq='AS')
+        self.assertEqual(res, [dt.datetime(2021, 1, 1)])
+
+    def test_date_range_keeps_wall_time_across_dst(self):
+        tz = pytz.timezone('Europe/Berlin')
+        start = tz.localize(dt.datetime(2020, 3, 23, 0, 0))
+        end = tz.localize(dt.datetime(2020, 4, 6, 0, 0))
+
+        res = periods.date_range(start, end, freq='W-MON')
+
+        self.assertEqual([r.hour for r in res], [0, 0, 0])
+        self.assertEqual([r.utcoffset() for r in res], [dt.timedelta(hours=1), dt.timedelta(hours=2),
+                                                        dt.timedelta(hours=2)])
+
+    def test_roll_back(self):
+        date = dt.date(2020, 5, 14)
+        self.assertEqual(periods.roll_back(date, 'W-MON'), dt.date(2020, 5, 11))
+        self.assertEqual(periods.roll_back(date, 'MS'), dt.date(2020, 5, 1))
+        self.assertEqual(periods.roll_back(date, 'AS'), dt.date(2020, 1, 1))
+        self.assertEqual(periods.roll_back(date, 'A'), dt.date(2019, 12, 31))
+
+    def test_unsupported_frequency(self):
+        with self.assertRaises(ValueError):
+            periods.date_range(dt.datetime(2020, 1, 1), dt.datetime(2020, 2, 1), freq='D')
+
+    @skipIf(pd is None, 'pandas is not installed')
+    def test_date_range_matches_pandas(self):
+        rnd = random.Random(20201118)
+        zones = [None, 'UTC', 'Europe/Berlin', 'America/New_York', 'Asia/Karachi']
+
+        for _ in range(500):
+            zone = rnd.choice(zones)
+            freq = rnd.choice(periods.FREQUENCIES)
+            start = dt.datetime(2018, 1, 1) + dt.timedelta(days=rnd.randint(0, 1500), hours=rnd.randint(3, 23))
+            end = start + dt.timedelta(days=rnd.randint(0, 800), minutes=rnd.randint(0, 1439))
+
+            if zone is not None:
+                tz = pytz.timezone(zone)
+                start, end = tz.localize(start), tz.localize(end)
+
+            expected = [ts.to_pydatetime() for ts in pd.date_range(start, end, freq=freq)]
+            self.assertEqual(periods.date_range(start, end, freq=freq), expected, (zone, freq, start, end))
@@ -3,8 +3,10 @@ from unittest.mock import patch
 from django.test import TestCase
 from model_bakery import baker
 
-from absence.receivers import _account_created_receiver
-from account.models import Company
+from absence.models import EmployeeAbsence
+from absence.receivers import _account_created_receiver, _absence_created_receiver
+from absence.tasks import ABSENCE_SUBMITTED_TO_MANAGER, ABSENCE_SUBMITTED_FOR_USER
+from account.models import Company, Employee
 
 
 class TestReceiver(TestCase):
@@ -14,3 +16,16 @@ class TestReceiver(TestCase):
         company = baker.make(Company)
         _account_created_receiver(**dict(company=company))
         default_absence_types.assert_called_once_with(company)
+
+    @patch('absence.receivers.dispatch_absence_notifications')
+    def test_absence_created_receiver(self, dispatch):
+        user, manager = baker.make(Employee, _quantity=2)
+
+        absence = baker.prepare(EmployeeAbsence, submitted_by=user, submitted_for=user, submitted_to=manager)
+        _absence_created_receiver(instance=absence)
+        dispatch.assert_called_once_with([(ABSENCE_SUBMITTED_TO_MANAGER, absence, None)])
+
+        dispatch.reset_mock()
+        absence = baker.prepare(EmployeeAbsence, submitted_by=manager, submitted_for=user, submitted_to=manager)
+        _absence_created_receiver(instance=absence)
+        dispatch.assert_called_once_with([(ABSENCE_SUBMITTED_FOR_USER, absence, None)])
@@ -1,8 +1,13 @@
 import datetime as dt
 import random
+from io import StringIO
 from unittest.mock import patch, Mock
 
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_save
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy as _
@@ -11,12 +16,14 @@ from model_bakery import baker
 from rest_framework.exceptions import ValidationError
 from rest_framework.status import *
 
+from absence.balance import get_absence_balance
 from absence.models import EmployeeAbsenceType, EmployeeAbsence, EmployeeAbsenceComment, GeneralAbsence
 from absence.serializers.absence_type_serializer import EmployeeAbsenceTypeSerializer
 from absence.serializers.employee_absence_serializer import EmployeeAbsenceCreateSerializer, \
-    EmployeeAbsenceStatusUpdateSerializer, EmployeeAbsenceListSerializer
+    EmployeeAbsenceStatusUpdateSerializer, EmployeeAbsenceListSerializer, EmployeeAbsenceBulkStatusUpdateSerializer
 from absence.serializers.general_absence_serializer import GeneralAbsenceSerializer, GeneralAbsenceCreateSerializer, \
     GeneralAbsenceUpdateSerializer, GeneralAbsenceWriteBaseSerializer
+from absence.utils import get_overlap_absences
 from account.models import Employee, Department
 from account.tests.recipes import staff_recipe, company_recipe, employee_recipe
 from constants.db import COMPANY_ROLE_CHOICES, DURATION, ABSENCE_STATUS_CHOICES, ABSENCE_ENTITLEMENT_PERIOD_CHOICE
@@ -188,6 +195,28 @@ class TestEmployeeAbsenceCreateSerializer(TestCase):
         self.assertEqual(cm.exception.status_code, HTTP_400_BAD_REQUEST)
         self.assertEqual(cm.exception.detail, [err_hourly])
 
+    def test_validate_overlap_without_end(self):
+        # an absence without end is open ended, it clashes with everything from its start on
+        baker.make(EmployeeAbsence, start=timezone.make_aware(dt.datetime(2020, 5, 1, 0, 0, 0)), end=None,
+                   submitted_for=self.user, company=self.company)
+
+        data = dict(start=timezone.make_aware(dt.datetime(2020, 4, 27, 0, 0, 0)),
+                    end=timezone.make_aware(dt.datetime(2020, 5, 1, 0, 0, 0)),
+                    submitted_for=self.user)
+        self.assertEqual(self.serializer.validate_overlap(data), None)
+
+        err = _('ABSENCE_HAS_ALREADY_BEEN_APPLIED_IN_GIVEN_DATES_2020-05-01_TO_2021-05-02. '
+                'PLEASE_CHOOSE_A_NON-OVERLAPPING_TIME_INTERVAL')
+        data = dict(start=timezone.make_aware(dt.datetime(2021, 5, 1, 0, 0, 0)),
+                    end=timezone.make_aware(dt.datetime(2021, 5, 3, 0, 0, 0)),
+                    submitted_for=self.user)
+        with self.assertRaises(ValidationError) as cm:
+            self.serializer.validate_overlap(data)
+        self.assertEqual(cm.exception.detail, [err])
+
+        self.assertTrue(get_overlap_absences(timezone.make_aware(dt.datetime(2030, 1, 1, 0, 0, 0)), None,
+                                             self.user).exists())
+
     def test_validate_shift_overlap(self):
         start_1 = timezone.make_aware(dt.datetime(2020, 4, 30, 0, 0, 0))
         end_1 = timezone.make_aware(dt.datetime(2020, 5, 2, 0, 0, 0))
@@ -312,6 +341,22 @@ class TestEmployeeAbsenceCreateSerializer(TestCase):
                 self.assertEqual(self.user, EmployeeAbsenceComment.objects.first().commented_by)
                 absence_created.send.assert_called_once()
 
+    def test_create_overlap_constraint(self):
+        call_command('exclude_overlapping_absences', stdout=StringIO())
+        start = timezone.make_aware(dt.datetime(2020, 5, 1, 0, 0, 0))
+        end = timezone.make_aware(dt.datetime(2020, 5, 5, 0, 0, 0))
+        baker.make(EmployeeAbsence, start=start, end=end, submitted_for=self.user, company=self.company)
+
+        data = dict(subject='Test Absence', submitted_for=self.user, submitted_by=self.user,
+                    start=start + dt.timedelta(days=1), end=end, absence_type=baker.make(EmployeeAbsenceType),
+                    company=self.company)
+
+        with patch.object(self.serializer, 'get_request_user', return_value=self.user):
+            with self.assertRaises(ValidationError):
+                self.serializer.create(data)
+
+        self.assertEqual(1, EmployeeAbsence.objects.count())
+
 
 class TestEmployeeAbsenceStatusUpdateSerializer(TestCase):
 
@@ -478,6 +523,84 @@ class TestEmployeeAbsenceStatusUpdateSerializer(TestCase):
 
 
 
+class TestEmployeeAbsenceBulkStatusUpdateSerializer(TestCase):
+
+    def setUp(self):
+        self.company = company_recipe.make()
+        self.manager = employee_recipe.make(company=self.company)
+        self.user = employee_recipe.make(company=self.company)
+        self.absence_type = baker.make(EmployeeAbsenceType, company=self.company, entitlement=3,
+                                       period=ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH)
+        self.absences = [
+            baker.make(EmployeeAbsence, company=self.company, submitted_for=self.user, absence_type=self.absence_type,
+                       status=ABSENCE_STATUS_CHOICES.PENDING,
+                       start=timezone.make_aware(dt.datetime(2020, 5, day)),
+                       end=timezone.make_aware(dt.datetime(2020, 5, day + 2)))
+            for day in (4, 11)
+        ]
+
+    def get_serializer(self, status, absences=None):
+        data = dict(absences=[a.pk for a in absences or self.absences], status=status, comment='ok')
+        return EmployeeAbsenceBulkStatusUpdateSerializer(data=data, context=dict(request=Mock(user=self.manager)))
+
+    @patch('absence.serializers.employee_absence_serializer.get_absences_with_shift_overlap', return_value=[])
+    def test_validate_balance_counts_batch(self, _shift_overlap):
+        serializer = self.get_serializer(ABSENCE_STATUS_CHOICES.APPROVED)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(list(serializer.errors), [str(self.absences[1].pk)])
+
+        serializer = self.get_serializer(ABSENCE_STATUS_CHOICES.APPROVED, absences=self.absences[:1])
+        self.assertTrue(serializer.is_valid())
+
+    @patch('absence.serializers.employee_absence_serializer.get_absences_with_shift_overlap')
+    def test_validate_shift_overlap(self, shift_overlap):
+        shift_overlap.return_value = self.absences[:1]
+
+        serializer = self.get_serializer(ABSENCE_STATUS_CHOICES.APPROVED, absences=self.absences[:1])
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('ignore_shift_overlap', serializer.errors)
+
+        serializer = self.get_serializer(ABSENCE_STATUS_CHOICES.REJECTED)
+        self.assertTrue(serializer.is_valid())
+
+    @patch('absence.serializers.employee_absence_serializer.get_absences_with_shift_overlap', return_value=[])
+    def test_create(self, _shift_overlap):
+        serializer = self.get_serializer(ABSENCE_STATUS_CHOICES.APPROVED, absences=self.absences[:1])
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        self.assertEqual(EmployeeAbsence.objects.get(pk=self.absences[0].pk).status, ABSENCE_STATUS_CHOICES.APPROVED)
+        self.assertEqual(EmployeeAbsenceComment.objects.filter(absence=self.absences[0]).count(), 1)
+        self.assertEqual(get_absence_balance(self.user, self.absence_type, dt.date(2020, 5, 1)), 2)
+
+        serializer = self.get_serializer(ABSENCE_STATUS_CHOICES.REJECTED)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        self.assertEqual(EmployeeAbsence.objects.filter(status=ABSENCE_STATUS_CHOICES.REJECTED).count(), 2)
+        self.assertEqual(get_absence_balance(self.user, self.absence_type, dt.date(2020, 5, 1)), 0)
+
+    @patch('absence.serializers.employee_absence_serializer.get_absences_with_shift_overlap', return_value=[])
+    def test_create_updates_absences_at_once(self, _shift_overlap):
+        # the history of the absences listens to post_save
+        receiver = Mock()
+        post_save.connect(receiver, sender=EmployeeAbsence, dispatch_uid='test_bulk_status_receiver')
+        self.addCleanup(post_save.disconnect, sender=EmployeeAbsence, dispatch_uid='test_bulk_status_receiver')
+
+        serializer = self.get_serializer(ABSENCE_STATUS_CHOICES.REJECTED)
+        serializer.context['absences'] = list(EmployeeAbsence.objects.filter(pk__in=[a.pk for a in self.absences]))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid())
+            serializer.save()
+
+        table = EmployeeAbsence._meta.db_table
+        statements = [q['sql'] for q in queries.captured_queries if f'"{table}"' in q['sql']]
+        self.assertEqual([sql.split()[0] for sql in statements], ['UPDATE'])
+
+        self.assertEqual({c[1]['instance'].pk for c in receiver.call_args_list}, {a.pk for a in self.absences})
+        self.assertTrue(all(c[1]['update_fields'] == {'status', 'modified'} for c in receiver.call_args_list))
+
+
 class TestEmployeeAbsenceTypeSerializer(TestCase):
     def setUp(self):
         self.company = company_recipe.make()
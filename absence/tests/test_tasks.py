@@ -0,0 +1,165 @@
+import datetime as dt
+from unittest.mock import patch, Mock
+
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from freezegun import freeze_time
+from model_bakery import baker
+
+from absence.delivery import get_delivery_progress, DELIVERY_DONE
+from absence.models import (EmployeeAbsence, EmployeeAbsenceComment, EmployeeAbsenceType, GeneralAbsence,
+                            AbsenceNotificationSetting, AbsenceDigestItem, OutboxMessage)
+from absence.outbox import relay_outbox
+from absence.serializers.employee_absence_serializer import EmployeeAbsenceBulkStatusUpdateSerializer
+from absence.tasks import (dispatch_absence_notifications, task_notify_absences, task_send_general_absence_published,
+                           task_send_absence_digests, ABSENCE_STATUS_UPDATED, ABSENCE_SUBMITTED_TO_MANAGER,
+                           ABSENCE_NOTIFICATIONS_TOPIC)
+from account.tests.recipes import company_recipe, employee_recipe
+from constants.db import ABSENCE_STATUS_CHOICES
+
+
+class TestAbsenceNotificationTasks(TestCase):
+
+    def setUp(self):
+        self.company = company_recipe.make()
+        self.manager = employee_recipe.make(company=self.company)
+        self.users = employee_recipe.make(company=self.company, _quantity=2)
+        self.absence_type = baker.make(EmployeeAbsenceType, company=self.company, entitlement=0)
+        self.absences = [
+            baker.make(EmployeeAbsence, company=self.company, submitted_for=user, submitted_to=self.manager,
+                       submitted_by=user, absence_type=self.absence_type, status=ABSENCE_STATUS_CHOICES.PENDING,
+                       start=timezone.make_aware(dt.datetime(2020, 5, day)),
+                       end=timezone.make_aware(dt.datetime(2020, 5, day + 1)))
+            for user, day in ((self.users[0], 4), (self.users[0], 11), (self.users[1], 18))
+        ]
+
+    @patch('absence.tasks.task_notify_absences')
+    def test_dispatch_absence_notifications(self, task):
+        dispatch_absence_notifications([(ABSENCE_STATUS_UPDATED, a, None) for a in self.absences])
+        self.assertEqual(OutboxMessage.objects.filter(topic=ABSENCE_NOTIFICATIONS_TOPIC).count(), 2)
+        task.apply_async.assert_not_called()
+
+        self.assertEqual(relay_outbox()['handled'], 2)
+        self.assertEqual(task.apply_async.call_count, 2)
+        batches = {c[1]['args'][0]: c[1]['args'][1] for c in task.apply_async.call_args_list}
+        self.assertEqual(len(batches[str(self.users[0].pk)]), 2)
+        self.assertEqual(len(batches[str(self.users[1].pk)]), 1)
+
+        # the same notifications are stored once
+        dispatch_absence_notifications([(ABSENCE_STATUS_UPDATED, a, None) for a in self.absences])
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+        dispatch_absence_notifications([(ABSENCE_SUBMITTED_TO_MANAGER, a, None) for a in self.absences])
+        relay_outbox()
+        message = OutboxMessage.objects.get(payload__recipient_id=str(self.manager.pk))
+        task.apply_async.assert_called_with(args=[str(self.manager.pk), [[ABSENCE_SUBMITTED_TO_MANAGER, str(a.pk), None]
+                                                                         for a in self.absences]],
+                                            task_id=str(message.pk))
+
+    @patch('absence.tasks.task_notify_absences')
+    @patch('absence.utils.push_notification')
+    @patch('absence.utils.emails')
+    def test_bulk_status_does_not_send_in_request(self, emails, push_notification, task):
+        data = dict(absences=[a.pk for a in self.absences], status=ABSENCE_STATUS_CHOICES.REJECTED, comment='no')
+        serializer = EmployeeAbsenceBulkStatusUpdateSerializer(data=data, context=dict(request=Mock(user=self.manager)))
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        self.assertEqual(len(mail.outbox), 0)
+        emails.AbsenceUpdated.assert_not_called()
+        push_notification.assert_not_called()
+        task.apply_async.assert_not_called()
+
+        relay_outbox()
+        self.assertEqual(task.apply_async.call_count, 2)
+
+    @patch('absence.utils.push_notification')
+    @patch('absence.utils.emails')
+    def test_task_notify_absences(self, emails, push_notification):
+        comment = baker.make(EmployeeAbsenceComment, absence=self.absences[0], commented_by=self.manager)
+        deleted = str(self.absences[1].pk)
+        self.absences[1].delete()
+
+        notifications = [[ABSENCE_STATUS_UPDATED, str(self.absences[0].pk), str(comment.pk)],
+                         [ABSENCE_STATUS_UPDATED, deleted, None]]
+        task_notify_absences(str(self.users[0].pk), notifications)
+
+        emails.AbsenceUpdated.assert_called_once_with(absence=self.absences[0], comment=comment)
+        self.assertEqual(push_notification.call_count, 1)
+
+    @patch('absence.tasks.emails')
+    @patch('absence.tasks.push_notification')
+    @patch('absence.utils.emails')
+    def test_absence_digest(self, utils_emails, push_notification, emails):
+        baker.make(AbsenceNotificationSetting, employee=self.manager, digest=True, digest_interval=1)
+        notifications = [[ABSENCE_SUBMITTED_TO_MANAGER, str(a.pk), None] for a in self.absences]
+
+        with freeze_time('2020-05-01 10:00'):
+            task_notify_absences(str(self.manager.pk), notifications[:2])
+        with freeze_time('2020-05-01 10:30'):
+            task_notify_absences(str(self.manager.pk), notifications[2:])
+            self.assertEqual(task_send_absence_digests(), 0)
+
+        utils_emails.AbsenceSubmittedManager.assert_not_called()
+        self.assertEqual(push_notification.call_count, 3)
+        self.assertEqual(AbsenceDigestItem.objects.filter(recipient=self.manager).count(), 3)
+
+        with freeze_time('2020-05-01 11:05'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(task_send_absence_digests(), 3)
+            # the due recipients are read with two queries, their items with one query per recipient
+            self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT')]), 3)
+
+        emails.AbsenceDigest.assert_called_once()
+        recipient, items = emails.AbsenceDigest.call_args[0]
+        self.assertEqual(recipient, self.manager)
+        self.assertEqual([item.absence for item in items], self.absences)
+        self.assertFalse(AbsenceDigestItem.objects.exists())
+
+    @patch('absence.tasks.emails')
+    @patch('absence.tasks.push_notification')
+    def test_absence_digest_failed(self, _push_notification, emails):
+        baker.make(AbsenceNotificationSetting, employee=self.manager, digest=True, digest_interval=1)
+        notifications = [[ABSENCE_SUBMITTED_TO_MANAGER, str(a.pk), None] for a in self.absences]
+
+        with freeze_time('2020-05-01 10:00'):
+            task_notify_absences(str(self.manager.pk), notifications)
+
+        emails.AbsenceDigest.return_value.send.side_effect = ConnectionError('smtp down')
+        with freeze_time('2020-05-01 11:05'):
+            self.assertEqual(task_send_absence_digests(), 0)
+
+        # the claimed items are queued again for the next run
+        self.assertEqual(AbsenceDigestItem.objects.filter(recipient=self.manager).count(), 3)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestGeneralAbsencePublishedTask(TestCase):
+
+    def setUp(self):
+        self.company = company_recipe.make()
+        employee_recipe.make(company=self.company, language='nb', _quantity=3)
+        employee_recipe.make(company=self.company, language='en', _quantity=2)
+        self.absence = baker.make(GeneralAbsence, company=self.company, status=ABSENCE_STATUS_CHOICES.APPROVED,
+                                  submitted_by=employee_recipe.make(company=self.company, language='en'),
+                                  start=timezone.make_aware(dt.datetime(2020, 5, 4)),
+                                  end=timezone.make_aware(dt.datetime(2020, 5, 5)))
+
+    @patch('absence.tasks.DELIVERY_CHUNK_SIZE', 2)
+    @patch('absence.tasks.notify_subordinates_about_general_absence')
+    @patch('absence.tasks.emails.GeneralAbsencePublished')
+    def test_task_send_general_absence_published(self, email, notify):
+        email.return_value.get_context.return_value = dict(link='link')
+
+        task_send_general_absence_published(str(self.absence.pk))
+        notify.assert_called_once_with(self.absence)
+
+        chunks = [c[1]['iterable'] for c in email.call_args_list if c[1]['iterable']]
+        self.assertEqual([len(c) for c in chunks], [2, 1, 2, 1])
+        self.assertTrue(all(len({e.language for e in c}) == 1 for c in chunks))
+        # the shared context is built once per language
+        self.assertEqual(email.return_value.get_context.call_count, 2)
+        self.assertEqual(get_delivery_progress(str(self.absence.pk)), dict(status=DELIVERY_DONE, total=6, sent=6))
@@ -1,15 +1,19 @@
 import datetime as dt
+import json
 import random
 from operator import attrgetter
 from unittest.mock import patch, Mock
 
 import time
 from django.db.models import Q
+from django.http import QueryDict
 from django.test import TestCase
 from django.utils import timezone
 from freezegun import freeze_time
 from model_bakery import baker
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
 
 from absence.models import EmployeeAbsence, GeneralAbsence
 from absence.models import EmployeeAbsenceType
@@ -18,7 +22,11 @@ from absence.viewsets.employee_absence_viewset import EmployeeAbsenceViewSet
 from absence.viewsets.general_absence_viewset import GeneralAbsenceViewSet
 from account.models import Employee, Department, Company
 from account.tests.recipes import employee_recipe
-from constants.db import COMPANY_ROLE_CHOICES, ABSENCE_STATUS_CHOICES, TODO_TYPE_CHOICES
+from constants.db import COMPANY_ROLE_CHOICES, ABSENCE_STATUS_CHOICES, TODO_TYPE_CHOICES, \
+    ABSENCE_ENTITLEMENT_PERIOD_CHOICE, SCHEDULE_STATUS_CHOICES
+from schedule.models import Schedule
+from shift.models import Shift
+from shift_type.models import ShiftType
 from todo.models import Todo
 from todo.utils import create_todos
 
@@ -362,3 +370,109 @@ class TestEmployeeAbsenceViewSet(TestCase):
                                      [],
                                      transform=attrgetter('subject', 'company'))
 
+
+    @freeze_time("2020-05-20 09:00:00")
+    def test_balances(self):
+        department = baker.make(Department, company=self.company_1)
+        manager = baker.make(Employee, company=self.company_1, role=COMPANY_ROLE_CHOICES.MANAGER)
+        employees = baker.make(Employee, company=self.company_1, department=department, _quantity=20)
+        absence_type = baker.make(EmployeeAbsenceType, company=self.company_1, entitlement=10,
+                                  period=ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH)
+
+        for employee in employees[:10]:
+            baker.make(EmployeeAbsence, company=self.company_1, submitted_for=employee, absence_type=absence_type,
+                       status=ABSENCE_STATUS_CHOICES.APPROVED,
+                       start=timezone.make_aware(dt.datetime(2020, 5, 4)),
+                       end=timezone.make_aware(dt.datetime(2020, 5, 7)))
+
+        request = Mock()
+        request.query_params = QueryDict(f'department={department.pk}&absence_type={absence_type.pk}')
+
+        with patch.object(self.viewset, 'get_request_user') as request_user:
+            request_user.return_value = manager
+            with self.assertNumQueries(3):
+                res = self.viewset.balances(request)
+
+        self.assertEqual(len(res.data), 20)
+        taken = {row['employee']: (row['already_taken'], row['current_allowance']) for row in res.data}
+        self.assertEqual(taken[employees[0].pk], (3, 7))
+        self.assertEqual(taken[employees[15].pk], (0, 10))
+
+    @patch('absence.permissions.has_object_permission')
+    @patch('absence.permissions.has_permission', return_value=True)
+    @patch('absence.serializers.employee_absence_serializer.EmployeeAbsenceBulkStatusUpdateSerializer.validate')
+    def test_bulk_status_checks_permissions_first(self, validate, _has_permission, has_object_permission):
+        validate.side_effect = lambda data: data
+        EmployeeAbsence.objects.update(status=ABSENCE_STATUS_CHOICES.PENDING)
+        absences = list(EmployeeAbsence.objects.filter(company=self.company_1)[:2])
+        view = EmployeeAbsenceViewSet.as_view({'put': 'bulk_status'})
+
+        def put():
+            request = APIRequestFactory().put('/bulk_status/', dict(absences=[str(a.pk) for a in absences],
+                                                                    status=ABSENCE_STATUS_CHOICES.REJECTED),
+                                              format='json')
+            force_authenticate(request, user=self.user_1)
+            return view(request)
+
+        has_object_permission.side_effect = lambda _checker, _user, obj: obj != absences[1]
+        self.assertEqual(put().status_code, status.HTTP_403_FORBIDDEN)
+        validate.assert_not_called()
+        self.assertFalse(EmployeeAbsence.objects.filter(status=ABSENCE_STATUS_CHOICES.REJECTED).exists())
+
+        has_object_permission.side_effect = None
+        has_object_permission.return_value = True
+        self.assertEqual(put().status_code, status.HTTP_200_OK)
+        validate.assert_called_once()
+        self.assertEqual(EmployeeAbsence.objects.filter(status=ABSENCE_STATUS_CHOICES.REJECTED).count(), 2)
+
+    @patch('absence.viewsets.employee_absence_viewset.check_users_access', return_value=True)
+    def test_calendar(self, _check_users_access):
+        department = baker.make(Department, company=self.company_1)
+        employee = baker.make(Employee, company=self.company_1, department=department,
+                              role=COMPANY_ROLE_CHOICES.EMPLOYEE)
+        schedule = baker.make(Schedule, company=self.company_1, department=department,
+                              status=SCHEDULE_STATUS_CHOICES.PUBLISHED)
+        shifts = [
+            baker.make(Shift, schedule=schedule, shift_type=baker.make(ShiftType, name='Early'),
+                       start=timezone.make_aware(dt.datetime(2020, month, day, 6, 0, 0)),
+                       end=timezone.make_aware(dt.datetime(2020, month, day, 14, 0, 0)))
+            for month, day in ((5, 5), (7, 1))
+        ]
+        for shift in shifts:
+            shift.employees_allocated.add(employee)
+
+        inside = baker.make(EmployeeAbsence, company=self.company_1, submitted_for=employee,
+                            status=ABSENCE_STATUS_CHOICES.APPROVED,
+                            start=timezone.make_aware(dt.datetime(2020, 4, 28)),
+                            end=timezone.make_aware(dt.datetime(2020, 5, 2)))
+        baker.make(EmployeeAbsence, company=self.company_1, submitted_for=employee,
+                   status=ABSENCE_STATUS_CHOICES.APPROVED,
+                   start=timezone.make_aware(dt.datetime(2020, 6, 2)),
+                   end=timezone.make_aware(dt.datetime(2020, 6, 3)))
+
+        request = Mock(method='GET', META={})
+        request.query_params = QueryDict(f'employee={employee.pk}&start=2020-05-01&end=2020-05-31')
+
+        with patch.object(self.viewset, 'get_request_user', return_value=employee):
+            res = self.viewset.calendar(request)
+            events = json.loads(b''.join(res.streaming_content))
+
+            request.META = {'HTTP_IF_NONE_MATCH': res['ETag']}
+            self.assertEqual(self.viewset.calendar(request).status_code, status.HTTP_304_NOT_MODIFIED)
+
+            inside.save()
+            request.META = {'HTTP_IF_NONE_MATCH': res['ETag'], 'HTTP_IF_MODIFIED_SINCE': res['Last-Modified']}
+            self.assertEqual(self.viewset.calendar(request).status_code, status.HTTP_200_OK)
+            request.META = {}
+
+        # absences and shifts of the window, ordered by start
+        self.assertEqual([e['id'] for e in events], [str(inside.pk), str(shifts[0].pk)])
+        self.assertTrue(all(set(e) == {'id', 'start', 'end', 'title', 'type', 'allDay', 'background_color'}
+                            for e in events))
+        self.assertEqual(events[0]['type'], 'ABSENCE')
+        self.assertEqual(events[1]['start'], '2020-05-05T06:00:00Z')
+
+        request.query_params = QueryDict(f'employee={employee.pk}&start=2020-05-01&end=2020-12-31')
+        with patch.object(self.viewset, 'get_request_user', return_value=employee):
+            with self.assertRaises(ValidationError):
+                self.viewset.calendar(request)
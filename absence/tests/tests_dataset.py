@@ -1,4 +1,6 @@
+import csv
 import datetime as dt
+import io
 from operator import attrgetter
 from unittest.mock import call
 from unittest.mock import patch
@@ -13,6 +15,7 @@ from model_bakery import baker
 from absence.models import EmployeeAbsenceType, EmployeeAbsence, GeneralAbsence
 from absence.modules.dataset_generator import EmployeeAbsenceListViewDataSetGenerator, \
     AbsenceTypeListViewDataSetGenerator, GeneralAbsenceListViewDataSetGenerator
+from absence.modules.streaming_export import stream_export, iter_export_rows
 from account.models import Employee, Department
 from constants.db import DURATION, ABSENCE_STATUS_CHOICES, ABSENCE_ENTITLEMENT_PERIOD_CHOICE
 
@@ -98,6 +101,53 @@ class TestEmployeeAbsenceListViewDataSetGenerator(TestCase):
         ])
 
 
+class TestStreamingExport(TestCase):
+
+    def setUp(self):
+        department = baker.make(Department, name='Department')
+        absence_type = baker.make(EmployeeAbsenceType, name='AbsenceType', duration=DURATION.DAILY)
+        baker.make(EmployeeAbsence, subject='Subject', absence_type=absence_type,
+                   submitted_for=baker.make(Employee, department=department),
+                   start=timezone.make_aware(dt.datetime(2020, 5, 4)),
+                   end=timezone.make_aware(dt.datetime(2020, 5, 6)), _quantity=3)
+
+    def test_iter_export_rows(self):
+        rows = iter_export_rows(EmployeeAbsenceListViewDataSetGenerator, EmployeeAbsence.objects.all(), chunk_size=2)
+        header = next(rows)
+        self.assertEqual(header[0], str(_('SUBMITTED_BY')))
+
+        # the related objects are joined in the single query of the cursor
+        with self.assertNumQueries(1):
+            rows = list(rows)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({(row[3], row[8], row[10]) for row in rows}, {('Subject', 'Department', 'AbsenceType')})
+
+    def test_export_values_match_instance_rows(self):
+        absence = EmployeeAbsence.objects.first()
+        absence.submitted_to = baker.make(Employee, first_name='Ras', last_name='A')
+        absence.save()
+
+        qs = EmployeeAbsence.objects.order_by('pk')
+        values = EmployeeAbsenceListViewDataSetGenerator.get_export_values(qs)
+        instances = EmployeeAbsenceListViewDataSetGenerator.get_export_queryset(qs)
+
+        for row, instance in zip(values, instances):
+            expected = [str(value) if value is not None else '' for value in
+                        EmployeeAbsenceListViewDataSetGenerator.get_instance_data_row(instance)]
+            self.assertEqual(EmployeeAbsenceListViewDataSetGenerator.get_values_data_row(row), expected)
+
+    def test_stream_export_csv(self):
+        response = stream_export(EmployeeAbsenceListViewDataSetGenerator, EmployeeAbsence.objects.all(),
+                                 'employee_absence_list')
+        self.assertTrue(response.streaming)
+        self.assertIn('employee_absence_list_', response['Content-Disposition'])
+
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][3], 'Subject')
+
+
 class TestAbsenceTypeListViewDataSetGenerator(TestCase):
 
     @patch('absence.modules.dataset_generator.BaseDataSetGenerator.__init__')
@@ -195,6 +245,7 @@ class TestGeneralAbsenceListViewDataSetGenerator(TestCase):
                                    timezone.make_aware(dt.datetime(2020, 5, 4, 5, 0, 0))]
         _formatted_date.side_effect = ['01/05/2020', '04/05/2020']
 
+        general_absence = GeneralAbsenceListViewDataSetGenerator.get_export_queryset(GeneralAbsence.objects.all()).get()
         res = GeneralAbsenceListViewDataSetGenerator.get_instance_data_row(general_absence)
         expected = [
             'Subject',
@@ -215,3 +266,25 @@ class TestGeneralAbsenceListViewDataSetGenerator(TestCase):
         self.assertEqual(_formatted_date.mock_calls,
                          [call(timezone.make_aware(dt.datetime(2020, 5, 1, 5, 0, 0))),
                           call(timezone.make_aware(dt.datetime(2020, 5, 4, 5, 0, 0)))])
+
+    def test_export_queries(self):
+        departments = baker.make(Department, name=iter(['Sales', 'IT', 'Nursing']), _quantity=3)
+
+        def make_general_absences(quantity):
+            for general_absence in baker.make(GeneralAbsence, submitted_by=baker.make(Employee), _quantity=quantity):
+                general_absence.department.add(*departments)
+
+        def export():
+            qs = GeneralAbsenceListViewDataSetGenerator.get_export_queryset(GeneralAbsence.objects.all())
+            return [GeneralAbsenceListViewDataSetGenerator.get_instance_data_row(instance) for instance in qs]
+
+        make_general_absences(2)
+        # general absences with their author, then the departments
+        with self.assertNumQueries(2):
+            self.assertEqual(len(export()), 2)
+
+        make_general_absences(20)
+        with self.assertNumQueries(2):
+            rows = export()
+        self.assertEqual(len(rows), 22)
+        self.assertEqual(rows[-1][-1], 'IT, Nursing, Sales')
@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
@@ -6,7 +8,7 @@ from model_bakery import baker
 
 from absence.utils import *
 from account.models import Company
-from constants.db import ABSENCE_ENTITLEMENT_PERIOD_CHOICE
+from constants.db import ABSENCE_ENTITLEMENT_PERIOD_CHOICE, COMPANY_ROLE_CHOICES
 
 
 class TestUtils(TestCase):
@@ -146,6 +148,31 @@ class TestUtils(TestCase):
         res = get_entitlement_overflow_interval_year(absence_1)
         self.assertEqual(res, dict(start='2020-01-01', end='2020-12-31', consumed=15))
 
+    def test_get_entitlement_overflow_interval_single_query(self):
+        absence_type = baker.make(EmployeeAbsenceType, entitlement=5, period=ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK)
+        company = baker.make(Company)
+        submitted_for = baker.make(Employee, company=company)
+
+        for day in [4, 11, 18, 25]:
+            baker.make(EmployeeAbsence, absence_type=absence_type, company=company, submitted_for=submitted_for,
+                       start=timezone.make_aware(dt.datetime(2020, 6, day, 0, 0)),
+                       end=timezone.make_aware(dt.datetime(2020, 6, day + 2, 0, 0)),
+                       status=ABSENCE_STATUS_CHOICES.APPROVED)
+
+        start = timezone.make_aware(dt.datetime(2020, 3, 2, 0, 0))
+        end = timezone.make_aware(dt.datetime(2020, 9, 28, 0, 0))
+        absence = baker.make(EmployeeAbsence, absence_type=absence_type, start=start, end=end,
+                             company=company, status=ABSENCE_STATUS_CHOICES.PENDING, submitted_for=submitted_for)
+
+        with self.assertNumQueries(1):
+            res = get_entitlement_overflow_interval(absence, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK)
+        self.assertEqual(res, dict(start='2020-03-02', end='2020-03-08', consumed=0))
+
+        absence_type.entitlement = 7
+        with self.assertNumQueries(1):
+            res = get_entitlement_overflow_interval(absence, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK)
+        self.assertEqual(res, dict(start='2020-06-01', end='2020-06-07', consumed=2))
+
     def test_create_default_absence_types(self):
         company_1 = baker.make(Company)
         company_2 = baker.make(Company)
@@ -157,3 +184,41 @@ class TestUtils(TestCase):
         self.assertEqual(6, EmployeeAbsenceType.objects.filter(company=company_2).count())
         self.assertEqual(12, EmployeeAbsenceType.objects.all().count())
 
+
+    def test_get_employee_absences_events_queryset_window(self):
+        company = baker.make(Company)
+        manager = baker.make(Employee, company=company, role=COMPANY_ROLE_CHOICES.MANAGER)
+        employee = baker.make(Employee, company=company)
+
+        absences = [
+            baker.make(EmployeeAbsence, company=company, submitted_for=employee, status=ABSENCE_STATUS_CHOICES.APPROVED,
+                       start=timezone.make_aware(dt.datetime(2020, month, 10)),
+                       end=timezone.make_aware(dt.datetime(2020, month, 20)))
+            for month in (1, 5, 9)
+        ]
+
+        start = timezone.make_aware(dt.datetime(2020, 5, 20))
+        end = timezone.make_aware(dt.datetime(2020, 6, 1))
+        qs = get_employee_absences_events_queryset(employee, manager, start, end)
+        self.assertEqual(list(qs), [])
+
+        start = timezone.make_aware(dt.datetime(2020, 5, 1))
+        qs = get_employee_absences_events_queryset(employee, manager, start, end)
+        self.assertEqual(list(qs), [absences[1]])
+
+        qs = get_employee_absences_events_queryset(employee, manager)
+        self.assertEqual(qs.count(), 3)
+
+    @patch('absence.utils.PUSH_CHUNK_SIZE', 2)
+    @patch('absence.utils.push_notification')
+    def test_notify_subordinates_about_general_absence(self, push_notification):
+        company = baker.make(Company)
+        employees = baker.make(Employee, company=company, _quantity=5)
+        baker.make(Employee, company=baker.make(Company))
+        absence = baker.make(GeneralAbsence, company=company, status=ABSENCE_STATUS_CHOICES.APPROVED)
+
+        notify_subordinates_about_general_absence(absence)
+
+        chunks = [c[0][1] for c in push_notification.call_args_list]
+        self.assertEqual([len(c) for c in chunks], [2, 2, 1])
+        self.assertEqual({pk for c in chunks for pk in c}, {e.pk for e in employees})
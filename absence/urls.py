@@ -1,12 +1,18 @@
+from django.urls import path
 from rest_framework import routers
 
+from .views import calendar_feed
 from .viewsets.absence_type_viewset import EmployeeAbsenceTypeViewSet
 from .viewsets.employee_absence_viewset import EmployeeAbsenceViewSet
+from .viewsets.export_job_viewset import ExportJobViewSet
 from .viewsets.general_absence_viewset import GeneralAbsenceViewSet
 
 router = routers.SimpleRouter()
 router.register(r'absence', EmployeeAbsenceViewSet, base_name='absence')
 router.register(r'absence_type', EmployeeAbsenceTypeViewSet, base_name='absence_type')
 router.register(r'general_absence', GeneralAbsenceViewSet, base_name='general_absence')
+router.register(r'export_job', ExportJobViewSet, base_name='export_job')
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('calendar_feed/<str:token>.ics', calendar_feed, name='calendar_feed'),
+]
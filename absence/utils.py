@@ -1,10 +1,19 @@
 import datetime as dt
+import hashlib
+from collections import defaultdict
+from itertools import islice
 
-from django.db.models import Q
+from django.db.models import Q, Max, Count
+from django.utils import timezone
+from django.utils.http import quote_etag
 from django.utils.translation import ugettext_lazy as _
+from psycopg2.extras import DateTimeTZRange
 
 from absence import emails
-from absence.models import EmployeeAbsenceType, EmployeeAbsence, GeneralAbsence
+from absence.balance import (get_absence_periods, get_absence_balances, get_absence_balance,
+                             get_period_start, get_next_period_start)
+from absence.events import CALENDAR_EVENT_FIELDS, ABSENCE_EVENT_FIELDS, GENERAL_ABSENCE_EVENT_FIELDS
+from absence.models import EmployeeAbsenceType, EmployeeAbsence, GeneralAbsence, AbsenceBalance
 from account.models import Employee
 from constants.db import ABSENCE_STATUS_CHOICES, DURATION, ABSENCE_ENTITLEMENT_PERIOD_CHOICE
 from core.verbs import (
@@ -13,6 +22,7 @@ from core.verbs import (
 )
 from helpers.formatting import formatted_date, formatted_datetime, local_datetime, local_date
 from notification.utils import push_notification
+from shift.models import Shift
 from shift.utils import get_shift_events_queryset
 
 
@@ -36,6 +46,7 @@ def notify_subordinate_about_absence_status_updated(instance, comment=None):
         email = emails.AbsenceUpdated(absence=instance, comment=comment)
         email.send()
 
+
 def can_be_notify(instance):
     return instance.submitted_to != instance.submitted_for
 
@@ -103,22 +114,27 @@ def get_leaves_duration(start_date, end_date):
     return (end_date - start_date).days
 
 
+def format_leave_start(start, hourly):
+    if hourly:
+        return formatted_datetime(local_datetime(start))
+    return formatted_date(start)
+
+
+def format_leave_end(end, hourly):
+    if hourly:
+        return formatted_datetime(local_datetime(end))
+    return formatted_date(end - dt.timedelta(seconds=1))
+
+
 def get_leave_start(absence):
-    if absence.is_hourly():
-        return formatted_datetime(local_datetime(absence.start))
-    return formatted_date(absence.start)
+    return format_leave_start(absence.start, absence.is_hourly())
 
 
 def get_leave_end(absence):
-    if absence.is_hourly():
-        return formatted_datetime(local_datetime(absence.end))
-    return formatted_date(absence.end - dt.timedelta(seconds=1))
-
+    return format_leave_end(absence.end, absence.is_hourly())
 
-def get_leaves_duration_string(absence):
-    start, end = absence.start, absence.end
 
-    td = (end - start)
+def format_leaves_duration(td):
     days, hours, minutes = td.days, td.seconds // 3600, (td.seconds // 60) % 60
 
     res = ''
@@ -142,168 +158,152 @@ def get_leaves_duration_string(absence):
     return " ".join(res.split())
 
 
-def get_already_taken_leaves(absence, status):
-    year = dt.datetime.now().year
-    start_date = dt.datetime(year=year, month=1, day=1)
-    end_date = dt.datetime(year=year, month=12, day=31)
-
-    leaves_taken = get_overlap_absences(start_date, end_date, absence.submitted_for, status)
+def get_leaves_duration_string(absence):
+    return format_leaves_duration(absence.end - absence.start)
 
-    number_of_leaves = 0
-    for leave in leaves_taken:
-        number_of_leaves += (leave.end - leave.start).days
-    return number_of_leaves
 
+def get_already_taken_leaves(absence):
+    absence_type = absence.absence_type
+    period_start = get_period_start(timezone.now(), absence_type.period)
+    return get_absence_balance(absence.submitted_for, absence_type, period_start)
 
-def get_week_start(date):
-    return date - dt.timedelta(days=date.weekday())
 
+def get_entitlement_windows(absence, period):
+    """(first day, last day, days of the absence) for every entitlement period the absence touches."""
+    return [(period_start, get_next_period_start(period_start, period) - dt.timedelta(days=1), days)
+            for period_start, days in get_absence_periods(absence.start, absence.end, period)]
 
-def get_week_end(date):
-    start = date - dt.timedelta(days=date.weekday())
-    end = start + dt.timedelta(days=7)
-    return end
 
-def get_consumed_absence(absences):
-    absence_consumed = 0
-    for r in absences:
-        absence_consumed += get_leaves_duration(r.start, r.end)
-    return absence_consumed
+def get_window_overflow(windows, consumed, entitlement):
+    """First window where the days already consumed (per window start) and the absence exceed the entitlement."""
+    for w_start, w_end, days in windows:
+        if consumed.get(w_start, 0) + days > entitlement:
+            return dict(start=formatted_date(w_start), end=formatted_date(w_end), consumed=consumed.get(w_start, 0))
+    return None
 
 
-def generate_series_between_two_dates(start, end, freq='W-MON'):
-    import pandas as pd
-    return list(pd.date_range(start, end, freq=freq))
+def get_entitlement_overflow_interval(absence, period):
+    windows = get_entitlement_windows(absence, period)
+    # a single read of the ledger for the whole span
+    consumed = get_absence_balances(absence.submitted_for, absence.absence_type, [w[0] for w in windows])
 
+    # an approved absence is already part of the ledger, it must not be counted twice
+    if absence.status == ABSENCE_STATUS_CHOICES.APPROVED:
+        for w_start, _w_end, days in windows:
+            consumed[w_start] = consumed.get(w_start, 0) - days
 
-def get_entitlement_overflow_interval_week(absence):
-    interval = generate_series_between_two_dates(absence.start, absence.end, freq='W-MON')
+    return get_window_overflow(windows, consumed, absence.absence_type.entitlement)
 
-    w_start = get_week_start(absence.start)
-    w_end = get_week_end(absence.end)
-    w_interval = [w_start] + list(interval) + [w_end]
 
-    for i in range(0, len(w_interval) - 1):
-        w_start = w_interval[i]
-        w_end = w_interval[i + 1]
-        qs = get_overlap_absences(start=w_start,employee=absence.submitted_for,
-                                  end=w_end, status=ABSENCE_STATUS_CHOICES.APPROVED)
-        qs = qs.exclude(pk=absence.pk)
+def get_entitlement_overflows(absences):
+    """
+    Entitlement check for approving several absences at once: every absence also
+    consumes the days of the absences approved before it in the same batch.
+    """
+    absences = sorted(absences, key=lambda a: a.start)
+    windows = {a.pk: get_entitlement_windows(a, a.absence_type.period) for a in absences}
 
-        absences_consumed = get_consumed_absence(qs)
-        start = w_start
-        end = w_end
+    qs = AbsenceBalance.objects.filter(employee_id__in={a.submitted_for_id for a in absences},
+                                       absence_type_id__in={a.absence_type_id for a in absences})
+    qs = qs.filter(period_start__in={w[0] for absence_windows in windows.values() for w in absence_windows})
+    consumed = defaultdict(dict)
+    for employee_id, absence_type_id, period_start, days in qs.values_list('employee_id', 'absence_type_id',
+                                                                          'period_start', 'consumed'):
+        consumed[(employee_id, absence_type_id)][period_start] = days
 
-        if w_start < absence.start:
-            start = absence.start
-        if w_end > absence.end:
-            end = absence.end
+    # approved absences of the batch are already part of the ledger
+    for absence in absences:
+        if absence.status == ABSENCE_STATUS_CHOICES.APPROVED:
+            taken = consumed[(absence.submitted_for_id, absence.absence_type_id)]
+            for w_start, _w_end, days in windows[absence.pk]:
+                taken[w_start] = taken.get(w_start, 0) - days
 
-        duration = get_leaves_duration(start, end)
+    overflows = {}
+    for absence in absences:
+        entitlement = absence.absence_type.entitlement
+        taken = consumed[(absence.submitted_for_id, absence.absence_type_id)]
 
-        if absences_consumed + duration >absence.absence_type.entitlement:
-            f_start = formatted_date(w_start)
-            f_end = formatted_date(w_end + dt.timedelta(days=-1))
-            return dict(start=f_start, end=f_end, consumed=absences_consumed)
+        overflow = get_window_overflow(windows[absence.pk], taken, entitlement) if entitlement > 0 else None
+        if overflow is not None:
+            overflows[absence.pk] = overflow
+            continue
 
-    return None
+        for w_start, _w_end, days in windows[absence.pk]:
+            taken[w_start] = taken.get(w_start, 0) + days
 
-def get_entitlement_overflow_interval_month(absence):
-    interval = generate_series_between_two_dates(absence.start, absence.end, freq='MS')
+    return overflows
 
 
-    m_start = absence.start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    m_end = absence.end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)+ dt.timedelta(days=32)
-    m_end = m_end.replace(day=1)
-    m_interval = [m_start] + list(interval) + [m_end]
+def get_absences_with_shift_overlap(absences):
+    """Absences overlapping a shift their employee is allocated in, looked up with a single query."""
+    absences = [a for a in absences if a.end is not None]
+    if not absences:
+        return []
 
-    for i in range(0, len(m_interval) - 1):
-        m_start = m_interval[i]
-        m_end = m_interval[i + 1]
-        qs = get_overlap_absences(start=m_start,employee=absence.submitted_for,
-                                  end=m_end, status=ABSENCE_STATUS_CHOICES.APPROVED)
-        qs = qs.exclude(pk=absence.pk)
+    qs = Shift.objects.filter(employees_allocated__in={a.submitted_for_id for a in absences},
+                              start__lt=max(a.end for a in absences),
+                              end__gt=min(a.start for a in absences))
 
-        absences_consumed = get_consumed_absence(qs)
-        start = m_start
-        end = m_end
+    shifts = defaultdict(list)
+    for employee_id, start, end in qs.values_list('employees_allocated', 'start', 'end'):
+        shifts[employee_id].append((start, end))
 
-        if m_start < absence.start:
-            start = absence.start
-        if m_end > absence.end:
-            end = absence.end
+    return [a for a in absences if any(start < a.end and end > a.start for start, end in shifts[a.submitted_for_id])]
 
-        duration = get_leaves_duration(start, end)
 
-        if absences_consumed + duration >absence.absence_type.entitlement:
-            f_start = formatted_date(m_start)
-            f_end = formatted_date(m_end + dt.timedelta(days=-1))
-            return dict(start=f_start, end=f_end, consumed=absences_consumed)
+def get_entitlement_overflow_interval_week(absence):
+    return get_entitlement_overflow_interval(absence, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_WEEK)
 
-    return None
 
+def get_entitlement_overflow_interval_month(absence):
+    return get_entitlement_overflow_interval(absence, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_MONTH)
 
 
 def get_entitlement_overflow_interval_year(absence):
-    interval = generate_series_between_two_dates(absence.start, absence.end, freq='A')
-
+    return get_entitlement_overflow_interval(absence, ABSENCE_ENTITLEMENT_PERIOD_CHOICE.PER_YEAR)
 
-    y_start = absence.start.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    y_end = absence.end.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)+ dt.timedelta(days=370)
-    y_end = y_end.replace(month=1, day=1) - dt.timedelta(days=1)
-    m_interval = [y_start] + list(interval) + [y_end]
 
-    for i in range(0, len(m_interval) - 1):
-        y_start = m_interval[i]
-        y_end = m_interval[i + 1]
-        qs = get_overlap_absences(start=y_start,employee=absence.submitted_for,
-                                  end=y_end,status=ABSENCE_STATUS_CHOICES.APPROVED)
-        qs = qs.exclude(pk=absence.pk)
+def get_general_absence_audience(instance):
+    audience = Employee.objects.filter(company=instance.company)
+    departments = instance.department.all()
+    if departments.exists():
+        audience = audience.filter(department__in=departments)
+    return audience
 
-        absences_consumed = get_consumed_absence(qs)
-        start = y_start
-        end = y_end
 
-        if y_start < absence.start:
-            start = absence.start
-        if y_end > absence.end:
-            end = absence.end
+PUSH_CHUNK_SIZE = 1000
 
-        duration = get_leaves_duration(start, end)
 
-        if absences_consumed + duration >absence.absence_type.entitlement:
-            f_start = formatted_date(y_start)
-            f_end = formatted_date(y_end)
-            return dict(start=f_start, end=f_end, consumed=absences_consumed)
-
-    return None
+def iter_id_chunks(qs, size):
+    """Lists of at most size ids of qs, read with a server side cursor."""
+    ids = qs.order_by().values_list('id', flat=True).iterator(chunk_size=size)
+    chunk = list(islice(ids, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(ids, size))
 
 
 def notify_subordinates_about_general_absence(instance):
     if instance.status == ABSENCE_STATUS_CHOICES.APPROVED:
-        audience = Employee.objects.filter(company=instance.company)
-        departments = instance.department.all()
-        if departments.exists():
-            audience = audience.filter(department__in=departments)
+        for audience_ids in iter_id_chunks(get_general_absence_audience(instance), PUSH_CHUNK_SIZE):
+            push_notification(GENERAL_ABSENCE_CREATED, audience_ids, instance)
 
-        audience_ids = audience.all().values_list('id', flat=True)
-        push_notification(GENERAL_ABSENCE_CREATED, audience_ids, instance)
 
-        email = emails.GeneralAbsencePublished(absence=instance, iterable=audience)
-        email.send()
+def get_overlap_range(start, end):
+    # like the TSTZRANGE of a stored absence without end, the range is unbounded above
+    if end is None:
+        return DateTimeTZRange(start, None, '[)')
+    if end <= start:
+        # an empty range overlaps nothing, a point in time still has to clash with the absences around it
+        return DateTimeTZRange(end, start, '[]')
+    return DateTimeTZRange(start, end, '[)')
 
 
 def get_overlap_absences(start, end, employee, status=None):
-    start = start + dt.timedelta(seconds=1)
-    end = end + dt.timedelta(seconds=-1)
-
     queryset = EmployeeAbsence.objects.filter(company=employee.company, submitted_for=employee)
 
-    queryset = queryset.filter(
-        Q(end__range=(start, end)) |
-        Q(start__range=(start, end)) |
-        Q(start__lte=start, end__gte=end)
-    )
+    queryset = queryset.annotate(period=EmployeeAbsence.get_period_expression())
+    queryset = queryset.filter(period__overlap=get_overlap_range(start, end))
 
     if status is not None:
         queryset = queryset.filter(status=status)
@@ -324,19 +324,49 @@ def get_general_absence_qs_filter(user):
 
     return q
 
-def get_employee_absences_events_queryset(profile, user):
+def filter_events_window(qs, start=None, end=None):
+    if start is not None:
+        qs = qs.filter(end__gt=start)
+    if end is not None:
+        qs = qs.filter(start__lt=end)
+    return qs
+
+def get_employee_absences_events_queryset(profile, user, start=None, end=None):
     qs = EmployeeAbsence.get_event_queryset(submitted_for=profile)
     qs = qs.filter(company=user.company, status=ABSENCE_STATUS_CHOICES.APPROVED)
 
     if user.is_employee():
         qs = qs.filter(submitted_for=user)
 
-    return qs
+    return filter_events_window(qs, start, end)
 
-def get_general_absences_events_queryset(profile, user):
+def get_general_absences_events_queryset(profile, user, start=None, end=None):
     q = get_general_absence_qs_filter(profile)
-    return GeneralAbsence.get_event_queryset(q).filter(deleted_at__isnull=True)
+    qs = GeneralAbsence.get_event_queryset(q).filter(deleted_at__isnull=True)
+    return filter_events_window(qs, start, end)
+
+def get_calendar_event_rows(profile, user, start, end):
+    """Rows of the absences, general absences and shifts of the profile overlapping the window, each ordered by start."""
+    absences, general_absences, shifts = get_calendar_querysets(profile, user, start, end)
+    return (absences.order_by('start').values_list(*ABSENCE_EVENT_FIELDS).iterator(),
+            general_absences.order_by('start').values_list(*GENERAL_ABSENCE_EVENT_FIELDS).iterator(),
+            shifts.order_by('start').values_list(*CALENDAR_EVENT_FIELDS).iterator())
+
+
+def get_calendar_querysets(profile, user, start, end):
+    return (get_employee_absences_events_queryset(profile, user, start, end),
+            get_general_absences_events_queryset(profile, user, start, end),
+            filter_events_window(get_shift_events_queryset(profile, user), start, end))
+
+
+def get_calendar_fingerprint(profile, user, start, end):
+    """ETag and last modification of the calendar window, from a max(modified) and count per event source."""
+    stats = [qs.order_by().aggregate(last_modified=Max('modified'), count=Count('id'))
+             for qs in get_calendar_querysets(profile, user, start, end)]
+    last_modified = max((s['last_modified'] for s in stats if s['last_modified'] is not None), default=None)
 
+    key = ':'.join([str(user.pk), str(profile.pk)] + [f'{s["last_modified"]}/{s["count"]}' for s in stats])
+    return quote_etag(hashlib.md5(key.encode()).hexdigest()), last_modified
 
 def create_shift_absence(employee_shift, request_user):
     absence_type = EmployeeAbsenceType.objects.filter(duration=DURATION.SHIFT, company=request_user.company).first()
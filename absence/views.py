@@ -0,0 +1,16 @@
+from django.http import Http404, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from absence.feeds import iter_cached_feed
+from absence.models import CalendarFeedToken
+
+
+@require_GET
+def calendar_feed(_request, token):
+    feed_token = CalendarFeedToken.objects.select_related('employee').filter(token=token).first()
+    if feed_token is None or feed_token.employee.resigned:
+        raise Http404
+
+    response = StreamingHttpResponse(iter_cached_feed(feed_token.employee), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    return response
@@ -4,6 +4,7 @@ from rest_framework import viewsets
 from rest_framework.response import Response
 
 from absence.filters import EmployeeAbsenceTypeFilter
+from absence.mixins import ExportJobMixin
 from absence.models import EmployeeAbsenceType
 from absence.modules.dataset_generator import AbsenceTypeListViewDataSetGenerator
 from absence.permissions import EmployeeAbsenceTypePermission
@@ -21,6 +22,7 @@ class EmployeeAbsenceTypeViewSet(ModelHistoryMixin,
                                  QuerySetMixin,
                                  ArchivedActionMixin,
                                  ExportMixin,
+                                 ExportJobMixin,
                                  viewsets.ModelViewSet,
                                  ):
     permission_classes = [EmployeeAbsenceTypePermission]
@@ -48,6 +50,9 @@ class EmployeeAbsenceTypeViewSet(ModelHistoryMixin,
     def get_export_archived_queryset(self):
         return self.get_inactive_queryset()
 
+    def get_export_archived_job_queryset(self):
+        return self.get_inactive_queryset()
+
     @decorators.action(methods=['get'], detail=False)
     def export(self, *_args, **_kwargs):
         return self.export_data()
@@ -56,6 +61,10 @@ class EmployeeAbsenceTypeViewSet(ModelHistoryMixin,
     def export_archived(self, *_args, **_kwargs):
         return self.export_data()
 
+    @decorators.action(methods=['post'], detail=False)
+    def export_archived_job(self, *args, **kwargs):
+        return self.export_job(*args, **kwargs)
+
     @decorators.action(detail=False, methods=['post'])
     def mark_todo_complete(self, request, *_args, **_kwargs):
         todo = Todo.objects.filter(company=request.user.company, type=TODO_TYPE_CHOICES.CHECK_ABSENCE_TYPES).first()
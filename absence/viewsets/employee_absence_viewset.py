@@ -1,30 +1,51 @@
+import datetime as dt
+
 from django.db.models import Prefetch
 from django.db.models.query_utils import Q
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, status, decorators
+from rest_framework import viewsets, status, decorators, serializers
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.fields import empty
 from rest_framework.response import Response
 
+from absence.balance import get_employee_balances
+from absence.conditional import get_not_modified_response, set_conditional_headers
+from absence.events import stream_events
 from absence.filters import EmployeeAbsenceFilter
-from absence.models import EmployeeAbsence, EmployeeAbsenceComment
+from absence.mixins import ExportJobMixin
+from absence.models import (EmployeeAbsence, EmployeeAbsenceComment, EmployeeAbsenceType, CalendarFeedToken,
+                            AbsenceNotificationSetting)
 from absence.modules.dataset_generator import EmployeeAbsenceListViewDataSetGenerator
+from absence.modules.streaming_export import stream_export, get_export_formats
+from absence.occupancy import get_department_occupancy
 from absence.permissions import EmployeeAbsencePermission
 from absence.serializers.employee_absence_serializer import (
     EmployeeAbsenceListSerializer, EmployeeAbsenceCreateSerializer,
-    EmployeeAbsenceStatusUpdateSerializer,
+    EmployeeAbsenceStatusUpdateSerializer, EmployeeAbsenceBulkStatusUpdateSerializer,
+    AbsenceNotificationSettingSerializer,
 )
-from absence.utils import get_already_taken_leaves
-from account.models import Employee
-from constants.db import ABSENCE_STATUS_CHOICES
+from absence.utils import (get_already_taken_leaves, get_calendar_event_rows,
+                           get_calendar_fingerprint)
+from account.models import Employee, Department
+from constants.db import DURATION
 from core.filters import TrigramSearchFilterBackend
 from core.mixins import GetSerializerMixin, QuerySetMixin, ExportMixin
 from core.utils import check_users_access
 from history.mixins import ModelHistoryMixin
 
+CALENDAR_MAX_DAYS = 62
+OCCUPANCY_MAX_DAYS = 92
+
 
 class EmployeeAbsenceViewSet(GetSerializerMixin,
                              ModelHistoryMixin,
                              QuerySetMixin,
                              ExportMixin,
+                             ExportJobMixin,
                              viewsets.ModelViewSet):
     permission_classes = [EmployeeAbsencePermission]
     exportGenerator = EmployeeAbsenceListViewDataSetGenerator
@@ -37,6 +58,7 @@ class EmployeeAbsenceViewSet(GetSerializerMixin,
     serializer_action_classes = {
         'create': EmployeeAbsenceCreateSerializer,
         'status': EmployeeAbsenceStatusUpdateSerializer,
+        'bulk_status': EmployeeAbsenceBulkStatusUpdateSerializer,
         'user_absences': EmployeeAbsenceListSerializer
     }
 
@@ -82,14 +104,156 @@ class EmployeeAbsenceViewSet(GetSerializerMixin,
     def status(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
+    @decorators.action(['put'], detail=False)
+    def bulk_status(self, request, *_args, **_kwargs):
+        serializer = self.get_serializer(data=request.data)
+
+        # the validation of the status tells about the balances and shifts of every absence
+        absence_ids = serializer.fields['absences'].run_validation(request.data.get('absences', empty))
+        absences = serializer.get_absences(absence_ids)
+        for absence in absences:
+            self.check_object_permissions(request, absence)
+
+        serializer.context['absences'] = absences
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
     @decorators.action(methods=['get'], detail=False)
     def export(self, *_args, **_kwargs):
         return self.export_data()
 
+    @decorators.action(methods=['get'], detail=False)
+    def export_stream(self, request, *_args, **_kwargs):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in get_export_formats():
+            raise serializers.ValidationError({'file_format': _('UNSUPPORTED_EXPORT_FORMAT')})
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return stream_export(self.exportGenerator, queryset, self.exportGenerator.title, file_format)
+
+    def get_balances_employees(self, query_params):
+        request_user = self.get_request_user()
+        qs = Employee.objects.filter(company=request_user.company)
+
+        if request_user.is_employee():
+            qs = qs.filter(pk=request_user.pk)
+        if request_user.is_staff_():
+            qs = qs.filter(department=request_user.department)
+
+        departments = query_params.getlist('department')
+        if departments:
+            qs = qs.filter(department__in=departments)
+
+        employees = query_params.getlist('employee')
+        if employees:
+            qs = qs.filter(pk__in=employees)
+        return qs
+
+    def get_balances_absence_types(self, query_params):
+        request_user = self.get_request_user()
+        qs = EmployeeAbsenceType.objects.filter(company=request_user.company).exclude(duration=DURATION.SHIFT)
+
+        absence_types = query_params.getlist('absence_type')
+        if absence_types:
+            qs = qs.filter(pk__in=absence_types)
+        return qs
+
+    @decorators.action(methods=['get'], detail=False)
+    def balances(self, request, *_args, **_kwargs):
+        employees = self.get_balances_employees(request.query_params)
+        absence_types = self.get_balances_absence_types(request.query_params)
+        return Response(get_employee_balances(employees, absence_types))
+
+    def get_calendar_profile(self, query_params):
+        request_user = self.get_request_user()
+        employee_id = query_params.get('employee', request_user.pk)
+        employee = Employee.objects.filter(pk=employee_id).first()
+
+        if employee is None or not check_users_access(employee, request_user):
+            raise Http404
+        return employee
+
+    @staticmethod
+    def get_date_window(query_params, max_days):
+        try:
+            start = dt.datetime.strptime(query_params.get('start', ''), '%Y-%m-%d')
+            end = dt.datetime.strptime(query_params.get('end', ''), '%Y-%m-%d') + dt.timedelta(days=1)
+        except ValueError:
+            raise serializers.ValidationError(_('START_AND_END_DATES_ARE_REQUIRED'))
+
+        if not start < end <= start + dt.timedelta(days=max_days):
+            raise serializers.ValidationError(_(f'ONLY_{max_days}_DAYS_ARE_ALLOWED'))
+        return start, end
+
+    def get_calendar_window(self, query_params):
+        start, end = self.get_date_window(query_params, CALENDAR_MAX_DAYS)
+        return timezone.make_aware(start), timezone.make_aware(end)
+
+    @decorators.action(methods=['get'], detail=False)
+    def calendar(self, request, *_args, **_kwargs):
+        profile = self.get_calendar_profile(request.query_params)
+        start, end = self.get_calendar_window(request.query_params)
+        user = self.get_request_user()
+
+        etag, last_modified = get_calendar_fingerprint(profile, user, start, end)
+        response = get_not_modified_response(request, etag, last_modified)
+        if response is None:
+            rows = get_calendar_event_rows(profile, user, start, end)
+            response = StreamingHttpResponse(stream_events(*rows), content_type='application/json')
+        return set_conditional_headers(response, etag, last_modified)
+
+    def get_occupancy_departments(self, query_params):
+        request_user = self.get_request_user()
+        if request_user.is_employee():
+            raise PermissionDenied()
+
+        qs = Department.objects.filter(company=request_user.company)
+        if request_user.is_staff_():
+            qs = qs.filter(pk=request_user.department_id)
+
+        departments = query_params.getlist('department')
+        if departments:
+            qs = qs.filter(pk__in=departments)
+        return list(qs.values_list('pk', flat=True))
+
+    @decorators.action(methods=['get'], detail=False)
+    def occupancy(self, request, *_args, **_kwargs):
+        request_user = self.get_request_user()
+        departments = self.get_occupancy_departments(request.query_params)
+        start, end = self.get_date_window(request.query_params, OCCUPANCY_MAX_DAYS)
+
+        occupancy = get_department_occupancy(request_user.company, departments, start.date(),
+                                             end.date() - dt.timedelta(days=1), timezone.get_current_timezone_name())
+        return Response({'start': start.date(), 'days': (end - start).days, 'departments': occupancy})
+
+    @decorators.action(methods=['get', 'post'], detail=False)
+    def calendar_feed_token(self, request, *_args, **_kwargs):
+        if request.method == 'POST':
+            feed_token, created = CalendarFeedToken.objects.get_or_create(employee=self.get_request_user())
+            if not created:
+                feed_token.rotate()
+        else:
+            feed_token = CalendarFeedToken.objects.filter(employee=self.get_request_user()).first()
+            if feed_token is None:
+                return Response({'token': None, 'url': None})
+
+        url = request.build_absolute_uri(reverse('calendar_feed', args=[feed_token.token]))
+        return Response({'token': feed_token.token, 'url': url})
+
+    @decorators.action(methods=['get', 'put'], detail=False)
+    def notification_settings(self, request, *_args, **_kwargs):
+        setting, _created = AbsenceNotificationSetting.objects.get_or_create(employee=self.get_request_user())
+        if request.method == 'PUT':
+            serializer = AbsenceNotificationSettingSerializer(setting, data=request.data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return Response(AbsenceNotificationSettingSerializer(setting).data)
+
     @decorators.action(methods=['get'], detail=True)
     def detail_history(self, _request, *_args, **_kwargs):
         absence = self.get_object()
-        leaves_taken = get_already_taken_leaves(absence, status=ABSENCE_STATUS_CHOICES.APPROVED)
+        leaves_taken = get_already_taken_leaves(absence)
         serializer = self.get_serializer(absence)
         history_data = {'already_taken': leaves_taken,
                         'current_allowance': absence.absence_type.entitlement - leaves_taken}
@@ -0,0 +1,27 @@
+import os
+
+from django.http import FileResponse
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import decorators, mixins, serializers, viewsets
+
+from absence.models import ExportJob, EXPORT_JOB_STATUS_CHOICES
+from absence.permissions import ExportJobPermission
+from absence.serializers.export_job_serializer import ExportJobSerializer
+
+
+class ExportJobViewSet(mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    permission_classes = [ExportJobPermission]
+    serializer_class = ExportJobSerializer
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(requested_by=self.request.user)
+
+    @decorators.action(methods=['get'], detail=True)
+    def download(self, *_args, **_kwargs):
+        instance = self.get_object()
+        if instance.status != EXPORT_JOB_STATUS_CHOICES.DONE:
+            raise serializers.ValidationError({'status': _('EXPORT_NOT_READY')})
+
+        return FileResponse(instance.file.open('rb'), as_attachment=True,
+                            filename=os.path.basename(instance.file.name))
@@ -3,8 +3,11 @@ from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import decorators
 from rest_framework import viewsets
+from rest_framework.response import Response
 
+from absence.delivery import get_delivery_progress
 from absence.filters import GeneralAbsenceFilter
+from absence.mixins import ExportJobMixin
 from absence.models import GeneralAbsence
 from absence.modules.dataset_generator import GeneralAbsenceListViewDataSetGenerator
 from absence.permissions import GeneralAbsencePermissions
@@ -23,6 +26,7 @@ class GeneralAbsenceViewSet(QuerySetMixin,
                             viewsets.ModelViewSet,
                             ArchivedActionMixin,
                             ExportMixin,
+                            ExportJobMixin,
                             ModelHistoryMixin):
     serializer_class = GeneralAbsenceSerializer
     permission_classes = [GeneralAbsencePermissions]
@@ -52,6 +56,9 @@ class GeneralAbsenceViewSet(QuerySetMixin,
     def get_export_archived_queryset():
         return GeneralAbsence.objects.filter(deleted_at__isnull=False)
 
+    def get_export_archived_job_queryset(self):
+        return self.get_export_archived_queryset()
+
     def filter_query(self):
         user = self.get_request_user()
         return get_general_absence_qs_filter(user)
@@ -64,6 +71,16 @@ class GeneralAbsenceViewSet(QuerySetMixin,
     def export_archived(self, *args, **kwargs):
         return self.export(*args, **kwargs)
 
+    @decorators.action(methods=['post'], detail=False)
+    def export_archived_job(self, *args, **kwargs):
+        return self.export_job(*args, **kwargs)
+
+    @decorators.action(methods=['get'], detail=True)
+    def delivery(self, *_args, **_kwargs):
+        instance = self.get_object()
+        progress = get_delivery_progress(instance.pk)
+        return Response(progress or dict(status=None, total=None, sent=0))
+
     def perform_destroy(self, instance):
         instance.deleted_at = timezone.now()
         instance.save()
\ No newline at end of file
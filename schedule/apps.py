@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ScheduleConfig(AppConfig):
     name = 'schedule'
+
+    def ready(self):
+        import schedule.receivers
+        schedule.receivers.connect()
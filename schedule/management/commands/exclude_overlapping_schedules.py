@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from schedule.models import SCHEDULE_OVERLAP_CONSTRAINT
+
+CONFLICTS_SQL = '''
+    SELECT a.id, b.id FROM schedule_schedule a
+    JOIN schedule_schedule b ON a.department_id = b.department_id AND a.id < b.id
+     AND TSTZRANGE(a."start", a."end", '[]') && TSTZRANGE(b."start", b."end", '[]')
+'''
+
+ADD_CONSTRAINT_SQL = f'''
+    ALTER TABLE schedule_schedule ADD CONSTRAINT {SCHEDULE_OVERLAP_CONSTRAINT}
+    EXCLUDE USING gist (department_id WITH =, TSTZRANGE("start", "end", '[]') WITH &&)
+'''
+
+DROP_CONSTRAINT_SQL = f'ALTER TABLE schedule_schedule DROP CONSTRAINT IF EXISTS {SCHEDULE_OVERLAP_CONSTRAINT}'
+
+
+class Command(BaseCommand):
+    help = 'Let the database reject overlapping schedules of a department, or stop it with --drop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true', help='drop the exclusion constraint')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if options['drop']:
+                cursor.execute(DROP_CONSTRAINT_SQL)
+                self.stdout.write(self.style.SUCCESS(f'{SCHEDULE_OVERLAP_CONSTRAINT} dropped'))
+                return
+
+            cursor.execute(CONFLICTS_SQL)
+            conflicts = cursor.fetchall()
+            for first, second in conflicts:
+                self.stdout.write(f'schedule {first} overlaps schedule {second}')
+            if conflicts:
+                raise CommandError(f'{len(conflicts)} overlapping schedules have to be resolved first')
+
+            cursor.execute(DROP_CONSTRAINT_SQL)
+            cursor.execute(ADD_CONSTRAINT_SQL)
+        self.stdout.write(self.style.SUCCESS(f'{SCHEDULE_OVERLAP_CONSTRAINT} added'))
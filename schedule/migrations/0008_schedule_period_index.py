@@ -0,0 +1,18 @@
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0007_auto_20201202_1203'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.RunSQL(
+            sql='CREATE INDEX schedule_schedule_period_gist ON schedule_schedule '
+                'USING gist (department_id, TSTZRANGE("start", "end", \'[]\'))',
+            reverse_sql='DROP INDEX schedule_schedule_period_gist',
+        ),
+    ]
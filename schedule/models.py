@@ -4,10 +4,14 @@ from django.contrib.postgres.fields import JSONField
 from django.db import models
 from model_utils.models import TimeStampedModel
 
+from absence.models import TsTzRange
 from account.models import Employee
 from constants.db import SCHEDULE_STATUS_CHOICES, SCHEDULE_FEEDBACK_CHOICES
 from history.connector import connect
 
+# optional, see the exclude_overlapping_schedules command
+SCHEDULE_OVERLAP_CONSTRAINT = 'schedule_schedule_no_overlap'
+
 
 @connect()
 class Schedule(TimeStampedModel):
@@ -25,6 +29,12 @@ class Schedule(TimeStampedModel):
     comment = models.TextField(null=True, blank=True, max_length=500)
 
     generic_data = JSONField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0, help_text='bumped whenever the events of the schedule change')
+
+    @staticmethod
+    def get_period_expression():
+        # must stay identical to the expression of the GiST index (migration 0008)
+        return TsTzRange('start', 'end', models.Value('[]'))
 
     def make_timestamp(self):
         stamp = ScheduleTimestamp()
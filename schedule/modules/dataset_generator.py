@@ -1,18 +1,27 @@
+from django.db.models import Prefetch
 from django.utils.translation import gettext_lazy as _
 
 from account.modules.dataset_generator import BaseDataSetGenerator
 from constants.db import SCHEDULE_STATUS_CHOICES
 from helpers.formatting import formatted_date, local_date, formatted_datetime, local_datetime
+from shift_type.models import ShiftType
 
 
 class ScheduleListViewDataSetGenerator(BaseDataSetGenerator):
+    title = 'schedule_list'
+
     def __init__(self, queryset):
-        queryset = queryset.prefetch_related('department')
-        super().__init__(queryset, title='schedule_list')
+        super().__init__(self.get_export_queryset(queryset), title=self.title)
+
+    @staticmethod
+    def get_export_queryset(queryset):
+        return queryset.select_related('department').prefetch_related(
+            Prefetch('shift_types', queryset=ShiftType.objects.order_by('name').only('id', 'name'))
+        )
 
     @staticmethod
     def get_instance_data_row(instance):
-        shift_type_str = ', '.join(list(instance.shift_types.all().order_by('name').values_list('name', flat=True)))
+        shift_type_str = ', '.join(shift_type.name for shift_type in instance.shift_types.all())
         return [
             str(SCHEDULE_STATUS_CHOICES[instance.status]),
             formatted_date(local_date(instance.start)),
@@ -65,7 +65,7 @@ class SchedulePermission(BasePermission):
             return has_permission(request.user, perms.schedule.publish)
         if view.action in ['feedback', 'feedback_stats']:
             return has_permission(request.user, perms.schedule_feedback.view)
-        if view.action == 'export':
+        if view.action in ('export', 'export_job'):
             return has_permission(request.user, perms.schedule.export)
         if view.action == 'history':
             return has_permission(request.user, perms.schedule.history)
@@ -1,14 +1,39 @@
+from account.models import Department
 from constants.db import SCHEDULE_STATUS_CHOICES
 
 
+def get_permission_memo(user, obj):
+    """
+    What the checks of a user already read about the schedule. It is kept on the schedule
+    instance, which get_object loads again for every request, so nothing outlives the request.
+    """
+    memo = obj.__dict__.setdefault('_permission_memo', {})
+    return memo.setdefault(user.pk, {})
+
+
+def memoize(user, obj, name, get_value):
+    memo = get_permission_memo(user, obj)
+    if name not in memo:
+        memo[name] = get_value()
+    return memo[name]
+
+
 def is_user_allocated_in_schedule(user, obj):
-    return user.allocated_in.filter(schedule=obj, schedule__status=SCHEDULE_STATUS_CHOICES.PUBLISHED).exists()
+    return memoize(user, obj, 'allocated_in', lambda: user.allocated_in.filter(
+        schedule=obj, schedule__status=SCHEDULE_STATUS_CHOICES.PUBLISHED).exists())
 
 
-def is_user_same_department_of_schedule_or_allocated_in(user, obj):
-    is_allocated_in = is_user_allocated_in_schedule(user, obj)
+def get_schedule_company_id(user, obj):
+    # the department is joined by the queryset of the view
+    if obj._meta.get_field('department').is_cached(obj):
+        return obj.department.company_id
+    return memoize(user, obj, 'company_id', lambda: Department.objects.filter(
+        pk=obj.department_id).values_list('company_id', flat=True).first())
+
 
-    return obj.department_id == user.department_id or is_allocated_in
+def is_user_same_department_of_schedule_or_allocated_in(user, obj):
+    # the allocations are only queried when the department does not match
+    return obj.department_id == user.department_id or is_user_allocated_in_schedule(user, obj)
 
 
 def is_user_same_department_of_schedule(user, obj):
@@ -24,17 +49,14 @@ def is_schedule_end_after_user_created(user, obj):
 
 
 def schedule_for_employee(user, obj):
-    same_department = is_user_same_department_of_schedule_or_allocated_in(user, obj)
-    is_published = is_schedule_published(obj)
-    schedule_end_after_user_created = is_schedule_end_after_user_created(user, obj)
-
-    return user.is_employee() and same_department and is_published and schedule_end_after_user_created
+    return (user.is_employee()
+            and is_schedule_published(obj)
+            and is_schedule_end_after_user_created(user, obj)
+            and is_user_same_department_of_schedule_or_allocated_in(user, obj))
 
 
 def schedule_for_staff_or_allocated_in(user, obj):
-    same_department = is_user_same_department_of_schedule_or_allocated_in(user, obj)
-
-    return user.is_staff_() and same_department
+    return user.is_staff_() and is_user_same_department_of_schedule_or_allocated_in(user, obj)
 
 
 def schedule_for_staff(user, obj):
@@ -44,15 +66,14 @@ def schedule_for_staff(user, obj):
 
 
 def schedule_for_manager(user, obj):
-    return user.is_manager_admin_or_manager() and obj.department.company == user.company
+    return user.is_manager_admin_or_manager() and get_schedule_company_id(user, obj) == user.company_id
 
 
 def can_retrieve_schedule(user, obj):
-    for_employee = schedule_for_employee(user, obj)
-    for_staff = schedule_for_staff_or_allocated_in(user, obj)
-    for_manager = schedule_for_manager(user, obj)
-
-    return for_employee or for_staff or for_manager
+    # the roles are checked first, so at most one branch reads the database
+    return (schedule_for_employee(user, obj)
+            or schedule_for_staff_or_allocated_in(user, obj)
+            or schedule_for_manager(user, obj))
 
 
 def can_update_schedule(user, obj):
@@ -0,0 +1,61 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from absence.outbox import register_outbox_handler
+from core.tasks.schedule import task_collecting_preferences_tasks, task_publishing_tasks
+from schedule.models import Schedule
+from schedule.tasks import task_send_schedule_email
+from schedule.utils import bump_schedule_version, SCHEDULE_PUBLISHED_TOPIC, SCHEDULE_COLLECTING_PREFERENCES_TOPIC
+from shift.models import Shift
+
+
+def _shift_changed_receiver(**kwargs):
+    if not kwargs.get('raw'):
+        bump_schedule_version([kwargs['instance'].schedule_id])
+
+
+def _schedule_saved_receiver(**kwargs):
+    # the status decides which shifts the employees see
+    if not kwargs.get('raw') and not kwargs['created']:
+        bump_schedule_version([kwargs['instance'].pk])
+
+
+def _allocation_changed_receiver(**kwargs):
+    action, instance = kwargs['action'], kwargs['instance']
+
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        if not kwargs['reverse']:
+            schedule_ids = [instance.schedule_id]
+        elif action == 'pre_clear':
+            schedule_ids = instance.allocated_in.values_list('schedule_id', flat=True)
+        else:
+            schedule_ids = Shift.objects.filter(pk__in=kwargs['pk_set']).values_list('schedule_id', flat=True)
+        bump_schedule_version(schedule_ids)
+
+
+def _enqueue_schedule_email(message):
+    payload = message.payload
+    task_send_schedule_email.apply_async(args=[message.topic, payload['user_id'], payload['schedule_id']],
+                                         task_id=str(message.pk))
+
+
+def _schedule_published_handler(message):
+    task_publishing_tasks.apply_async(args=[message.payload['schedule_id']], task_id=message.payload['task_id'])
+    _enqueue_schedule_email(message)
+
+
+def _schedule_collecting_preferences_handler(message):
+    task_collecting_preferences_tasks.apply_async(args=[message.payload['schedule_id']],
+                                                  task_id=message.payload['task_id'])
+    _enqueue_schedule_email(message)
+
+
+def connect():
+    register_outbox_handler(SCHEDULE_PUBLISHED_TOPIC, _schedule_published_handler)
+    register_outbox_handler(SCHEDULE_COLLECTING_PREFERENCES_TOPIC, _schedule_collecting_preferences_handler)
+    post_save.connect(_schedule_saved_receiver, sender=Schedule,
+                      dispatch_uid='schedule_version_schedule_post_save_receiver')
+    post_save.connect(_shift_changed_receiver, sender=Shift, dispatch_uid='schedule_version_shift_post_save_receiver')
+    post_delete.connect(_shift_changed_receiver, sender=Shift,
+                        dispatch_uid='schedule_version_shift_post_delete_receiver')
+    m2m_changed.connect(_allocation_changed_receiver, sender=Shift.employees_allocated.through,
+                        dispatch_uid='schedule_version_allocation_receiver')
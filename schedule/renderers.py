@@ -0,0 +1,21 @@
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+
+class ColumnarJSONRenderer(BaseRenderer):
+    """Renders the already plain columnar event payload, with orjson when it is installed."""
+    media_type = 'application/json'
+    format = 'columnar'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is not None:
+            return orjson.dumps(data)
+        return json.dumps(data, separators=(',', ':'), default=str).encode()
@@ -1,7 +1,9 @@
 
-from django.db.models import Q, Min, Max
+from django.db import transaction, IntegrityError
+from django.db.models import Min, Max
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
+from psycopg2.extras import DateTimeTZRange
 from rest_framework import serializers
 
 from account.serializers import DepartmentSerializer, EmployeeAsChoiceSerializer
@@ -11,7 +13,7 @@ from core.tasks.schedule import (
     task_create_shifts_for_schedule
 )
 from helpers.serializers import ShiftTypeAsChoicesSerializer
-from schedule.models import Schedule, ScheduleFeedback
+from schedule.models import Schedule, ScheduleFeedback, SCHEDULE_OVERLAP_CONSTRAINT
 from shift.serializers import ShiftAsEventSerializer
 from shift.utils import get_shift_queryset
 from shift_type.models import ShiftType
@@ -104,11 +106,8 @@ class ScheduleCreateSerializer(ValidateDepartmentMixin, GenericDataFieldMixin, s
         department = data.get('department')
 
         schedule_qs = Schedule.objects.filter(department=department)
-        schedule_qs = schedule_qs.filter(
-            Q(end__range=(start, end)) |
-            Q(start__range=(start, end)) |
-            Q(start__lte=start, end__gte=end)
-        )
+        schedule_qs = schedule_qs.annotate(period=Schedule.get_period_expression())
+        schedule_qs = schedule_qs.filter(period__overlap=DateTimeTZRange(start, end, '[]'))
 
         if schedule_qs.exists():
             raise serializers.ValidationError(_(f'AN_OVERLAPPING_SCHEDULE_ALREADY_EXIST_FOR_THIS_DEPARTMENT'))
@@ -153,12 +152,22 @@ class ScheduleCreateSerializer(ValidateDepartmentMixin, GenericDataFieldMixin, s
         user = self.get_request_user()
         shifts = self.get_request_shifts()
         self.create_shift_type_snapshot(data)
-        instance = super().create(data)
+        instance = self.create_schedule(data)
         task = task_create_shifts_for_schedule.delay(shifts, str(instance.pk), user.timezone)
         self.task_id = task.task_id
 
         return instance
 
+    def create_schedule(self, data):
+        try:
+            with transaction.atomic():
+                return super().create(data)
+        except IntegrityError as e:
+            # a concurrent request got the same dates through validation first
+            if SCHEDULE_OVERLAP_CONSTRAINT in str(e):
+                raise serializers.ValidationError(_(f'AN_OVERLAPPING_SCHEDULE_ALREADY_EXIST_FOR_THIS_DEPARTMENT'))
+            raise
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation['task_id'] = self.task_id
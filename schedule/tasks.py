@@ -0,0 +1,21 @@
+from celery import shared_task
+
+from account.models import Employee
+from schedule.models import Schedule
+from schedule.utils import (send_email_on_collect_preferences_schedule, send_email_on_publish_schedule,
+                            SCHEDULE_PUBLISHED_TOPIC, SCHEDULE_COLLECTING_PREFERENCES_TOPIC)
+
+SCHEDULE_EMAILS = {
+    SCHEDULE_PUBLISHED_TOPIC: send_email_on_publish_schedule,
+    SCHEDULE_COLLECTING_PREFERENCES_TOPIC: send_email_on_collect_preferences_schedule,
+}
+
+
+@shared_task()
+def task_send_schedule_email(topic, user_id, schedule_id):
+    schedule = Schedule.objects.filter(pk=schedule_id).first()
+    request_user = Employee.objects.filter(pk=user_id).first()
+    if schedule is None or request_user is None:
+        return
+
+    SCHEDULE_EMAILS[topic](request_user, schedule)
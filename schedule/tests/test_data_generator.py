@@ -44,6 +44,7 @@ class TestScheduleListViewDataSetGenerator(TestCase):
         schedule.shift_types.add(baker.make(ShiftType, name='Shift Type 1'),
                                    baker.make(ShiftType, name='Shift Type 2'))
 
+        schedule = ScheduleListViewDataSetGenerator.get_export_queryset(Schedule.objects.all()).get()
         data_row = ScheduleListViewDataSetGenerator.get_instance_data_row(schedule)
         expected = [
             str(_('COLLECTING_PREFERENCE')),
@@ -75,6 +76,7 @@ class TestScheduleListViewDataSetGenerator(TestCase):
         schedule.shift_types.add(baker.make(ShiftType, name='Shift Type 1'),
                                    baker.make(ShiftType, name='Shift Type 2'))
 
+        schedule = ScheduleListViewDataSetGenerator.get_export_queryset(Schedule.objects.all()).get()
         data_row = ScheduleListViewDataSetGenerator.get_instance_data_row(schedule)
         expected = [
             str(_('REVIEWING_SCHEDULE')),
@@ -89,3 +91,26 @@ class TestScheduleListViewDataSetGenerator(TestCase):
         ]
 
         self.assertListEqual(data_row, expected)
+
+    def test_export_queries(self):
+        shift_types = baker.make(ShiftType, name=iter(['Night', 'Day', 'Evening']), _quantity=3)
+
+        def make_schedules(quantity):
+            for schedule in baker.make(Schedule, department=baker.make(Department), collect_preferences=False,
+                                       _quantity=quantity):
+                schedule.shift_types.add(*shift_types)
+
+        def export():
+            qs = ScheduleListViewDataSetGenerator.get_export_queryset(Schedule.objects.all())
+            return [ScheduleListViewDataSetGenerator.get_instance_data_row(instance) for instance in qs]
+
+        make_schedules(2)
+        # schedules with their department, then the shift types
+        with self.assertNumQueries(2):
+            self.assertEqual(len(export()), 2)
+
+        make_schedules(20)
+        with self.assertNumQueries(2):
+            rows = export()
+        self.assertEqual(len(rows), 22)
+        self.assertEqual(rows[-1][4], 'Day, Evening, Night')
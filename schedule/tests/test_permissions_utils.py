@@ -515,3 +515,43 @@ class TestPermissionUtils(TestCase):
 
         _schedule_for_staff.assert_called()
         _schedule_for_manager.assert_called()
+
+    def test_can_retrieve_schedule_queries(self):
+        company = baker.make(Company)
+        user = baker.make(Employee, department=baker.make(Department, company=company), company=company)
+        schedule = baker.make(Schedule, status=SCHEDULE_STATUS_CHOICES.PUBLISHED,
+                              department=baker.make(Department, company=company),
+                              end=timezone.now() + dt.timedelta(days=7))
+        baker.make(Shift, schedule=schedule).employees_allocated.add(user)
+
+        def roles(employee=False, staff=False, manager=False):
+            return (patch.object(user, 'is_employee', return_value=employee),
+                    patch.object(user, 'is_staff_', return_value=staff),
+                    patch.object(user, 'is_manager_admin_or_manager', return_value=manager))
+
+        # the allocation is read once for the request, whatever the branch asking for it
+        schedule = Schedule.objects.get(pk=schedule.pk)
+        with self.assertNumQueries(1):
+            for role in ({'employee': True}, {'staff': True}):
+                employee, staff, manager = roles(**role)
+                with employee, staff, manager:
+                    self.assertTrue(can_retrieve_schedule(user, schedule))
+                    self.assertTrue(can_retrieve_schedule(user, schedule))
+
+        employee, staff, manager = roles(manager=True)
+        with employee, staff, manager:
+            schedule = Schedule.objects.get(pk=schedule.pk)
+            with self.assertNumQueries(1):
+                self.assertTrue(can_retrieve_schedule(user, schedule))
+                self.assertTrue(can_retrieve_schedule(user, schedule))
+
+            # as loaded by the view, with its department
+            schedule = Schedule.objects.select_related('department').get(pk=schedule.pk)
+            with self.assertNumQueries(0):
+                self.assertTrue(can_retrieve_schedule(user, schedule))
+
+            # a new instance, as in the next request, reads again
+            schedule = Schedule.objects.get(pk=schedule.pk)
+            schedule.department_id = baker.make(Department).pk
+            with self.assertNumQueries(1):
+                self.assertFalse(can_retrieve_schedule(user, schedule))
@@ -1,7 +1,9 @@
 import collections
 import datetime as dt
+from io import StringIO
 from unittest.mock import patch, Mock
 
+from django.core.management import call_command
 from django.test import TestCase
 from django.utils import timezone
 from django.utils.translation import ugettext as _
@@ -283,6 +285,20 @@ class TestScheduleCreateSerializer(TestCase):
                     get_request_shifts.assert_called_once()
                     create_shift_type_snapshot.assert_called_once_with(data)
 
+    def test_create_schedule_overlap_constraint(self):
+        call_command('exclude_overlapping_schedules', stdout=StringIO())
+        department = baker.make(Department)
+        start = timezone.make_aware(dt.datetime(2021, 1, 1, 0, 0, 0))
+        end = timezone.make_aware(dt.datetime(2021, 3, 1, 0, 0, 0))
+        baker.make(Schedule, department=department, start=start, end=end)
+
+        data = dict(department=department, company=self.company, start=end, end=end + dt.timedelta(days=30),
+                    preferences_deadline=start, shift_types=[])
+        with self.assertRaises(ValidationError) as cm:
+            self.serializer.create_schedule(data)
+        self.assertEqual(cm.exception.detail, [_('AN_OVERLAPPING_SCHEDULE_ALREADY_EXIST_FOR_THIS_DEPARTMENT')])
+        self.assertEqual(Schedule.objects.count(), 1)
+
 
     def test_create_shift_type_snapshot(self):
         shift_type_1 = baker.make(ShiftType)
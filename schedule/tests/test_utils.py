@@ -26,7 +26,8 @@ from shift_type.models import ShiftType
 from account.models import Employee, Department
 from schedule.models import ScheduleFeedback, Schedule
 from schedule.utils import get_schedule_feedback_stats, add_employee_to_schedules_shift_types_training, \
-    send_email_on_collect_preferences_schedule, send_email_on_publish_schedule
+    send_email_on_collect_preferences_schedule, send_email_on_publish_schedule, get_columnar_events
+from shift.serializers import ShiftAsEventSerializer
 from shift_type.models import ShiftType
 
 
@@ -241,3 +242,39 @@ class TestGetScheduleFeedbackStats(TestCase):
         expected = dict(percentages=[41, 16, 25, 16, 0], average=3.8333333333333335)
 
         self.assertDictEqual(res, expected)
+
+
+class TestGetColumnarEvents(TestCase):
+
+    def test_get_columnar_events_matches_serializer(self):
+        schedule = baker.make(Schedule)
+        shift_types = [baker.make(ShiftType, name='T1'), baker.make(ShiftType, name='T2')]
+        employees = [baker.make(Employee, department=baker.make(Department)) for _i in range(3)]
+
+        shifts = [
+            baker.make(Shift, schedule=schedule, shift_type=shift_types[i % 2], employees_needed=i + 1,
+                       start=timezone.make_aware(dt.datetime(2020, 1, i + 1, 6, 0, 0)),
+                       end=timezone.make_aware(dt.datetime(2020, 1, i + 1, 14, 30, 0)))
+            for i in range(4)
+        ]
+        shifts[0].employees_allocated.add(*employees)
+        shifts[2].employees_allocated.add(employees[1])
+
+        qs = Shift.objects.filter(schedule=schedule).order_by('start', 'id')
+        columnar = get_columnar_events(qs)
+
+        # the columns decoded back into rows give what the serializer gives
+        rows = [
+            dict(id=columnar['id'][i],
+                 title=columnar['shift_types']['title'][columnar['shift_type'][i]],
+                 start=columnar['start'][i],
+                 end=columnar['end'][i],
+                 employees_needed=columnar['employees_needed'][i],
+                 employees_allocated=sorted(columnar['employees'][e] for e in columnar['employees_allocated'][i]),
+                 shift_type=columnar['shift_types']['id'][columnar['shift_type'][i]])
+            for i in range(len(columnar['id']))
+        ]
+        expected = [dict(event, employees_allocated=sorted(event['employees_allocated']))
+                    for event in ShiftAsEventSerializer(qs, many=True).data]
+        self.assertEqual(rows, expected)
+
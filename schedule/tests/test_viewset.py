@@ -1,14 +1,16 @@
 import collections
 import datetime as dt
 import random
+import uuid
 from operator import attrgetter
 from unittest.mock import patch, Mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from freezegun import freeze_time
 from model_bakery import baker
 
+from absence.outbox import relay_outbox
 from account.models import Employee, Department
 from account.tests.recipes import company_recipe, employee_recipe
 from account.tests.util import create_user_session
@@ -16,6 +18,9 @@ from constants.db import COMPANY_ROLE_CHOICES
 from constants.db import SCHEDULE_STATUS_CHOICES
 from schedule.models import Schedule, ScheduleFeedback
 from schedule.models import ScheduleTimestamp
+from schedule.renderers import ColumnarJSONRenderer
+from schedule.tasks import task_send_schedule_email
+from schedule.utils import SCHEDULE_PUBLISHED_TOPIC
 from schedule.viewsets import ScheduleViewSet, ScheduleFeedbackViewSet
 from shift.models import Shift
 from shift_type.models import ShiftType
@@ -40,8 +45,8 @@ class TestScheduleViewSet(TestCase):
             schedule_query_get_queryset = _schedule_query_set.return_value
             schedule_query_get_queryset.get_queryset.assert_called_once()
 
-    @patch('schedule.viewsets.task_collecting_preferences_tasks')
-    @patch('schedule.viewsets.send_email_on_collect_preferences_schedule')
+    @patch('schedule.receivers.task_collecting_preferences_tasks')
+    @patch('schedule.receivers.send_email_on_collect_preferences_schedule')
     def test_collect_preferences(self, _send_email_on_collect_preferences_schedule, task_collecting_preferences_tasks):
         schedule = baker.make(Schedule, status=SCHEDULE_STATUS_CHOICES.ENTERING_DETAILS, collect_preferences=True)
 
@@ -51,15 +56,21 @@ class TestScheduleViewSet(TestCase):
         with patch.object(self.viewset, 'get_object') as get_object:
             get_object.return_value = schedule
 
-            self.viewset.collect_preferences(request)
+            response = self.viewset.collect_preferences(request)
 
             self.assertEqual(SCHEDULE_STATUS_CHOICES.COLLECTING_PREFERENCE, Schedule.objects.get(pk=schedule.pk).status)
             self.assertEqual(ScheduleTimestamp.objects.count(), 1)
             self.assertEqual(ScheduleTimestamp.objects.first().schedule, schedule)
             self.assertEqual(ScheduleTimestamp.objects.first().status, SCHEDULE_STATUS_CHOICES.COLLECTING_PREFERENCE)
 
+            # nothing leaves the request, the outbox relay sends it
+            _send_email_on_collect_preferences_schedule.assert_not_called()
+            task_collecting_preferences_tasks.apply_async.assert_not_called()
+            self.assertEqual(relay_outbox()['handled'], 1)
+
             _send_email_on_collect_preferences_schedule.assert_called_once_with(self.user, schedule)
-            task_collecting_preferences_tasks.delay.assert_called_once_with(schedule.pk)
+            task_collecting_preferences_tasks.apply_async.assert_called_once_with(args=[schedule.pk],
+                                                                                  task_id=response.data['task_id'])
 
     def test_request_schedule(self):
         schedule = baker.make(Schedule, status=SCHEDULE_STATUS_CHOICES.ENTERING_DETAILS, collect_preferences=False)
@@ -98,9 +109,9 @@ class TestScheduleViewSet(TestCase):
             self.viewset.stop_collecting_preferences()
             self.assertEqual(schedule_2.status, SCHEDULE_STATUS_CHOICES.PRODUCING_SCHEDULE)
 
-    @patch('schedule.viewsets.task_publishing_tasks')
-    @patch('schedule.viewsets.send_email_on_publish_schedule')
-    def test_publish(self, _send_email_on_publish_schedule, task_publishing_tasks):
+    @patch('schedule.receivers.task_publishing_tasks')
+    @patch('schedule.receivers.task_send_schedule_email')
+    def test_publish(self, task_send_schedule_email, task_publishing_tasks):
         schedule = baker.make(Schedule, status=SCHEDULE_STATUS_CHOICES.REVIEWING_SCHEDULE)
 
         request = Mock()
@@ -109,15 +120,34 @@ class TestScheduleViewSet(TestCase):
         with patch.object(self.viewset, 'get_object') as get_object:
             get_object.return_value = schedule
 
-            self.viewset.publish(request)
+            response = self.viewset.publish(request)
 
             self.assertEqual(SCHEDULE_STATUS_CHOICES.PUBLISHED, Schedule.objects.get(pk=schedule.pk).status)
             self.assertEqual(ScheduleTimestamp.objects.count(), 1)
             self.assertEqual(ScheduleTimestamp.objects.first().schedule, schedule)
             self.assertEqual(ScheduleTimestamp.objects.first().status, SCHEDULE_STATUS_CHOICES.PUBLISHED)
 
-            _send_email_on_publish_schedule.assert_called_once_with(self.user, schedule)
-            task_publishing_tasks.delay.assert_called_once_with(schedule.pk)
+            task_send_schedule_email.apply_async.assert_not_called()
+            self.assertEqual(relay_outbox()['handled'], 1)
+
+            # the relay only enqueues, the emails are sent by the task
+            task_send_schedule_email.apply_async.assert_called_once()
+            self.assertEqual([str(arg) for arg in task_send_schedule_email.apply_async.call_args[1]['args']],
+                             [SCHEDULE_PUBLISHED_TOPIC, str(self.user.pk), str(schedule.pk)])
+            task_publishing_tasks.apply_async.assert_called_once_with(args=[schedule.pk],
+                                                                      task_id=response.data['task_id'])
+
+    def test_task_send_schedule_email(self):
+        schedule = baker.make(Schedule)
+        send_email_on_publish_schedule = Mock()
+
+        with patch.dict('schedule.tasks.SCHEDULE_EMAILS', {SCHEDULE_PUBLISHED_TOPIC: send_email_on_publish_schedule}):
+            task_send_schedule_email(SCHEDULE_PUBLISHED_TOPIC, self.user.pk, schedule.pk)
+            send_email_on_publish_schedule.assert_called_once_with(self.user, schedule)
+
+            # a schedule deleted in the meantime is skipped
+            task_send_schedule_email(SCHEDULE_PUBLISHED_TOPIC, self.user.pk, str(uuid.uuid4()))
+            send_email_on_publish_schedule.assert_called_once()
 
     @patch('schedule.viewsets.get_shift_queryset_for_schedule')
     def test_events(self, _queryset_for_schedule):
@@ -147,7 +177,7 @@ class TestScheduleViewSet(TestCase):
 
         _queryset_for_schedule.return_value = Shift.objects.filter(id__in=[shift_1.pk, shift_2.pk, shift_3.pk])
 
-        request = Mock()
+        request = Mock(method='GET', META={})
         request.user = self.user
         request.query_params = dict(start='2020-12-09', end='2020-12-16')
 
@@ -195,6 +225,132 @@ class TestScheduleViewSet(TestCase):
                 get_object.assert_called_once()
                 get_request_user.assert_called_once()
 
+    @patch('schedule.viewsets.get_shift_queryset_for_schedule')
+    def test_events_columnar(self, _queryset_for_schedule):
+        schedule = baker.make(Schedule)
+        shift_type_1 = baker.make(ShiftType, name='T1')
+        shift_type_2 = baker.make(ShiftType, name='T2')
+        employee_1 = baker.make(Employee, department=baker.make(Department))
+        employee_2 = baker.make(Employee, department=baker.make(Department))
+
+        shifts = [
+            baker.make(Shift, schedule=schedule, shift_type=shift_type, employees_needed=2,
+                       start=timezone.make_aware(dt.datetime(2020, 1, day, 6, 0, 0)),
+                       end=timezone.make_aware(dt.datetime(2020, 1, day, 14, 0, 0)))
+            for day, shift_type in ((1, shift_type_1), (2, shift_type_2), (3, shift_type_1))
+        ]
+        shifts[0].employees_allocated.add(employee_1, employee_2)
+        shifts[2].employees_allocated.add(employee_2)
+        _queryset_for_schedule.return_value = Shift.objects.filter(schedule=schedule)
+
+        request = Mock(method='GET', META={}, accepted_renderer=ColumnarJSONRenderer())
+        request.query_params = dict(start='2020-01-01', end='2020-01-03')
+
+        with patch.object(self.viewset, 'get_object', return_value=schedule):
+            with patch.object(self.viewset, 'get_request_user', return_value=self.user):
+                with self.assertNumQueries(3):
+                    res = self.viewset.events(request).data
+
+        self.assertEqual(res['id'], [str(shift.pk) for shift in shifts])
+        self.assertEqual(res['start'], ['2020-01-01T06:00:00Z', '2020-01-02T06:00:00Z', '2020-01-03T06:00:00Z'])
+        self.assertEqual(res['employees_needed'], [2, 2, 2])
+        self.assertEqual(res['shift_type'], [0, 1, 0])
+        self.assertEqual(res['shift_types'], {'id': [shift_type_1.pk, shift_type_2.pk], 'title': ['T1', 'T2']})
+        self.assertEqual(sorted(res['employees']), sorted([employee_1.pk, employee_2.pk]))
+        self.assertEqual([[res['employees'][i] for i in row] for row in res['employees_allocated']][1:],
+                         [[], [employee_2.pk]])
+        self.assertTrue(ColumnarJSONRenderer().render(res).startswith(b'{'))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    @patch('schedule.viewsets.get_shift_queryset_for_schedule')
+    def test_events_cache(self, _queryset_for_schedule):
+        schedule = baker.make(Schedule)
+        shift = baker.make(Shift, schedule=schedule, start=timezone.make_aware(dt.datetime(2020, 12, 10, 6, 0, 0)),
+                           end=timezone.make_aware(dt.datetime(2020, 12, 10, 14, 0, 0)))
+        _queryset_for_schedule.return_value = Shift.objects.filter(schedule=schedule)
+
+        request = Mock(method='GET', META={})
+        request.query_params = dict(start='2020-12-09', end='2020-12-16')
+
+        with patch.object(self.viewset, 'get_object', side_effect=lambda: Schedule.objects.get(pk=schedule.pk)):
+            with patch.object(self.viewset, 'get_request_user', return_value=self.user):
+                self.assertEqual(self.viewset.events(request).data[0]['employees_allocated'], [])
+
+                with patch('schedule.viewsets.ShiftAsEventSerializer') as serializer:
+                    self.viewset.events(request)
+                    serializer.assert_not_called()
+
+                version = Schedule.objects.get(pk=schedule.pk).version
+                shift.employees_allocated.add(self.user)
+                self.assertEqual(Schedule.objects.get(pk=schedule.pk).version, version + 1)
+                self.assertEqual(self.viewset.events(request).data[0]['employees_allocated'], [self.user.pk])
+
+                # bulk_create sends no signal and leaves the version alone
+                version = Schedule.objects.get(pk=schedule.pk).version
+                Shift.objects.bulk_create([baker.prepare(Shift, schedule=schedule, _save_related=True,
+                                                         start=timezone.make_aware(dt.datetime(2020, 12, 11, 6)),
+                                                         end=timezone.make_aware(dt.datetime(2020, 12, 11, 14)))])
+                self.assertEqual(Schedule.objects.get(pk=schedule.pk).version, version)
+                self.assertEqual(len(self.viewset.events(request).data), 2)
+
+    def test_schedule_save_bumps_version(self):
+        schedule = baker.make(Schedule)
+        self.assertEqual(Schedule.objects.get(pk=schedule.pk).version, 0)
+
+        schedule.comment = 'changed'
+        schedule.save()
+
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.version, 1)
+        self.assertEqual(schedule.comment, 'changed')
+
+    @patch('schedule.viewsets.get_shift_queryset_for_schedule')
+    def test_events_etag_follows_allocations(self, _queryset_for_schedule):
+        schedule = baker.make(Schedule)
+        shift = baker.make(Shift, schedule=schedule, start=timezone.make_aware(dt.datetime(2020, 12, 10, 6, 0, 0)),
+                           end=timezone.make_aware(dt.datetime(2020, 12, 10, 14, 0, 0)))
+        _queryset_for_schedule.return_value = Shift.objects.filter(schedule=schedule)
+
+        request = Mock(method='GET', META={})
+        request.query_params = dict(start='2020-12-09', end='2020-12-16')
+
+        with patch.object(self.viewset, 'get_object', side_effect=lambda: Schedule.objects.get(pk=schedule.pk)):
+            with patch.object(self.viewset, 'get_request_user', return_value=self.user):
+                etag = self.viewset.events(request)['ETag']
+
+                # neither the shift nor the schedule row is saved
+                shift.employees_allocated.add(self.user)
+
+                request.META = {'HTTP_IF_NONE_MATCH': etag}
+                res = self.viewset.events(request)
+                self.assertEqual(res.status_code, 200)
+                self.assertNotEqual(res['ETag'], etag)
+                self.assertEqual(res.data[0]['employees_allocated'], [self.user.pk])
+
+    @patch('schedule.viewsets.get_shift_queryset_for_schedule')
+    def test_events_not_modified(self, _queryset_for_schedule):
+        schedule = baker.make(Schedule)
+        shift = baker.make(Shift, schedule=schedule, start=timezone.make_aware(dt.datetime(2020, 12, 10, 6, 0, 0)),
+                           end=timezone.make_aware(dt.datetime(2020, 12, 10, 14, 0, 0)))
+        _queryset_for_schedule.return_value = Shift.objects.filter(schedule=schedule)
+
+        request = Mock(method='GET', META={})
+        request.query_params = dict(start='2020-12-09', end='2020-12-16')
+
+        with patch.object(self.viewset, 'get_object', return_value=schedule):
+            with patch.object(self.viewset, 'get_request_user', return_value=self.user):
+                res = self.viewset.events(request)
+                self.assertEqual(res.status_code, 200)
+
+                request.META = {'HTTP_IF_NONE_MATCH': res['ETag']}
+                with self.assertNumQueries(1):
+                    res = self.viewset.events(request)
+                self.assertEqual(res.status_code, 304)
+
+                shift.save()
+                res = self.viewset.events(request)
+                self.assertEqual(res.status_code, 200)
+
 
 
 
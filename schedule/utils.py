@@ -1,12 +1,19 @@
 import datetime as dt
+import hashlib
 import math
+import uuid
 
 import pytz
+from django.core.cache import cache
+from django.db.models import Max, Count, F
 from django.utils import timezone
+from django.utils.http import quote_etag
 
+from absence.outbox import enqueue_outbox_message
 from account.utils import send_welcome_email
 from schedule.emails import CollectPreferencesEmail, SchedulePublishedEmail
 from schedule.models import Schedule
+from shift.models import Shift
 from shift_type.models import ShiftType
 
 
@@ -62,7 +69,104 @@ def send_email_on_publish_schedule(request_user, schedule):
     published_email.send()
 
 
+SCHEDULE_PUBLISHED_TOPIC = 'schedule.published'
+SCHEDULE_COLLECTING_PREFERENCES_TOPIC = 'schedule.collecting_preferences'
+
+
+def enqueue_schedule_tasks(topic, request_user, schedule):
+    """
+    Leave the Celery task and the emails of the schedule to the outbox relay. The id of the
+    task is chosen now so that the response can still return it.
+    """
+    task_id = str(uuid.uuid4())
+    enqueue_outbox_message(topic, dict(schedule_id=schedule.pk, user_id=request_user.pk, task_id=task_id),
+                           idempotency_key=f'{topic}:{task_id}')
+    return task_id
+
+
 def adjust_schedule_timezone(date, time, user_timezone):
     tz = pytz.timezone(user_timezone)
     return tz.localize(dt.datetime.combine(date, time)).astimezone(pytz.utc)
 
+
+EVENTS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def bump_schedule_version(schedule_ids):
+    Schedule.objects.filter(pk__in=schedule_ids).update(version=F('version') + 1)
+
+
+def get_events_scope(user):
+    # managers see every shift of a schedule, what the others see may depend on who they are
+    if user.is_manager_admin_or_manager():
+        return 'managers'
+    return f'employee:{user.pk}'
+
+
+def get_events_cache_key(user, schedule, start, end, stats, variant=''):
+    """
+    With the modification time, a stale instance saving an older counter back cannot reuse a key. The
+    shift stats of the fingerprint cover shifts written by bulk_create() or update(), which send no signal.
+    """
+    return (f'schedule_events:{schedule.pk}:{schedule.version}:{schedule.modified.timestamp()}:'
+            f'{stats["last_modified"] and stats["last_modified"].timestamp()}:{stats["count"]}:'
+            f'{get_events_scope(user)}:{start:%Y%m%d}:{end:%Y%m%d}:{variant}')
+
+
+def get_cached_events(key, build):
+    """Events cached until the schedule version moves on; old versions are left to the cache's LRU eviction."""
+    events = cache.get(key)
+    if events is None:
+        events = build()
+        cache.set(key, events, EVENTS_CACHE_TIMEOUT)
+    return events
+
+
+def get_events_fingerprint(user, schedule, shifts, variant=''):
+    """
+    ETag and last modification of the events of a schedule, from one aggregate over the shifts.
+    The aggregate is returned as well, for the cache key of the events.
+    """
+    stats = shifts.order_by().aggregate(last_modified=Max('modified'), count=Count('id'))
+    last_modified = max(d for d in (schedule.modified, stats['last_modified']) if d is not None)
+
+    # allocations only move the version of the schedule
+    key = f'{user.pk}:{schedule.pk}:{schedule.version}:{last_modified.isoformat()}:{stats["count"]}:{variant}'
+    return quote_etag(hashlib.md5(key.encode()).hexdigest()), last_modified, stats
+
+
+def format_event_datetime(value):
+    # same output as the DateTimeField of ShiftAsEventSerializer
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def get_columnar_events(shifts):
+    """
+    Shift events as parallel arrays. Shift types and allocated employees are dictionary
+    encoded: the rows hold indexes into the shift_types and employees lists.
+    """
+    rows = list(shifts.order_by('start', 'id').values_list('id', 'start', 'end', 'employees_needed',
+                                                           'shift_type_id', 'shift_type__name').distinct())
+    allocations = Shift.employees_allocated.through.objects.filter(shift_id__in=[row[0] for row in rows])
+
+    shift_types, employees = {}, {}
+    allocated = {row[0]: [] for row in rows}
+    for shift_id, employee_id in allocations.values_list('shift_id', 'employee_id').iterator():
+        allocated[shift_id].append(employees.setdefault(employee_id, len(employees)))
+
+    for row in rows:
+        shift_types.setdefault(row[4], (len(shift_types), row[5]))
+
+    return {
+        'id': [str(row[0]) for row in rows],
+        'start': [format_event_datetime(row[1]) for row in rows],
+        'end': [format_event_datetime(row[2]) for row in rows],
+        'employees_needed': [row[3] for row in rows],
+        'shift_type': [shift_types[row[4]][0] for row in rows],
+        'employees_allocated': [allocated[row[0]] for row in rows],
+        'shift_types': {'id': list(shift_types), 'title': [title for _index, title in shift_types.values()]},
+        'employees': list(employees),
+    }
@@ -5,15 +5,14 @@ from django.db import transaction
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, mixins, status, decorators, permissions
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from absence.conditional import get_not_modified_response, set_conditional_headers
+from absence.mixins import ExportJobMixin
 from account.models import Employee
 from conf.settings import ENVIRONMENT
 from constants.db import SCHEDULE_STATUS_CHOICES
 from core.mixins import GetSerializerMixin, QuerySetMixin, ExportMixin
-from core.tasks.schedule import (
-    task_collecting_preferences_tasks,
-    task_publishing_tasks
-)
 from history.mixins import ModelHistoryMixin
 from r_api.utils import delete_task_to_optimization_management
 from schedule.filters import ScheduleListFilter
@@ -22,12 +21,14 @@ from schedule.models import ScheduleFeedback
 from schedule.modules.dataset_generator import ScheduleListViewDataSetGenerator
 from schedule.permissions import SchedulePermission
 from schedule.query import ScheduleQuerySet
+from schedule.renderers import ColumnarJSONRenderer
 from schedule.serializers import (
     ScheduleListSerializer, ScheduleFeedbackListSerializer, ScheduleRetrieveSerializer,
     ScheduleCreateSerializer,
     ScheduleFeedbackCreateSerializer)
-from schedule.utils import get_schedule_feedback_stats, send_email_on_collect_preferences_schedule, \
-    send_email_on_publish_schedule
+from schedule.utils import get_schedule_feedback_stats, enqueue_schedule_tasks, SCHEDULE_PUBLISHED_TOPIC, \
+    SCHEDULE_COLLECTING_PREFERENCES_TOPIC, get_events_fingerprint, get_columnar_events, \
+    get_events_cache_key, get_cached_events
 from shift.models import Shift
 from shift.serializers import ShiftAsEventSerializer
 from shift.utils import get_shift_queryset_for_schedule
@@ -39,6 +40,7 @@ logger = logging.getLogger(__name__)
 class ScheduleViewSet(
     GetSerializerMixin,
     ExportMixin,
+    ExportJobMixin,
     ModelHistoryMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
@@ -71,15 +73,14 @@ class ScheduleViewSet(
     def collect_preferences(self, request, *_args, **_kwargs):
         instance = self.get_object()
 
-        instance.status = SCHEDULE_STATUS_CHOICES.COLLECTING_PREFERENCE
-        instance.save()
-
-        instance.make_timestamp()
-        task = task_collecting_preferences_tasks.delay(instance.pk)
+        with transaction.atomic():
+            instance.status = SCHEDULE_STATUS_CHOICES.COLLECTING_PREFERENCE
+            instance.save()
 
-        send_email_on_collect_preferences_schedule(request.user, instance)
+            instance.make_timestamp()
+            task_id = enqueue_schedule_tasks(SCHEDULE_COLLECTING_PREFERENCES_TOPIC, request.user, instance)
 
-        return Response({'task_id': task.task_id}, status=status.HTTP_202_ACCEPTED)
+        return Response({'task_id': task_id}, status=status.HTTP_202_ACCEPTED)
 
     @decorators.action(detail=True, methods=['post'])
     def request_schedule(self, _request, *_args, **_kwargs):
@@ -95,15 +96,14 @@ class ScheduleViewSet(
     def publish(self, request, *_args, **_kwargs):
         instance = self.get_object()
 
-        instance.status = SCHEDULE_STATUS_CHOICES.PUBLISHED
-        instance.save()
-
-        instance.make_timestamp()
-        task = task_publishing_tasks.delay(instance.pk)
+        with transaction.atomic():
+            instance.status = SCHEDULE_STATUS_CHOICES.PUBLISHED
+            instance.save()
 
-        send_email_on_publish_schedule(request.user, instance)
+            instance.make_timestamp()
+            task_id = enqueue_schedule_tasks(SCHEDULE_PUBLISHED_TOPIC, request.user, instance)
 
-        return Response({'task_id': task.task_id}, status=status.HTTP_202_ACCEPTED)
+        return Response({'task_id': task_id}, status=status.HTTP_202_ACCEPTED)
 
     @decorators.action(detail=True, methods=['put'])
     def stop_collecting_preferences(self, *_args, **_kwargs):
@@ -117,7 +117,8 @@ class ScheduleViewSet(
     def export(self, *_args, **_kwargs):
         return self.export_data()
 
-    @decorators.action(methods=['get'], detail=True)
+    @decorators.action(methods=['get'], detail=True,
+                       renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer])
     def events(self, request, *_args, **_kwargs):
         schedule = self.get_object()
         start = request.query_params.get('start')
@@ -129,8 +130,18 @@ class ScheduleViewSet(
         user = self.get_request_user()
         qs = get_shift_queryset_for_schedule(user, schedule, start, end)
 
-        serializer = ShiftAsEventSerializer(qs, many=True)
-        return Response(serializer.data)
+        columnar = isinstance(getattr(request, 'accepted_renderer', None), ColumnarJSONRenderer)
+        variant = 'columnar' if columnar else ''
+        etag, last_modified, stats = get_events_fingerprint(user, schedule, qs, variant)
+        response = get_not_modified_response(request, etag, last_modified)
+        if response is None:
+            key = get_events_cache_key(user, schedule, start, end, stats, variant)
+            if columnar:
+                events = get_cached_events(key, lambda: get_columnar_events(qs))
+            else:
+                events = get_cached_events(key, lambda: ShiftAsEventSerializer(qs, many=True).data)
+            response = Response(events)
+        return set_conditional_headers(response, etag, last_modified)
 
     def perform_destroy(self, instance):
         delete_task_to_optimization_management(instance.id)